@@ -1,368 +1,1127 @@
-#!/usr/bin/python
-
-# Library for PiMotor Shield V2
-# Developed by: SB Components
-# Project: RPi Motor Shield
-
-import RPi.GPIO as GPIO                        #Import GPIO library
-import time, logging
-from time import sleep
-GPIO.setmode(GPIO.BOARD)                       #Set GPIO pin numbering
-
-GPIO.setwarnings(False)
-
-class Motor:
-    """ Class to handle interaction with the motor pins
-    Supports redefinition of "forward" and "backward" depending on how motors are connected
-    Use the supplied Motorshieldtest module to test the correct configuration for your project.
-
-    Arguments:
-    motor = string motor pin label (i.e. "MOTOR1","MOTOR2","MOTOR3","MOTOR4") identifying the pins to which
-            the motor is connected.
-    config = int defining which pins control "forward" and "backward" movement.
-    """
-    motorpins = {"MOTOR4":{"config":{1:{"e":32,"f":24,"r":26},2:{"e":32,"f":26,"r":24}},"arrow":1},
-                 "MOTOR3":{"config":{1:{"e":19,"f":21,"r":23},2:{"e":19,"f":23,"r":21}}, "arrow":2},
-                 "MOTOR2":{"config":{1:{"e":22,"f":16,"r":18},2:{"e":22,"f":18,"r":16}}, "arrow":3},
-                 "MOTOR1":{"config":{1:{"e":11,"f":15,"r":13},2:{"e":11,"f":13,"r":15}},"arrow":4}}
-
-    def __init__(self, motor, config):
-        self.testMode = False
-        self.arrow = Arrow(self.motorpins[motor]["arrow"])
-        self.pins = self.motorpins[motor]["config"][config]
-        GPIO.setup(self.pins['e'],GPIO.OUT)
-        GPIO.setup(self.pins['f'],GPIO.OUT)
-        GPIO.setup(self.pins['r'],GPIO.OUT)
-        self.PWM = GPIO.PWM(self.pins['e'], 50)  # 50Hz frequency
-        self.PWM.start(0)
-        GPIO.output(self.pins['e'],GPIO.HIGH)
-        GPIO.output(self.pins['f'],GPIO.LOW)
-        GPIO.output(self.pins['r'],GPIO.LOW)
-
-    def test(self, state):
-        """ Puts the motor into test mode
-        When in test mode the Arrow associated with the motor receives power on "forward"
-        rather than the motor. Useful when testing your code.
-
-        Arguments:
-        state = boolean
-        """
-        self.testMode = state
-
-    def forward(self, speed):
-        """ Starts the motor turning in its configured "forward" direction.
-
-        Arguments:
-        speed = Duty Cycle Percentage from 0 to 100.
-        0 - stop and 100 - maximum speed
-        """
-        print("Forward")
-        if self.testMode:
-            self.arrow.on()
-        else:
-            self.PWM.ChangeDutyCycle(speed)
-            GPIO.output(self.pins['f'],GPIO.HIGH)
-            GPIO.output(self.pins['r'],GPIO.LOW)
-
-    def reverse(self,speed):
-        """ Starts the motor turning in its configured "reverse" direction.
-
-        Arguments:
-        speed = Duty Cycle Percentage from 0 to 100.
-        0 - stop and 100 - maximum speed
-     """
-        print("Reverse")
-        if self.testMode:
-            self.arrow.off()
-        else:
-            self.PWM.ChangeDutyCycle(speed)
-            GPIO.output(self.pins['f'],GPIO.LOW)
-            GPIO.output(self.pins['r'],GPIO.HIGH)
-
-    def stop(self):
-        """ Stops power to the motor,
-     """
-        print("Stop")
-        self.arrow.off()
-        self.PWM.ChangeDutyCycle(0)
-        GPIO.output(self.pins['f'],GPIO.LOW)
-        GPIO.output(self.pins['r'],GPIO.LOW)
-
-    def speed(self):
-        """ Control Speed of Motor,
-     """
-
-class LinkedMotors:
-    """ Links 2 or more motors together as a set.
-
-        This allows a single command to be used to control a linked set of motors
-        e.g. For a 4x wheel vehicle this allows a single command to make all 4 wheels go forward.
-        Starts the motor turning in its configured "forward" direction.
-
-        Arguments:
-        *motors = a list of Motor objects
-     """
-    def __init__(self, *motors):
-        self.motor = []
-        for i in motors:
-            print(i.pins)
-            self.motor.append(i)
-
-    def forward(self,speed):
-        """ Starts the motor turning in its configured "forward" direction.
-
-        Arguments:
-        speed = Duty Cycle Percentage from 0 to 100.
-        0 - stop and 100 - maximum speed
-     """
-        for i in range(len(self.motor)):
-            self.motor[i].forward(speed)
-
-    def reverse(self,speed):
-        """ Starts the motor turning in its configured "reverse" direction.
-
-        Arguments:
-        speed = Duty Cycle Percentage from 0 to 100.
-        0 - stop and 100 - maximum speed
-     """
-        for i in range(len(self.motor)):
-            self.motor[i].reverse(speed)
-
-    def stop(self):
-        """ Stops power to the motor,
-     """
-        for i in range(len(self.motor)):
-            self.motor[i].stop()
-
-class Stepper:
-    """ 
-    Defines stepper motor class to control bipolar and unipolar
-    stepper motors.
-
-    Arguments:
-    motor = stepper motor pin configuration.
-            values can be STEPPER1 or STEPPER2.  This corresponds to the
-            ports on the motor shield itself.
-    """
-
-    """
-    Pin configuration for Rapsberry Pi GPIO to Motor Shield stepper motor interface
-    """
-    stepperpins = {"STEPPER1":{"en1":11, "en2":22, "c1":13,"c2":15, "c3":18, "c4":16},
-                   "STEPPER2":{"en1":19, "en2":32, "c1":21,"c2":23, "c3":24, "c4":26}}
-
-    """
-    Least torque, most efficient.
-    Commonly referred to as wave drive or single step.
-    """
-    single_mode = [[1, 0, 0, 0],
-                   [0, 1, 0, 0],
-                   [0, 0, 1, 0],
-                   [0, 0, 0, 1]]
-    """
-    Most torque, least efficient.
-    Commonly referred to as full step
-    """
-    double_mode = [[1, 0, 1, 0],
-                   [0, 1, 1, 0],
-                   [0, 1, 0, 1],
-                   [1, 0, 0, 1]]
-    """
-    Good blend of strength and efficiency. Doubles step resolution, therefore increasing accuracy
-    and can reduce slippage on high load operations.
-    If you had a 1.8 deg stepper at 200 steps per revolution and you choose half
-    step mode, then you have 0.9 deg stepper at 400 steps per revolution.
-    """
-    half_mode = [[1, 0, 0, 0],
-                 [1, 0, 1, 0],
-                 [0, 0, 1, 0],
-                 [0, 1, 1, 0],
-                 [0, 1, 0, 0],
-                 [0, 1, 0, 1],
-                 [0, 0, 0, 1],
-                 [1, 0, 0, 1]]
-
-    """
-    Default the mode to single
-    """
-    mode = single_mode
-
-    def __init__(self, motor):
-        self.config = self.stepperpins[motor]
-        GPIO.setup(self.config["en1"],GPIO.OUT)
-        GPIO.setup(self.config["en2"],GPIO.OUT)
-        GPIO.setup(self.config["c1"],GPIO.OUT)
-        GPIO.setup(self.config["c2"],GPIO.OUT)
-        GPIO.setup(self.config["c3"],GPIO.OUT)
-        GPIO.setup(self.config["c4"],GPIO.OUT)
-
-        GPIO.output(self.config["en1"],GPIO.HIGH)
-        GPIO.output(self.config["en2"],GPIO.HIGH)
-        GPIO.output(self.config["c1"],GPIO.LOW)
-        GPIO.output(self.config["c2"],GPIO.LOW)
-        GPIO.output(self.config["c3"],GPIO.LOW)
-        GPIO.output(self.config["c4"],GPIO.LOW)
-
-    def setMode(self, mode):
-        """
-        mode: str -- values can be half, double or full every other value defaults to single.
-        Sets the sequence in which the coils will fire.
-        """
-        if(mode == "double" or mode == "full"):
-            self.mode = self.double_mode
-        elif(mode == "half"):
-            self.mode = self.half_mode
-        else:
-            self.mode = self.single_mode
-    
-
-    def setStep(self, w1, w2, w3, w4):
-        """ 
-        Energize the stepper motor's coils in sequence to create motion.
-        Avoid energizing both sides of the same coil.
-
-        Arguments:
-        w1,w2,w3,w4 = Wire of Stepper Motor
-        """
-        if(w1 > 0 and w2 > 0 or w3 > 0 and w4 > 0):
-            logging.warn("cross coil interference")
-
-        GPIO.output(self.config["c1"], w1)
-        GPIO.output(self.config["c2"], w2)
-        GPIO.output(self.config["c3"], w3)
-        GPIO.output(self.config["c4"], w4)
-
-    def forward(self, delay, steps):
-        """ 
-        Rotate Stepper motor in forward direction
-
-        Arguments:
-        delay: 
-            float - value for seconds between steps, typically value is less than 1.
-            lambda - send a lambda that will be executed each iteration and sent the current step and total step count, 
-            the lambda must then return a float value that will be used as the delay for that step.  
-            This allows for acceleration and deceleration during a sequence of steps.
-
-        steps: int - Number of Steps
-        """
-        seq_len = len(self.mode)
-        for index in range(steps):
-            if(index > 0 and callable(delay)): time.sleep(delay(index, steps))
-            elif(index > 0): time.sleep(delay)
-            self.setStep(*self.mode[index % seq_len])
-
-
-    def backward(self, delay, steps):
-        """ 
-        Rotate Stepper motor in opposite direction
-
-        Arguments:
-        delay: 
-            float - value for seconds between steps, typically value is less than 1.
-            lambda - send a lambda that will be executed each iteration and sent the current step and total step count, 
-            the lambda must then return a float value that will be used as the delay for that step.  
-            This allows for acceleration and deceleration during a sequence of steps.
-
-        steps: int - Number of Steps
-        """
-        seq_len = len(self.mode)
-        for index in range(steps):
-            if(index > 0 and callable(delay)): time.sleep(delay(index, steps))
-            elif(index > 0): time.sleep(delay)
-            self.setStep(*reversed(self.mode[index % seq_len]))
-    
-    
-    def stop(self):
-        """ 
-        Stops power to the motor,
-        """
-        self.setStep(0, 0, 0, 0)
-
-    def cleanup(self):
-        """
-        Convienence function so other packages don't have to import GPIO just 
-        to execute cleanup
-        """
-        GPIO.cleanup()
-
-class Sensor:
-    """ Defines a sensor connected to the sensor pins on the MotorShield
-
-        Arguments:
-        sensortype = string identifying which sensor is being configured.
-            i.e. "IR1", "IR2", "ULTRASONIC"
-        boundary = an integer specifying the minimum distance at which the sensor
-            will return a Triggered response of True.
-    """
-    Triggered = False
-    def iRCheck(self):
-        input_state = GPIO.input(self.config["echo"])
-        if input_state == True:
-            print("Sensor 2: Object Detected")
-            self.Triggered = True
-        else:
-            self.Triggered = False
-
-    def sonicCheck(self):
-        print("SonicCheck has been triggered")
-        time.sleep(0.333)
-        GPIO.output(self.config["trigger"], True)
-        time.sleep(0.00001)
-        GPIO.output(self.config["trigger"], False)
-        start = time.time()
-        while GPIO.input(self.config["echo"])==0:
-            start = time.time()
-        while GPIO.input(self.config["echo"])==1:
-            stop = time.time()
-        elapsed = stop-start
-        measure = (elapsed * 34300)/2
-        self.lastRead = measure
-        if self.boundary > measure:
-            print("Boundary breached")
-            print(self.boundary)
-            print(measure)
-            self.Triggered = True
-        else:
-            self.Triggered = False
-
-    sensorpins = {"IR1":{"echo":7, "check":iRCheck}, "IR2":{"echo":12, "check":iRCheck},
-                  "ULTRASONIC":{"trigger":29, "echo": 31, "check":sonicCheck}}
-
-    def trigger(self):
-        """ Executes the relevant routine that activates and takes a reading from the specified sensor.
-
-        If the specified "boundary" has been breached the Sensor's Triggered attribute gets set to True.
-    """
-        self.config["check"](self)
-        print("Trigger Called")
-
-    def __init__(self, sensortype, boundary):
-        self.config = self.sensorpins[sensortype]
-        self.boundary = boundary
-        self.lastRead = 0
-        if "trigger" in self.config:
-            print("trigger")
-            GPIO.setup(self.config["trigger"],GPIO.OUT)
-        GPIO.setup(self.config["echo"],GPIO.IN)
-
-class Arrow():
-    """ Defines an object for controlling one of the LED arrows on the Motorshield.
-
-        Arguments:
-        which = integer label for each arrow. The arrow number if arbitrary starting with:
-            1 = Arrow closest to the Motorshield's power pins and running clockwise round the board
-            ...
-            4 = Arrow closest to the motor pins.
-    """
-    arrowpins={1:33,2:35,3:37,4:36}
-
-    def __init__(self, which):
-        self.pin = self.arrowpins[which]
-        GPIO.setup(self.pin,GPIO.OUT)
-        GPIO.output(self.pin, GPIO.LOW)
-
-    def on(self):
-        GPIO.output(self.pin,GPIO.HIGH)
-
-    def off(self):
-        GPIO.output(self.pin,GPIO.LOW)
\ No newline at end of file
+#!/usr/bin/python
+
+# Library for PiMotor Shield V2
+# Developed by: SB Components
+# Project: RPi Motor Shield
+
+import time, queue, contextlib, math, threading
+from time import sleep
+from backend import get_backend                #GPIO access goes through the installed backend
+from timing import StepClock
+import waveform
+from sensing import RingBuffer, Ranger
+from telemetry import events, DEBUG, INFO, WARNING
+import ramp
+
+class Motor:
+    """ Class to handle interaction with the motor pins
+    Supports redefinition of "forward" and "backward" depending on how motors are connected
+    Use the supplied Motorshieldtest module to test the correct configuration for your project.
+
+    Arguments:
+    motor = string motor pin label (i.e. "MOTOR1","MOTOR2","MOTOR3","MOTOR4") identifying the pins to which
+            the motor is connected.
+    config = int defining which pins control "forward" and "backward" movement.
+    backend = optional GPIO backend, defaults to backend.get_backend().
+    arrow = optional Arrow to light in test mode, by default the motor creates its own.
+
+    Attributes:
+    current = float, signed duty cycle being applied, negative when turning in reverse.
+    """
+    motorpins = {"MOTOR4":{"config":{1:{"e":32,"f":24,"r":26},2:{"e":32,"f":26,"r":24}},"arrow":1},
+                 "MOTOR3":{"config":{1:{"e":19,"f":21,"r":23},2:{"e":19,"f":23,"r":21}}, "arrow":2},
+                 "MOTOR2":{"config":{1:{"e":22,"f":16,"r":18},2:{"e":22,"f":18,"r":16}}, "arrow":3},
+                 "MOTOR1":{"config":{1:{"e":11,"f":15,"r":13},2:{"e":11,"f":13,"r":15}},"arrow":4}}
+
+    def __init__(self, motor, config, backend=None, arrow=None):
+        self.gpio = backend or get_backend()
+        self.testMode = False
+        self.current = 0.0
+        self.arrow = arrow or Arrow(self.motorpins[motor]["arrow"], self.gpio)
+        self.pins = self.motorpins[motor]["config"][config]
+        self.gpio.setup(self.pins['e'],self.gpio.OUT)
+        self.gpio.setup(self.pins['f'],self.gpio.OUT)
+        self.gpio.setup(self.pins['r'],self.gpio.OUT)
+        self.PWM = self.gpio.PWM(self.pins['e'], 50)  # 50Hz frequency
+        self.PWM.start(0)
+        self.gpio.output(self.pins['e'],self.gpio.HIGH)
+        self.gpio.output(self.pins['f'],self.gpio.LOW)
+        self.gpio.output(self.pins['r'],self.gpio.LOW)
+
+    def test(self, state):
+        """ Puts the motor into test mode
+        When in test mode the Arrow associated with the motor receives power on "forward"
+        rather than the motor. Useful when testing your code.
+
+        Arguments:
+        state = boolean
+        """
+        self.testMode = state
+
+    def forward(self, speed):
+        """ Starts the motor turning in its configured "forward" direction.
+
+        Arguments:
+        speed = Duty Cycle Percentage from 0 to 100.
+        0 - stop and 100 - maximum speed
+        """
+        if events.info:
+            events.emit(INFO, "motor.forward", pins=self.pins, speed=speed)
+        ramp.get_engine().cancel(self)
+        self.current = speed
+        if self.testMode:
+            self.arrow.on()
+        else:
+            with self.gpio.lock:
+                self.PWM.ChangeDutyCycle(speed)
+                self.gpio.output(self.pins['f'],self.gpio.HIGH)
+                self.gpio.output(self.pins['r'],self.gpio.LOW)
+
+    def reverse(self,speed):
+        """ Starts the motor turning in its configured "reverse" direction.
+
+        Arguments:
+        speed = Duty Cycle Percentage from 0 to 100.
+        0 - stop and 100 - maximum speed
+     """
+        if events.info:
+            events.emit(INFO, "motor.reverse", pins=self.pins, speed=speed)
+        ramp.get_engine().cancel(self)
+        self.current = -speed
+        if self.testMode:
+            self.arrow.off()
+        else:
+            with self.gpio.lock:
+                self.PWM.ChangeDutyCycle(speed)
+                self.gpio.output(self.pins['f'],self.gpio.LOW)
+                self.gpio.output(self.pins['r'],self.gpio.HIGH)
+
+    def stop(self):
+        """ Stops power to the motor,
+     """
+        if events.info:
+            events.emit(INFO, "motor.stop", pins=self.pins)
+        ramp.get_engine().cancel(self)
+        self.current = 0.0
+        with self.gpio.lock:
+            self.arrow.off()
+            self.PWM.ChangeDutyCycle(0)
+            self.gpio.output(self.pins['f'],self.gpio.LOW)
+            self.gpio.output(self.pins['r'],self.gpio.LOW)
+
+    def speed(self, speed, rate=200.0, done=None):
+        """ Ramps the motor to a new speed without blocking.
+        The shared ramp.RampEngine thread changes the duty cycle by at most `rate` percent per
+        second; reversing ramps down through zero first.  forward, reverse and stop cancel the ramp.
+
+        Arguments:
+        speed = signed Duty Cycle Percentage from -100 to 100, negative values turn in "reverse".
+        rate = float maximum change in duty cycle percentage per second.
+        done = optional callable(motor, reached), called once the ramp is over, see ramp.RampEngine.start.
+        """
+        if events.info:
+            events.emit(INFO, "motor.speed", pins=self.pins, speed=speed, rate=rate)
+        ramp.get_engine().start(self, speed, rate, done)
+
+    def drive(self, speed):
+        """ Applies a signed duty cycle immediately, used by the ramp engine.
+
+        Arguments:
+        speed = signed Duty Cycle Percentage from -100 to 100.
+        """
+        self.current = speed
+        duty, pins, values = self.command(speed)
+        with self.gpio.lock:
+            if duty is not None:
+                self.PWM.ChangeDutyCycle(duty)
+            self.gpio.outputs(pins, values)
+
+    def command(self, speed):
+        """ Works out the writes that put the motor at a signed speed without applying them.
+        Returns (duty, pins, values), duty being None when the duty cycle is left alone (test mode).
+
+        Arguments:
+        speed = signed Duty Cycle Percentage from -100 to 100.
+        """
+        low, high = self.gpio.LOW, self.gpio.HIGH
+        if speed == 0:
+            return 0, (self.arrow.pin, self.pins['f'], self.pins['r']), (low, low, low)
+        if self.testMode:
+            return None, (self.arrow.pin,), (high if speed > 0 else low,)
+        return abs(speed), (self.pins['f'], self.pins['r']), \
+            (high, low) if speed > 0 else (low, high)
+
+class LinkedMotors:
+    """ Links 2 or more motors together as a set.
+
+        This allows a single command to be used to control a linked set of motors
+        e.g. For a 4x wheel vehicle this allows a single command to make all 4 wheels go forward.
+        Starts the motor turning in its configured "forward" direction.
+
+        Arguments:
+        *motors = a list of Motor objects
+     """
+    def __init__(self, *motors):
+        self.motor = []
+        for i in motors:
+            if events.debug:
+                events.emit(DEBUG, "linkedmotors.link", pins=i.pins)
+            self.motor.append(i)
+        self.skew = 0.0
+        self.maxSkew = 0.0
+
+    def forward(self,speed):
+        """ Starts the motor turning in its configured "forward" direction.
+
+        Arguments:
+        speed = Duty Cycle Percentage from 0 to 100.
+        0 - stop and 100 - maximum speed
+     """
+        self.drive(speed)
+
+    def reverse(self,speed):
+        """ Starts the motor turning in its configured "reverse" direction.
+
+        Arguments:
+        speed = Duty Cycle Percentage from 0 to 100.
+        0 - stop and 100 - maximum speed
+     """
+        self.drive(-speed)
+
+    def stop(self):
+        """ Stops power to the motor,
+     """
+        self.drive(0)
+
+    def drive(self, *speeds):
+        """ Sets every motor of the group in one go.
+        All duty cycle and pin changes are worked out first, then applied back to back with the
+        pin changes of each backend in a single batched write, so the wheels switch together.
+        The time taken by the write phase is kept in skew and maxSkew (seconds).
+
+        Arguments:
+        *speeds = one signed Duty Cycle Percentage from -100 to 100 for the whole group,
+                  or one per motor.  Negative values turn in "reverse".
+        """
+        if len(speeds) == 1:
+            speeds = speeds * len(self.motor)
+        elif len(speeds) != len(self.motor):
+            raise ValueError("expected 1 or %d speeds, got %d" % (len(self.motor), len(speeds)))
+        engine = ramp.get_engine()
+        duties = []
+        writes = {}
+        for motor, speed in zip(self.motor, speeds):
+            engine.cancel(motor)
+            motor.current = speed
+            duty, pins, values = motor.command(speed)
+            if duty is not None:
+                duties.append((motor.PWM, duty))
+            batch = writes.setdefault(motor.gpio, ([], []))
+            batch[0].extend(pins)
+            batch[1].extend(values)
+        with contextlib.ExitStack() as stack:
+            for gpio in writes:
+                stack.enter_context(gpio.lock)
+            start = time.perf_counter_ns()
+            for pwm, duty in duties:
+                pwm.ChangeDutyCycle(duty)
+            for gpio, (pins, values) in writes.items():
+                gpio.outputs(pins, values)
+            end = time.perf_counter_ns()
+        self.skew = (end - start) / 1e9
+        if self.skew > self.maxSkew:
+            self.maxSkew = self.skew
+        if events.debug:
+            events.emit(DEBUG, "linkedmotors.drive", speeds=speeds, skew=self.skew)
+
+class Stepper:
+    """ 
+    Defines stepper motor class to control bipolar and unipolar
+    stepper motors.
+
+    Arguments:
+    motor = stepper motor pin configuration.
+            values can be STEPPER1 or STEPPER2.  This corresponds to the
+            ports on the motor shield itself.
+    backend = optional GPIO backend, defaults to backend.get_backend().
+
+    Attributes:
+    phase = int index into forwardPhases of the phase the coils were last left in, None before
+            the first move.  Every move carries on from it, so no move starts with a phase jump.
+            While microstepping it indexes the microstep table instead.
+    halfSteps = absolute position in half steps, see position.  Fractional while microstepping.
+    resolution = int microsteps per full step, 0 unless setMode("micro") is in use.
+    """
+
+    """
+    Pin configuration for Rapsberry Pi GPIO to Motor Shield stepper motor interface
+    """
+    stepperpins = {"STEPPER1":{"en1":11, "en2":22, "c1":13,"c2":15, "c3":18, "c4":16},
+                   "STEPPER2":{"en1":19, "en2":32, "c1":21,"c2":23, "c3":24, "c4":26}}
+
+    """
+    Least torque, most efficient.
+    Commonly referred to as wave drive or single step.
+    """
+    single_mode = [[1, 0, 0, 0],
+                   [0, 1, 0, 0],
+                   [0, 0, 1, 0],
+                   [0, 0, 0, 1]]
+    """
+    Most torque, least efficient.
+    Commonly referred to as full step
+    """
+    double_mode = [[1, 0, 1, 0],
+                   [0, 1, 1, 0],
+                   [0, 1, 0, 1],
+                   [1, 0, 0, 1]]
+    """
+    Good blend of strength and efficiency. Doubles step resolution, therefore increasing accuracy
+    and can reduce slippage on high load operations.
+    If you had a 1.8 deg stepper at 200 steps per revolution and you choose half
+    step mode, then you have 0.9 deg stepper at 400 steps per revolution.
+    """
+    half_mode = [[1, 0, 0, 0],
+                 [1, 0, 1, 0],
+                 [0, 0, 1, 0],
+                 [0, 1, 1, 0],
+                 [0, 1, 0, 0],
+                 [0, 1, 0, 1],
+                 [0, 0, 0, 1],
+                 [1, 0, 0, 1]]
+
+    """
+    Default the mode to single
+    """
+    mode = single_mode
+
+    """
+    Microstep tables by resolution, see microTable, and the PWM frequency used on en1 and en2
+    while microstepping.
+    """
+    microTables = {}
+    microFrequency = 2000
+
+    def __init__(self, motor, backend=None):
+        self.gpio = backend or get_backend()
+        self.config = self.stepperpins[motor]
+        self.gpio.setup(self.config["en1"],self.gpio.OUT)
+        self.gpio.setup(self.config["en2"],self.gpio.OUT)
+        self.gpio.setup(self.config["c1"],self.gpio.OUT)
+        self.gpio.setup(self.config["c2"],self.gpio.OUT)
+        self.gpio.setup(self.config["c3"],self.gpio.OUT)
+        self.gpio.setup(self.config["c4"],self.gpio.OUT)
+
+        self.gpio.output(self.config["en1"],self.gpio.HIGH)
+        self.gpio.output(self.config["en2"],self.gpio.HIGH)
+        self.gpio.output(self.config["c1"],self.gpio.LOW)
+        self.gpio.output(self.config["c2"],self.gpio.LOW)
+        self.gpio.output(self.config["c3"],self.gpio.LOW)
+        self.gpio.output(self.config["c4"],self.gpio.LOW)
+        self.clock = StepClock()
+        self.coils = (self.config["c1"], self.config["c2"], self.config["c3"], self.config["c4"])
+        self.coilState = 0
+        self.stats = None
+        self.phase = None
+        self.halfSteps = 0
+        self.resolution = 0
+        self.enable = None
+        self.transitions = self.compileTransitions(self.coils)
+        self.compileMode()
+
+    def setMode(self, mode, resolution=8):
+        """
+        mode: str -- values can be half, double, full or micro every other value defaults to single.
+        resolution: int -- microsteps per full step in micro mode, 4, 8 or 16.
+        Sets the sequence in which the coils will fire.
+
+        micro mode sequences the coil pins like half mode while modulating en1 and en2 with PWM,
+        so the current in the two coils follows a cosine and a sine and each full step is split
+        into resolution smaller ones.  Motion is smoother and resonance sets in at a higher speed,
+        at the cost of holding torque between the full steps.
+        """
+        if events.info:
+            events.emit(INFO, "stepper.mode", coils=self.coils, mode=mode, resolution=resolution)
+        previous = None if self.phase is None else self.phaseAngle(self.phase)
+        if mode == "micro":
+            if resolution not in (4, 8, 16):
+                raise ValueError("microstep resolution must be 4, 8 or 16, not %r" % (resolution,))
+            self.resolution = resolution
+            self.compileMicro()
+        else:
+            if(mode == "double" or mode == "full"):
+                self.mode = self.double_mode
+            elif(mode == "half"):
+                self.mode = self.half_mode
+            else:
+                self.mode = self.single_mode
+            self.resolution = 0
+            self.compileMode()
+            if self.enable is not None:
+                # Fully on is the same as the enable pins driven HIGH.
+                with self.gpio.lock:
+                    for pwm in self.enable:
+                        pwm.ChangeDutyCycle(100)
+        if previous is not None:
+            self.phase = self.nearestPhase(previous)
+
+    def phaseAngle(self, phase):
+        """
+        Returns the electrical angle of a phase of the current mode in half steps, 0 to 8.
+        """
+        if self.resolution:
+            return phase * 2.0 / self.resolution
+        angles = [self.phaseMask(row) for row in self.half_mode]
+        mask = self.forwardPhases[phase]
+        return angles.index(mask) if mask in angles else 0
+
+    def nearestPhase(self, angle):
+        """
+        Returns the index of the phase of the current mode electrically closest to an angle
+        measured in half steps around the half_mode sequence, see phaseAngle.
+        """
+        if self.resolution:
+            return int(round(angle * self.resolution / 2.0)) % len(self.micro)
+        distances = [min((self.phaseAngle(index) - angle) % 8, (angle - self.phaseAngle(index)) % 8)
+                     for index in range(len(self.forwardPhases))]
+        return distances.index(min(distances))
+
+    @property
+    def position(self):
+        """
+        Absolute position in steps of the current mode, counted from where the stepper started or
+        was last set.  Kept in half steps internally so it survives setMode: 1 full step = 2 half steps.
+        """
+        return int(self.halfSteps // self.unit)
+
+    @position.setter
+    def position(self, steps):
+        self.halfSteps = steps * self.unit
+
+    def move_to(self, position, delay):
+        """
+        Moves to an absolute position.
+
+        Arguments:
+        position: int -- target position in steps of the current mode, see position.
+        delay: float, lambda or easy.DelayProfile, see forward.
+
+        Returns what forward or backward returned, None when already there.
+        """
+        steps = position - self.position
+        if steps > 0:
+            return self.forward(delay, steps)
+        if steps < 0:
+            return self.backward(delay, -steps)
+        return None
+
+    def phaseOrder(self, phases):
+        """
+        Rotates forwardPhases or backwardPhases so the sequence starts at the phase after the one
+        the coils were left in.  Both step through the same ring of phases, backward in the opposite
+        order.  Returns (phases, direction), direction being 1, -1 or 0 for any other phase array,
+        which is used as given.
+        """
+        ring = self.forwardPhases
+        if phases == ring:
+            step = 1
+        elif phases == self.backwardPhases:
+            step = -1
+        else:
+            return phases, 0
+        count = len(ring)
+        start = ring.index(phases[0]) if self.phase is None else (self.phase + step) % count
+        return tuple(ring[(start + step * index) % count] for index in range(count)), step
+
+    def track(self, phases, step, taken):
+        """
+        Records where a move of taken steps through the phases returned by phaseOrder left the rotor.
+        """
+        if taken:
+            self.phase = self.phaseIndex.get(phases[(taken - 1) % len(phases)], self.phase)
+            self.halfSteps += step * taken * self.unit
+
+    @staticmethod
+    def phaseMask(row):
+        """
+        Encodes a row of a mode table as a bitmask, bit 0 being wire c1.
+        """
+        return sum(1 << wire for wire, value in enumerate(row) if value)
+
+    @staticmethod
+    def compileTransitions(coils):
+        """
+        Builds the table of writes needed to move the coils from one phase mask to another.
+        Entry (previous << 4 | next) holds the (pins, values) that differ between the two
+        phases, or None when nothing changes, so a step only pushes the lines that move.
+        """
+        transitions = []
+        for previous in range(16):
+            for following in range(16):
+                changed = previous ^ following
+                pins = tuple(pin for wire, pin in enumerate(coils) if changed >> wire & 1)
+                values = tuple(following >> wire & 1 for wire in range(4) if changed >> wire & 1)
+                transitions.append((pins, values) if pins else None)
+        return tuple(transitions)
+
+    def compileMode(self):
+        """
+        Compiles the selected mode table into the phase arrays used by forward and backward.
+        Each phase is stored as a coil bitmask, backward phases carry the wires in reverse order.
+        The cross coil check runs here, once per table, so the stepping loop only has to write pins.
+        """
+        for w1, w2, w3, w4 in self.mode:
+            if(w1 > 0 and w2 > 0 or w3 > 0 and w4 > 0):
+                if events.warning:
+                    events.emit(WARNING, "stepper.cross_coil", coils=self.coils, row=(w1, w2, w3, w4))
+                break
+        self.forwardPhases = tuple(self.phaseMask(row) for row in self.mode)
+        self.backwardPhases = tuple(self.phaseMask(reversed(row)) for row in self.mode)
+        self.phaseIndex = {mask: index for index, mask in enumerate(self.forwardPhases)}
+        # Half steps per step of the mode.
+        self.unit = 1 if len(self.forwardPhases) == 8 else 2
+
+    def compileMicro(self):
+        """
+        Selects the microstep table of the current resolution and starts PWM on en1 and en2,
+        once per stepper.  forwardPhases and backwardPhases hold the coil masks of the table
+        in the two directions, so callers telling the directions apart keep working.
+        """
+        self.micro = self.microTable(self.resolution)
+        self.forwardPhases = tuple(mask for mask, a, b in self.micro)
+        self.backwardPhases = self.forwardPhases[::-1]
+        self.phaseIndex = {}
+        # Powers of two, so the fractional half steps add up exactly.
+        self.unit = 2.0 / self.resolution
+        if self.enable is None:
+            with self.gpio.lock:
+                self.enable = (self.gpio.PWM(self.config["en1"], self.microFrequency),
+                               self.gpio.PWM(self.config["en2"], self.microFrequency))
+                for pwm in self.enable:
+                    pwm.start(100)
+
+    @classmethod
+    def microTable(cls, resolution):
+        """
+        Returns the microstep table of a resolution, computed on first use and shared by every
+        stepper.  Entry k is the (mask, dutyA, dutyB) of electrical angle k * 90 / resolution
+        degrees: the coil bitmask giving the direction of the current in coil A (c1/c2) and
+        coil B (c3/c4), and the duty cycles for en1 and en2, |cos| and |sin| of the angle.
+        Entry k * resolution / 2 is the phase of half_mode row k.
+        """
+        table = cls.microTables.get(resolution)
+        if table is None:
+            rows = []
+            for index in range(4 * resolution):
+                angle = index * math.pi / (2 * resolution)
+                a = round(math.cos(angle), 9)
+                b = round(math.sin(angle), 9)
+                mask = (a > 0) | (a < 0) << 1 | (b > 0) << 2 | (b < 0) << 3
+                rows.append((mask, round(abs(a) * 100, 3), round(abs(b) * 100, 3)))
+            table = cls.microTables[resolution] = tuple(rows)
+        return table
+
+    def requireTable(self, what):
+        if self.resolution:
+            raise ValueError("%s needs a single, double or half mode table, not microstepping" % what)
+
+    def setSpinThreshold(self, seconds):
+        """
+        seconds: float -- how long before each step deadline the timing loop stops sleeping and
+        busy-waits instead.  Raise it if short delays are still being overshot, lower it to save CPU.
+        """
+        self.clock.spin = seconds
+
+    def collectTiming(self, capacity=4096):
+        """
+        capacity: int -- steps to preallocate for.  Records how late every step fired against its
+        planned time; forward and backward then return a timing.StepStats (achieved rate, mean, p99
+        and max jitter, drift and a histogram), also kept in self.stats.  Cheap enough to leave on,
+        0 switches it off again.
+        """
+        self.clock.collect(capacity)
+
+    def setStep(self, w1, w2, w3, w4):
+        """ 
+        Energize the stepper motor's coils in sequence to create motion.
+        Avoid energizing both sides of the same coil.
+
+        Arguments:
+        w1,w2,w3,w4 = Wire of Stepper Motor
+        """
+        if(w1 > 0 and w2 > 0 or w3 > 0 and w4 > 0):
+            if events.warning:
+                events.emit(WARNING, "stepper.cross_coil", coils=self.coils, row=(w1, w2, w3, w4))
+
+        mask = self.phaseMask((w1, w2, w3, w4))
+        with self.gpio.lock:
+            change = self.transitions[self.coilState << 4 | mask]
+            if change:
+                self.gpio.outputs(*change)
+            self.coilState = mask
+
+    def forward(self, delay, steps):
+        """ 
+        Rotate Stepper motor in forward direction
+
+        Arguments:
+        delay: 
+            float - value for seconds between steps, typically value is less than 1.
+            lambda - send a lambda that will be executed each iteration and sent the current step and total step count, 
+            the lambda must then return a float value that will be used as the delay for that step.  
+            This allows for acceleration and deceleration during a sequence of steps.
+
+        steps: int - Number of Steps
+
+        Steps are scheduled against absolute deadlines, so time spent energizing the coils is not
+        added on top of the delay.  After the move self.clock.drift holds how late the final step was.
+        Returns the move's timing.StepStats when collectTiming is on, else None.
+        """
+        if events.info:
+            events.emit(INFO, "stepper.forward", coils=self.coils, delay=delay, steps=steps)
+        self.run(self.forwardPhases, delay, steps)
+        return self.stats
+
+
+    def backward(self, delay, steps):
+        """ 
+        Rotate Stepper motor in opposite direction
+
+        Arguments:
+        delay: 
+            float - value for seconds between steps, typically value is less than 1.
+            lambda - send a lambda that will be executed each iteration and sent the current step and total step count, 
+            the lambda must then return a float value that will be used as the delay for that step.  
+            This allows for acceleration and deceleration during a sequence of steps.
+
+        steps: int - Number of Steps
+
+        Returns the move's timing.StepStats when collectTiming is on, else None.
+        """
+        if events.info:
+            events.emit(INFO, "stepper.backward", coils=self.coils, delay=delay, steps=steps)
+        self.run(self.backwardPhases, delay, steps)
+        return self.stats
+
+    def run(self, phases, delay, steps, move=None):
+        """
+        Steps through a compiled phase array, see forward for the delay and steps arguments.
+
+        move: optional executor.MoveHandle -- its completed count is advanced after every step
+              and the loop stops early once its cancel() has been called.  Its stats are set
+              like self.stats once the move is over.
+
+        Returns the number of steps taken.
+        """
+        if self.resolution:
+            return self.runMicro(1 if phases == self.forwardPhases else -1, delay, steps, move)
+        phases, direction = self.phaseOrder(phases)
+        lock = self.gpio.lock
+        outputs = self.gpio.outputs
+        transitions = self.transitions
+        wait = self.clock.wait
+        # Compiled profiles (easy.DelayProfile) expose their delays, index them directly.
+        # A profile shorter than the move is called instead, it holds its last delay.
+        table = getattr(delay, "delays", None)
+        if table is not None and len(table) < steps:
+            table = None
+        timed = callable(delay)
+        seq_len = len(phases)
+        phase = 0
+        state = self.coilState
+        taken = 0
+        self.clock.start(steps)
+        try:
+            for index in range(steps):
+                if move is not None and move.cancelRequested:
+                    break
+                if index > 0:
+                    if table is not None:
+                        wait(table[index])
+                    else:
+                        wait(delay(index, steps) if timed else delay)
+                mask = phases[phase]
+                change = transitions[state << 4 | mask]
+                if change:
+                    with lock:
+                        outputs(*change)
+                state = mask
+                taken += 1
+                if move is not None:
+                    move.completed += 1
+                phase += 1
+                if phase == seq_len:
+                    phase = 0
+        finally:
+            self.coilState = state
+            self.track(phases, direction, taken)
+            self.finishMove(taken, move, direction, delay)
+        return taken
+
+    def runMicro(self, direction, delay, steps, move=None):
+        """
+        Microstepping version of run: every step moves one entry through the microstep table,
+        changing the en1 and en2 duty cycles and writing the coil pins whose direction flips.
+        direction is 1 for forward and -1 for backward.
+        """
+        lock = self.gpio.lock
+        outputs = self.gpio.outputs
+        transitions = self.transitions
+        wait = self.clock.wait
+        micro = self.micro
+        count = len(micro)
+        enableA, enableB = self.enable
+        table = getattr(delay, "delays", None)
+        if table is not None and len(table) < steps:
+            table = None
+        timed = callable(delay)
+        phase = 0 if self.phase is None else (self.phase + direction) % count
+        state = self.coilState
+        taken = 0
+        self.clock.start(steps)
+        try:
+            for index in range(steps):
+                if move is not None and move.cancelRequested:
+                    break
+                if index > 0:
+                    if table is not None:
+                        wait(table[index])
+                    else:
+                        wait(delay(index, steps) if timed else delay)
+                mask, dutyA, dutyB = micro[phase]
+                change = transitions[state << 4 | mask]
+                with lock:
+                    enableA.ChangeDutyCycle(dutyA)
+                    enableB.ChangeDutyCycle(dutyB)
+                    if change:
+                        outputs(*change)
+                state = mask
+                taken += 1
+                if move is not None:
+                    move.completed += 1
+                phase = (phase + direction) % count
+        finally:
+            self.coilState = state
+            if taken:
+                self.phase = (phase - direction) % count
+                self.halfSteps += direction * taken * self.unit
+            self.finishMove(taken, move, direction, delay)
+        return taken
+
+    def play(self, stream, move=None):
+        """
+        Plays a precomputed stream of steps in a single pass, without restarting the timing
+        loop between moves.
+
+        Arguments:
+        stream: iterable of (mask, delay) pairs -- mask is the coil bitmask to energize (see
+                phaseMask) and delay the seconds since the previous step.  The delay of the
+                first pair is ignored.
+        move: optional executor.MoveHandle, see run.
+
+        The phase is picked up from the last mask played.  The stream carries no direction, so
+        the caller accounts for the position, see MotionPlanner.execute and
+        EasyStepperSequence.play.
+
+        Returns the number of steps taken.
+        """
+        self.requireTable("play")
+        lock = self.gpio.lock
+        outputs = self.gpio.outputs
+        transitions = self.transitions
+        wait = self.clock.wait
+        state = self.coilState
+        taken = 0
+        self.clock.start()
+        try:
+            for mask, delay in stream:
+                if move is not None and move.cancelRequested:
+                    break
+                if taken:
+                    wait(delay)
+                change = transitions[state << 4 | mask]
+                if change:
+                    with lock:
+                        outputs(*change)
+                state = mask
+                taken += 1
+                if move is not None:
+                    move.completed += 1
+        finally:
+            self.coilState = state
+            self.phase = self.phaseIndex.get(state, self.phase)
+            self.finishMove(taken, move)
+        return taken
+
+    def finishMove(self, taken, move, direction=0, delay=None):
+        # direction is 1, -1 or 0 for a stream without one, delay None for a stream.
+        self.stats = stats = self.clock.stats()
+        if move is not None:
+            move.stats = stats
+        if events.debug:
+            events.emit(DEBUG, "stepper.move", coils=self.coils, direction=direction, delay=delay, steps=taken,
+                        drift=self.clock.drift, resets=self.clock.resets,
+                        jitter=stats.p99 if stats is not None else None)
+
+    def compileWaveform(self, delay, steps, direction="forward", capacity=4096):
+        """
+        Compiles a whole move into a waveform.WaveformChain that playWaveform plays back in one call.
+
+        Arguments:
+        delay: float, lambda or easy.DelayProfile, see forward.
+        steps: int - Number of Steps
+        direction: str -- "forward" or "backward".
+        capacity: int -- steps per buffer, longer moves are split into chained buffers.
+        """
+        self.requireTable("compileWaveform")
+        phases, step = self.phaseOrder(self.backwardPhases if direction == "backward" else self.forwardPhases)
+        chain = waveform.compileMove(phases, delay, steps, capacity)
+        chain.displacement = step * steps
+        return chain
+
+    def playWaveform(self, chain):
+        """
+        Plays a compiled waveform on the coils through the backend's pulse engine.
+        The waveform carries on from the phase the stepper was in when it was compiled, so play it
+        before moving the stepper any other way.
+        Returns the number of steps played.
+        """
+        self.coilState = self.gpio.play_waveform(self.coils, chain, self.coilState, self.transitions, self.clock)
+        self.phase = self.phaseIndex.get(self.coilState, self.phase)
+        self.halfSteps += chain.displacement * self.unit
+        return len(chain)
+
+    def stop(self):
+        """ 
+        Stops power to the motor,
+        """
+        if events.info:
+            events.emit(INFO, "stepper.stop", coils=self.coils)
+        self.setStep(0, 0, 0, 0)
+
+    def cleanup(self):
+        """
+        Convienence function so other packages don't have to import GPIO just 
+        to execute cleanup
+        """
+        self.gpio.cleanup()
+
+class LinkedSteppers:
+    """ Links STEPPER1 and STEPPER2 together for coordinated moves.
+
+        Both steppers are driven from one timing loop, with their steps interleaved using
+        Bresenham (DDA) interpolation so the axes start and finish together.
+        e.g. For an X/Y gantry this moves diagonally instead of one axis after the other.
+
+        Arguments:
+        *steppers = a list of Stepper objects sharing the same backend.
+     """
+    def __init__(self, *steppers):
+        self.stepper = list(steppers)
+        self.gpio = steppers[0].gpio
+        self.clock = StepClock()
+
+    def move(self, delay, *steps):
+        """ Moves every linked stepper by its own number of steps at the same time.
+
+        Arguments:
+        delay:
+            float - minimum seconds between two steps of any axis.
+            list - minimum seconds between steps for each stepper.  The move runs at the
+                   highest rate that keeps every axis's two closest steps that far apart.
+            lambda - called with the current tick and total tick count like Stepper.forward,
+                     returns the seconds until the next tick.
+        *steps = int per linked stepper, negative values run that stepper backward.
+
+        Returns the number of ticks taken, the step count of the longest axis.
+        """
+        if events.info:
+            events.emit(INFO, "linkedsteppers.move", delay=delay, steps=steps)
+        counts = [abs(count) for count in steps]
+        major = max(counts) if counts else 0
+        if major == 0:
+            return 0
+        if isinstance(delay, (list, tuple)):
+            # An axis of n steps out of major ticks steps at most every major // n ticks.
+            delay = max(d / (major // n) for d, n in zip(delay, counts) if n)
+        axes = []
+        for stepper, count in zip(self.stepper, steps):
+            stepper.requireTable("LinkedSteppers.move")
+            phases, step = stepper.phaseOrder(stepper.forwardPhases if count >= 0 else stepper.backwardPhases)
+            axes.append([stepper.transitions, phases, abs(count), major // 2, 0, stepper.coilState, step, 0])
+        lock = self.gpio.lock
+        outputs = self.gpio.outputs
+        wait = self.clock.wait
+        timed = callable(delay)
+        self.clock.start()
+        try:
+            for index in range(major):
+                if index > 0:
+                    wait(delay(index, major) if timed else delay)
+                pins = ()
+                values = ()
+                for axis in axes:
+                    transitions, phases, count, error, phase, state, step, taken = axis
+                    error -= count
+                    if error < 0:
+                        error += major
+                        mask = phases[phase]
+                        change = transitions[state << 4 | mask]
+                        if change:
+                            pins += change[0]
+                            values += change[1]
+                        axis[5] = mask
+                        axis[7] = taken + 1
+                        phase += 1
+                        axis[4] = 0 if phase == len(phases) else phase
+                    axis[3] = error
+                if pins:
+                    with lock:
+                        outputs(pins, values)
+        finally:
+            for stepper, axis in zip(self.stepper, axes):
+                stepper.coilState = axis[5]
+                stepper.track(axis[1], axis[6], axis[7])
+        return major
+
+    def stop(self):
+        """ Stops power to every linked stepper.
+     """
+        for i in range(len(self.stepper)):
+            self.stepper[i].stop()
+
+class Sensor:
+    """ Defines a sensor connected to the sensor pins on the MotorShield
+
+        Arguments:
+        sensortype = string identifying which sensor is being configured.
+            i.e. "IR1", "IR2", "ULTRASONIC"
+        boundary = an integer specifying the minimum distance at which the sensor
+            will return a Triggered response of True.
+        backend = optional GPIO backend, defaults to backend.get_backend().
+        history = number of ultrasonic readings kept in the history ring buffer.
+    """
+    Triggered = False
+    def iRCheck(self):
+        input_state = self.gpio.input(self.config["echo"])
+        if input_state == True:
+            if events.info:
+                events.emit(INFO, "sensor.detected", pin=self.config["echo"])
+            self.Triggered = True
+        else:
+            self.Triggered = False
+
+    def watch(self, edge="both", callback=None, debounce=0.005, eventQueue=None):
+        """ Reports IR sensor edges as they happen instead of waiting for trigger() to poll.
+
+        Arguments:
+        edge = "rising" (object detected), "falling" (object gone) or "both".
+        callback = optional function called as callback(sensor, detected, stamp) from the
+            interrupt thread, stamp being the perf_counter_ns time of the edge.
+        debounce = float seconds after an edge during which further edges are ignored.
+        eventQueue = optional queue.Queue that receives a (detected, stamp) tuple per edge.
+
+        Triggered is updated on every reported edge, so watch "both" edges to keep it in step
+        with the sensor.  Returns the events queue, a new one is created when neither a callback
+        nor a queue is given.
+    """
+        edges = {"rising": self.gpio.RISING, "falling": self.gpio.FALLING, "both": self.gpio.BOTH}
+        if callback is None and eventQueue is None:
+            eventQueue = queue.Queue()
+        pin = self.config["echo"]
+
+        def handler(channel):
+            stamp = time.perf_counter_ns()
+            detected = bool(self.gpio.input(channel))
+            self.Triggered = detected
+            if callback is not None:
+                callback(self, detected, stamp)
+            if eventQueue is not None:
+                eventQueue.put((detected, stamp))
+
+        self.unwatch()
+        self.gpio.add_event_detect(pin, edges[edge], handler, int(debounce * 1000))
+        self.watching = True
+        return eventQueue
+
+    def unwatch(self):
+        """ Stops edge reporting started by watch. """
+        if self.watching:
+            self.gpio.remove_event_detect(self.config["echo"])
+            self.watching = False
+
+    def sonicCheck(self):
+        wait = self.lastPing + self.interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self.record(self.ping())
+
+    def ping(self, timeout=None):
+        """ Sends a single ultrasonic pulse and returns the measured distance in cm.
+        Does not update lastRead or Triggered, see record.
+
+        The echo is timed from interrupts: both of its edges are stamped with perf_counter_ns by
+        an edge callback armed once, before the first ping, so nothing is re-armed between the
+        edges and the calling thread sleeps instead of polling.  The whole echo is waited for
+        at most timeout seconds (default self.timeout), so a missed echo returns None instead
+        of hanging.
+    """
+        if timeout is None:
+            timeout = self.timeout
+        if not self.echoArmed:
+            self.armEcho()
+        edges = self.edges
+        del edges[:]
+        self.echoed.clear()
+        with self.gpio.lock:
+            self.gpio.output(self.config["trigger"], True)
+            time.sleep(0.00001)
+            # Edges before this belong to an echo that was already given up on.
+            self.fired = time.perf_counter_ns()
+            self.gpio.output(self.config["trigger"], False)
+        self.lastPing = time.monotonic()
+        if not self.echoed.wait(timeout):
+            return None
+        rise, fall = edges[0], edges[1]
+        return (fall - rise) * 34300 / 2e9
+
+    def armEcho(self):
+        """ Starts stamping the edges of the ultrasonic echo pin, see ping. """
+        edges = self.edges
+        echoed = self.echoed
+        stamp = self.gpio.edge_time
+
+        def handler(channel):
+            at = stamp(channel)
+            if at >= self.fired and len(edges) < 2:
+                edges.append(at)
+                if len(edges) == 2:
+                    echoed.set()
+
+        self.gpio.add_event_detect(self.config["echo"], self.gpio.BOTH, handler)
+        self.echoArmed = True
+
+    def record(self, measure):
+        """ Stores an ultrasonic measurement and sets Triggered if the boundary has been breached.
+        With a filter set (see setFilter) the boundary is checked against the filtered value,
+        which is kept in self.filtered.  lastRead always holds the raw measurement.
+        A missed echo (None) counts as nothing within range and leaves lastRead unchanged.  With a
+        filter set, an obstacle the filter has confirmed is only cleared once a filter window of
+        echoes in a row has been missed.
+    """
+        if measure is None:
+            self.missed += 1
+            self.missStreak += 1
+            if self.filter is None or self.missStreak >= self.filter.window:
+                self.Triggered = False
+            return
+        self.missStreak = 0
+        self.history.push(measure)
+        self.lastRead = measure
+        if self.filter is not None:
+            measure = self.filter.update(self.history)
+        self.filtered = measure
+        if self.boundary > measure:
+            if events.info:
+                events.emit(INFO, "sensor.breached", boundary=self.boundary, measure=measure)
+            self.Triggered = True
+        else:
+            self.Triggered = False
+
+    def setFilter(self, pipeline):
+        """ Filters ultrasonic readings before the boundary check.
+
+        Arguments:
+        pipeline = filters.FilterPipeline, or None to use raw readings.
+    """
+        if pipeline is not None:
+            pipeline.reset()
+        self.filter = pipeline
+
+    def startRanging(self, rate=15.0):
+        """ Starts pinging the ultrasonic sensor from a background thread.
+
+        Arguments:
+        rate = float readings per second.
+
+        While ranging, trigger() returns the latest reading instantly instead of pinging.
+    """
+        self.stopRanging()
+        self.ranger = Ranger(self, rate).start()
+
+    def stopRanging(self):
+        """ Stops background ranging started by startRanging. """
+        if self.ranger is not None:
+            self.ranger.stop()
+            self.ranger = None
+
+    sensorpins = {"IR1":{"echo":7, "check":iRCheck}, "IR2":{"echo":12, "check":iRCheck},
+                  "ULTRASONIC":{"trigger":29, "echo": 31, "check":sonicCheck}}
+
+    def trigger(self):
+        """ Executes the relevant routine that activates and takes a reading from the specified sensor.
+
+        If the specified "boundary" has been breached the Sensor's Triggered attribute gets set to True.
+        While background ranging is running the latest reading is used without pinging again.
+        Returns the Triggered state.
+    """
+        if self.ranger is None:
+            self.config["check"](self)
+        if events.debug:
+            events.emit(DEBUG, "sensor.trigger", pin=self.config["echo"], triggered=self.Triggered)
+        return self.Triggered
+
+    def __init__(self, sensortype, boundary, backend=None, history=64):
+        self.gpio = backend or get_backend()
+        self.config = self.sensorpins[sensortype]
+        self.boundary = boundary
+        self.lastRead = 0
+        self.timeout = 0.03
+        self.interval = 0.06
+        self.lastPing = 0.0
+        self.missed = 0
+        self.missStreak = 0
+        self.edges = []
+        self.echoed = threading.Event()
+        self.echoArmed = False
+        self.fired = 0
+        self.history = RingBuffer(history)
+        self.filter = None
+        self.filtered = 0
+        self.watching = False
+        self.ranger = None
+        if "trigger" in self.config:
+            self.gpio.setup(self.config["trigger"],self.gpio.OUT)
+        self.gpio.setup(self.config["echo"],self.gpio.IN)
+
+class Arrow():
+    """ Defines an object for controlling one of the LED arrows on the Motorshield.
+
+        Arguments:
+        which = integer label for each arrow. The arrow number if arbitrary starting with:
+            1 = Arrow closest to the Motorshield's power pins and running clockwise round the board
+            ...
+            4 = Arrow closest to the motor pins.
+        backend = optional GPIO backend, defaults to backend.get_backend().
+    """
+    arrowpins={1:33,2:35,3:37,4:36}
+
+    def __init__(self, which, backend=None):
+        self.gpio = backend or get_backend()
+        self.pin = self.arrowpins[which]
+        self.gpio.setup(self.pin,self.gpio.OUT)
+        self.gpio.output(self.pin, self.gpio.LOW)
+
+    def on(self):
+        if events.info:
+            events.emit(INFO, "arrow.on", pin=self.pin)
+        self.gpio.output(self.pin,self.gpio.HIGH)
+
+    def off(self):
+        if events.info:
+            events.emit(INFO, "arrow.off", pin=self.pin)
+        self.gpio.output(self.pin,self.gpio.LOW)
+
+    def state(self):
+        """ Returns True while the arrow is lit, read from the backend's shadow register. """
+        return self.gpio.state(self.pin) == self.gpio.HIGH
\ No newline at end of file
@@ -0,0 +1,222 @@
+"""
+asyncio counterparts of the blocking PiMotor calls.
+
+One event loop can drive any number of motors and sensors without a thread per device:
+
+    AsyncStepper -- await stepper.forward(delay, steps).  Moves run on the shared
+                    executor.StepperExecutor so the step timing never waits on the loop.
+    AsyncSensor  -- await sensor.trigger().  The settle time between ultrasonic pings is an
+                    asyncio sleep and the echo itself is timed on a single shared thread.
+    AsyncMotor   -- await motor.ramp_to(speed).  Duty cycle ramps run on the shared
+                    ramp.RampEngine thread, the coroutine only awaits completion.
+
+example:
+    stepper = AsyncStepper(PiMotor.Stepper("STEPPER1"))
+    sensor = AsyncSensor(PiMotor.Sensor("ULTRASONIC", 20))
+    motor = AsyncMotor(PiMotor.Motor("MOTOR3", 1))
+
+    async def main():
+        await asyncio.gather(stepper.forward(0.002, 400), motor.ramp_to(80, rate=100))
+        await sensor.trigger()
+"""
+import asyncio
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import ramp
+from executor import MoveCancelled, StepperExecutor
+
+_executor = None
+_echoPool = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    """ Returns the StepperExecutor shared by every AsyncStepper. """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = StepperExecutor()
+        return _executor
+
+
+def get_echo_pool():
+    """ Returns the single thread used to time ultrasonic echoes for every AsyncSensor. """
+    global _echoPool
+    with _lock:
+        if _echoPool is None:
+            _echoPool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="echo")
+        return _echoPool
+
+
+def _retrieve(future):
+    if not future.cancelled():
+        future.exception()
+
+
+async def wait_move(move):
+    """ Awaits an executor.MoveHandle, cancelling the move if the awaiting task is cancelled.
+    Returns the number of steps taken.  Raises executor.MoveCancelled when the move was
+    cancelled by its handle, while queued or part way, and asyncio.CancelledError only when
+    the awaiting task itself was cancelled.
+    """
+    future = asyncio.wrap_future(move.future)
+    try:
+        # Shielded, so a cancelled task leaves the future alone and the two cases can be told apart.
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        if future.cancelled():
+            raise MoveCancelled("move cancelled after %d steps" % move.completed) from None
+        move.cancel()
+        future.add_done_callback(_retrieve)
+        raise
+
+
+class AsyncStepper:
+    """ Awaitable wrapper around a PiMotor.Stepper.
+
+    Arguments:
+    stepper = PiMotor.Stepper instance.
+    executor = optional executor.StepperExecutor, defaults to the shared one.
+    """
+    def __init__(self, stepper, executor=None):
+        self.stepper = stepper
+        self.executor = executor or get_executor()
+
+    async def forward(self, delay, steps):
+        """ Rotates forward, see PiMotor.Stepper.forward.  Returns the number of steps taken. """
+        return await wait_move(self.executor.forward(self.stepper, delay, steps))
+
+    async def backward(self, delay, steps):
+        """ Rotates backward, see PiMotor.Stepper.backward.  Returns the number of steps taken. """
+        return await wait_move(self.executor.backward(self.stepper, delay, steps))
+
+    async def sequence(self, sequence, direction="forward"):
+        """ Runs an easy.EasyStepperSequence.  Returns the number of steps taken. """
+        return await wait_move(self.executor.sequence(self.stepper, sequence, direction))
+
+    def setMode(self, mode, resolution=8):
+        self.stepper.setMode(mode, resolution)
+
+    def stop(self):
+        self.stepper.stop()
+
+
+class AsyncSensor:
+    """ Awaitable wrapper around a PiMotor.Sensor.
+
+    Arguments:
+    sensor = PiMotor.Sensor instance.
+    interval = optional float, sets sensor.interval, the minimum seconds between two ultrasonic
+               pings so echoes from the previous ping have died away.  It is waited for with an
+               asyncio sleep instead of the blocking one in Sensor.sonicCheck, counting from
+               sensor.lastPing, so pings taken through the sensor itself are spaced out too.
+    """
+    def __init__(self, sensor, interval=None):
+        self.sensor = sensor
+        if interval is not None:
+            sensor.interval = interval
+        self.lock = None
+
+    @property
+    def Triggered(self):
+        return self.sensor.Triggered
+
+    @property
+    def lastRead(self):
+        return self.sensor.lastRead
+
+    async def trigger(self):
+        """ Takes a reading, see PiMotor.Sensor.trigger.  Returns the sensor's Triggered state.
+        While the sensor is ranging in the background (Sensor.startRanging) the latest reading
+        is returned without pinging.
+        """
+        sensor = self.sensor
+        if "trigger" not in sensor.config:
+            sensor.iRCheck()
+            return sensor.Triggered
+        if sensor.ranger is not None:
+            return sensor.Triggered
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            wait = sensor.lastPing + sensor.interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            loop = asyncio.get_running_loop()
+            measure = await loop.run_in_executor(get_echo_pool(), sensor.ping)
+        sensor.record(measure)
+        return sensor.Triggered
+
+
+def _settle(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AsyncMotor:
+    """ Awaitable wrapper around a PiMotor.Motor.
+
+    Arguments:
+    motor = PiMotor.Motor instance.
+
+    Attributes:
+    speed = float, current signed duty cycle, negative values run the motor in reverse.
+    """
+    def __init__(self, motor):
+        self.motor = motor
+        self.speed = 0.0
+
+    def set(self, speed):
+        """ Applies a signed duty cycle immediately. """
+        if speed > 0:
+            self.motor.forward(speed)
+        elif speed < 0:
+            self.motor.reverse(-speed)
+        else:
+            self.motor.stop()
+        self.speed = speed
+
+    async def ramp_to(self, speed, rate=200.0, tick=None):
+        """ Ramps the duty cycle to speed without blocking the loop.
+
+        Arguments:
+        speed = float target duty cycle from -100 to 100, negative for reverse.
+        rate = float maximum change in duty cycle percentage per second.
+        tick = deprecated, ignored.  The ramp is updated at the tick of the shared engine,
+               see ramp.RampEngine.
+
+        The ramp runs on the shared ramp.RampEngine thread, see PiMotor.Motor.speed.
+        Changing direction ramps down through zero before ramping back up.
+        Returns the duty cycle the ramp ended at, short of speed when forward, reverse, stop
+        or another ramp on the motor cut it short.
+        """
+        if tick is not None:
+            warnings.warn("ramp_to(tick=) is ignored, ramps run at the tick of ramp.get_engine()",
+                          DeprecationWarning, stacklevel=2)
+        loop = asyncio.get_running_loop()
+        reached = loop.create_future()
+
+        def done(motor, finished):
+            loop.call_soon_threadsafe(_settle, reached)
+
+        self.motor.speed(speed, rate, done)
+        try:
+            await reached
+        except asyncio.CancelledError:
+            ramp.get_engine().cancel(self.motor)
+            self.speed = self.motor.current
+            raise
+        self.speed = self.motor.current
+        return self.speed
+
+    async def forward(self, speed):
+        self.set(speed)
+
+    async def reverse(self, speed):
+        self.set(-speed)
+
+    async def stop(self):
+        self.set(0)
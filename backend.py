@@ -0,0 +1,556 @@
+"""
+GPIO backends for the PiMotor library.
+
+Every class in PiMotor talks to the hardware through a backend object rather than
+importing RPi.GPIO directly.  Two backends ship with the library:
+
+    RPiGPIOBackend   -- drives the real Motor Shield through RPi.GPIO (board numbering).
+    SimulatedBackend -- an in-process model of the shield.  Records every pin write with a
+                        perf_counter_ns timestamp and models the ultrasonic echo and IR inputs,
+                        so the stepping and sensing code can be profiled and tested on any
+                        Linux machine at full speed.
+
+The installed backend is wrapped in a ShadowRegister, which remembers every output level and
+duty cycle and drops writes that would not change anything.
+
+The default backend is chosen on first use from the PIMOTOR_BACKEND environment variable
+("rpi" or "sim", defaults to "rpi").  Use set_backend() to install one explicitly.
+
+example:
+    import backend, PiMotor
+    sim = backend.set_backend(backend.SimulatedBackend())
+    motor = PiMotor.Stepper("STEPPER1")
+    motor.forward(0.001, 200)
+    print(len(sim.writes))
+"""
+import os
+import threading
+import time
+
+_backend = None
+
+
+class Backend:
+    """ Interface implemented by all GPIO backends.
+
+    The method names and constants deliberately mirror RPi.GPIO so the library code reads
+    the same whichever backend is installed.
+
+    Attributes:
+    lock = re-entrant lock held while a group of related pin writes is made, so moves running
+           on background threads never interleave with writes from the calling thread.
+    """
+    HIGH = 1
+    LOW = 0
+    OUT = 0
+    IN = 1
+    BOARD = 10
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    name = "base"
+
+    def __init__(self):
+        self.lock = threading.RLock()
+
+    def setup(self, pin, direction):
+        """ Configures a pin as an input (IN) or output (OUT). """
+        raise NotImplementedError
+
+    def output(self, pin, value):
+        """ Drives an output pin HIGH or LOW. """
+        raise NotImplementedError
+
+    def outputs(self, pins, values):
+        """ Drives several output pins in one call.  The default writes the pins one by one,
+        backends with a list form of output, like RPi.GPIO, override it with that.
+
+        Arguments:
+        pins = list of pin numbers.
+        values = list of levels, one per pin.
+        """
+        output = self.output
+        for pin, value in zip(pins, values):
+            output(pin, value)
+
+    def input(self, pin):
+        """ Returns the current level of an input pin. """
+        raise NotImplementedError
+
+    def add_event_detect(self, pin, edge, callback, bouncetime=0):
+        """ Calls callback(pin) from a background thread whenever an edge is seen on an input pin.
+
+        Arguments:
+        edge = RISING, FALLING or BOTH.
+        bouncetime = int milliseconds during which further edges are ignored, 0 for none.
+        """
+        raise NotImplementedError
+
+    def remove_event_detect(self, pin):
+        """ Stops edge detection started by add_event_detect. """
+        raise NotImplementedError
+
+    def edge_time(self, pin):
+        """ Returns the perf_counter_ns time of the edge being reported to an add_event_detect
+        callback.  RPi.GPIO does not report it, so this is the time the callback runs; the
+        simulator reports the modelled time of the edge.
+        """
+        return time.perf_counter_ns()
+
+    def PWM(self, pin, frequency):
+        """ Returns a PWM object for the pin supporting start/ChangeDutyCycle/stop. """
+        raise NotImplementedError
+
+    def play_waveform(self, coils, chain, state, transitions, clock):
+        """ Plays a compiled waveform.WaveformChain on a stepper's coil pins in one call.
+
+        Backends with a hardware pulse engine override this.  The default clocks the words out
+        from a deadline-timed software loop.
+
+        Arguments:
+        coils = tuple of the four coil pins.
+        chain = waveform.WaveformChain.
+        state = int coil bitmask the coils are currently in.
+        transitions = the stepper's transition table, see Stepper.compileTransitions.
+        clock = timing.StepClock used for the software loop.
+
+        Returns the coil bitmask after the last step.
+        """
+        outputs = self.outputs
+        lock = self.lock
+        wait = clock.wait
+        clock.start()
+        for buffer in chain:
+            for word in buffer.words:
+                wait((word >> 4) / 1e6)
+                mask = word & 0xF
+                change = transitions[state << 4 | mask]
+                if change:
+                    with lock:
+                        outputs(*change)
+                state = mask
+        return state
+
+    def state(self, pin):
+        """ Returns the level of a pin.  Plain backends read the hardware, ShadowRegister answers
+        from its record of the last write.
+        """
+        return self.input(pin)
+
+    def cleanup(self):
+        """ Releases every pin used by the library. """
+        raise NotImplementedError
+
+
+class RPiGPIOBackend(Backend):
+    """ Backend driving the real shield through the RPi.GPIO module. """
+    name = "rpi"
+
+    def __init__(self):
+        Backend.__init__(self)
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        GPIO.setmode(GPIO.BOARD)
+        GPIO.setwarnings(False)
+        # Bind straight to the C functions so the hot paths pay no extra Python call.
+        self.setup = GPIO.setup
+        self.output = GPIO.output
+        self.outputs = GPIO.output
+        self.input = GPIO.input
+        self.PWM = GPIO.PWM
+        self.cleanup = GPIO.cleanup
+        self.remove_event_detect = GPIO.remove_event_detect
+
+    def add_event_detect(self, pin, edge, callback, bouncetime=0):
+        # RPi.GPIO rejects a zero bouncetime, leave it out instead.
+        if bouncetime:
+            self.GPIO.add_event_detect(pin, edge, callback=callback, bouncetime=bouncetime)
+        else:
+            self.GPIO.add_event_detect(pin, edge, callback=callback)
+
+
+class SimulatedPWM:
+    """ Stand-in for RPi.GPIO.PWM that reports duty cycle changes to the SimulatedBackend. """
+    def __init__(self, backend, pin, frequency):
+        self.backend = backend
+        self.pin = pin
+        self.frequency = frequency
+        self.dutyCycle = 0
+        self.running = False
+
+    def start(self, duty):
+        self.running = True
+        self.ChangeDutyCycle(duty)
+
+    def ChangeDutyCycle(self, duty):
+        self.dutyCycle = duty
+        self.backend._record(self.pin, ("pwm", duty))
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        self.running = False
+        self.backend._record(self.pin, ("pwm", 0))
+
+
+class SimulatedBackend(Backend):
+    """ In-process model of the Motor Shield.
+
+    Arguments:
+    record = boolean, when True every output and PWM change is appended to the writes list
+             as (perf_counter_ns, pin, value).
+    realtime = boolean, when False waveforms are replayed instantly with their writes stamped
+               on a virtual clock, when True they are played in real time like on hardware.
+
+    Attributes:
+    writes = list of recorded (timestamp_ns, pin, value) tuples.
+    pins = dict mapping pin number to its current level.
+    modes = dict mapping pin number to IN or OUT.
+    """
+    name = "sim"
+
+    # Speed of sound in cm/s, matching the constant used by Sensor.sonicCheck.
+    SOUND_SPEED = 34300
+
+    def __init__(self, record=True, realtime=False):
+        Backend.__init__(self)
+        self.record = record
+        self.realtime = realtime
+        self.waveforms = 0
+        self.writes = []
+        self.pins = {}
+        self.modes = {}
+        self.pwms = {}
+        self.echoes = {}
+        self.events = {}
+        self._pulses = {}
+        self._edgeTimes = {}
+
+    def _record(self, pin, value):
+        if self.record:
+            self.writes.append((time.perf_counter_ns(), pin, value))
+
+    def setup(self, pin, direction):
+        self.modes[pin] = direction
+        self.pins.setdefault(pin, self.LOW)
+
+    def output(self, pin, value):
+        value = 1 if value else 0
+        self.pins[pin] = value
+        if self.record:
+            self.writes.append((time.perf_counter_ns(), pin, value))
+        echo = self.echoes.get(pin)
+        if echo is not None and not value:
+            self._fire_echo(pin, echo)
+
+    def outputs(self, pins, values):
+        now = time.perf_counter_ns()
+        for pin, value in zip(pins, values):
+            value = 1 if value else 0
+            self.pins[pin] = value
+            if self.record:
+                self.writes.append((now, pin, value))
+            echo = self.echoes.get(pin)
+            if echo is not None and not value:
+                self._fire_echo(pin, echo)
+
+    def input(self, pin):
+        pulse = self._pulses.get(pin)
+        if pulse is not None:
+            now = time.perf_counter_ns()
+            rise, fall = pulse
+            if now < rise:
+                return self.LOW
+            if now < fall:
+                return self.HIGH
+            del self._pulses[pin]
+            return self.LOW
+        return self.pins.get(pin, self.LOW)
+
+    def add_event_detect(self, pin, edge, callback, bouncetime=0):
+        if pin in self.events:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        self.events[pin] = [edge, callback, bouncetime * 1000000, None]
+
+    def remove_event_detect(self, pin):
+        self.events.pop(pin, None)
+
+    def play_waveform(self, coils, chain, state, transitions, clock):
+        self.waveforms += 1
+        if self.realtime:
+            return Backend.play_waveform(self, coils, chain, state, transitions, clock)
+        now = time.perf_counter_ns()
+        pins = self.pins
+        writes = self.writes
+        record = self.record
+        for buffer in chain:
+            for word in buffer.words:
+                now += (word >> 4) * 1000
+                mask = word & 0xF
+                change = transitions[state << 4 | mask]
+                if change:
+                    for pin, value in zip(*change):
+                        pins[pin] = value
+                        if record:
+                            writes.append((now, pin, value))
+                state = mask
+        return state
+
+    def PWM(self, pin, frequency):
+        pwm = SimulatedPWM(self, pin, frequency)
+        self.pwms[pin] = pwm
+        return pwm
+
+    def cleanup(self):
+        self.pins.clear()
+        self.modes.clear()
+        self.pwms.clear()
+        self.events.clear()
+        self._pulses.clear()
+        self._edgeTimes.clear()
+
+    def clear(self):
+        """ Discards the recorded writes. """
+        del self.writes[:]
+
+    def set_input(self, pin, value):
+        """ Sets the level seen on an input pin, e.g. an IR sensor detecting an object.
+        Edge callbacks registered with add_event_detect run in the calling thread.
+        """
+        value = 1 if value else 0
+        previous = self.pins.get(pin, self.LOW)
+        self.pins[pin] = value
+        if value != previous:
+            self._edge(pin, value)
+
+    def _edge(self, pin, value, stamp=None):
+        # Runs the add_event_detect callback of a pin for an edge to value, if it wants it.
+        # stamp is the modelled time of the edge, reported by edge_time, default now.
+        event = self.events.get(pin)
+        if event is None:
+            return
+        edge, callback, bounce, last = event
+        if edge != self.BOTH and (edge == self.RISING) != bool(value):
+            return
+        now = time.perf_counter_ns() if stamp is None else stamp
+        if last is not None and now - last < bounce:
+            return
+        event[3] = now
+        self._edgeTimes[pin] = now
+        callback(pin)
+
+    def edge_time(self, pin):
+        return self._edgeTimes.get(pin) or time.perf_counter_ns()
+
+    def attach_echo(self, trigger, echo, distance, latency=0.0005):
+        """ Models an ultrasonic sensor wired to the trigger and echo pins.
+
+        Arguments:
+        distance = float distance to the obstacle in cm, a callable returning one, or None
+                   to model a missed echo (the echo pin then never rises).
+        latency = float seconds between the falling trigger edge and the echo pulse rising.
+        """
+        self.echoes[trigger] = (echo, distance, int(latency * 1e9))
+
+    def _fire_echo(self, trigger, echo):
+        pin, distance, latency = echo
+        if callable(distance):
+            distance = distance()
+        if distance is None:
+            return
+        now = time.perf_counter_ns()
+        if now < self._pulses.get(pin, (0, 0))[1]:
+            # Like the real sensor, a trigger is ignored while the echo is still high.
+            return
+        rise = now + latency
+        width = int(distance * 2 / self.SOUND_SPEED * 1e9)
+        self._pulses[pin] = (rise, rise + width)
+        if pin in self.events:
+            # Edge callbacks run on their own thread at the modelled edge times, like the
+            # interrupt thread of RPi.GPIO.
+            thread = threading.Thread(target=self._echo_edges, args=(pin, rise, rise + width))
+            thread.daemon = True
+            thread.start()
+
+    def _echo_edges(self, pin, rise, fall):
+        for stamp, value in ((rise, self.HIGH), (fall, self.LOW)):
+            delay = stamp - time.perf_counter_ns()
+            if delay > 0:
+                time.sleep(delay / 1e9)
+            self._edge(pin, value, stamp)
+
+
+class ShadowPWM:
+    """ PWM wrapper handed out by ShadowRegister, skips duty cycle changes that change nothing. """
+    def __init__(self, register, pwm, pin):
+        self.register = register
+        self.pwm = pwm
+        self.pin = pin
+
+    def start(self, duty):
+        self.pwm.start(duty)
+        self.register.duties[self.pin] = duty
+        self.register.pwmWritten += 1
+
+    def ChangeDutyCycle(self, duty):
+        register = self.register
+        if register.duties.get(self.pin) == duty:
+            register.pwmElided += 1
+            return
+        register.duties[self.pin] = duty
+        register.pwmWritten += 1
+        self.pwm.ChangeDutyCycle(duty)
+
+    def ChangeFrequency(self, frequency):
+        self.pwm.ChangeFrequency(frequency)
+
+    def stop(self):
+        self.pwm.stop()
+        self.register.duties[self.pin] = 0
+
+    def __getattr__(self, name):
+        return getattr(self.pwm, name)
+
+
+class ShadowRegister(Backend):
+    """ Backend wrapper keeping a shadow copy of every output level and PWM duty cycle.
+
+    Writes that would leave a pin as it already is are dropped before they reach the wrapped
+    backend, and state() answers from the shadow copy without touching the hardware.  Since
+    every Motor, Arrow and Stepper shares the installed backend, they share one register.
+    Anything else, such as the SimulatedBackend helpers, is passed through to the wrapped backend.
+
+    Arguments:
+    backend = the Backend doing the actual writes.
+
+    Attributes:
+    levels = dict mapping output pin to its last written level.
+    duties = dict mapping PWM pin to its last duty cycle.
+    written, elided = int, pin writes passed on and pin writes skipped.
+    pwmWritten, pwmElided = int, the same for duty cycle changes.
+    """
+    name = "shadow"
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.lock = backend.lock
+        self.levels = {}
+        self.duties = {}
+        self.reset()
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def reset(self):
+        """ Zeroes the write counters. """
+        self.written = 0
+        self.elided = 0
+        self.pwmWritten = 0
+        self.pwmElided = 0
+
+    def stats(self):
+        return {"written": self.written, "elided": self.elided,
+                "pwmWritten": self.pwmWritten, "pwmElided": self.pwmElided}
+
+    def setup(self, pin, direction):
+        # The level after setup is whatever the hardware had, so forget the shadow copy.
+        self.levels.pop(pin, None)
+        self.backend.setup(pin, direction)
+
+    def output(self, pin, value):
+        value = 1 if value else 0
+        if self.levels.get(pin) == value:
+            self.elided += 1
+            return
+        self.levels[pin] = value
+        self.written += 1
+        self.backend.output(pin, value)
+
+    def outputs(self, pins, values):
+        levels = self.levels
+        changed = []
+        changedValues = []
+        for pin, value in zip(pins, values):
+            value = 1 if value else 0
+            if levels.get(pin) != value:
+                levels[pin] = value
+                changed.append(pin)
+                changedValues.append(value)
+        self.elided += len(pins) - len(changed)
+        if changed:
+            self.written += len(changed)
+            self.backend.outputs(changed, changedValues)
+
+    def input(self, pin):
+        return self.backend.input(pin)
+
+    def state(self, pin):
+        """ Returns the last level written to an output pin, or reads it when never written. """
+        level = self.levels.get(pin)
+        return self.backend.input(pin) if level is None else level
+
+    def duty(self, pin):
+        """ Returns the duty cycle last set on a PWM pin, None when it has no PWM. """
+        return self.duties.get(pin)
+
+    def add_event_detect(self, pin, edge, callback, bouncetime=0):
+        self.backend.add_event_detect(pin, edge, callback, bouncetime)
+
+    def remove_event_detect(self, pin):
+        self.backend.remove_event_detect(pin)
+
+    def edge_time(self, pin):
+        return self.backend.edge_time(pin)
+
+    def PWM(self, pin, frequency):
+        return ShadowPWM(self, self.backend.PWM(pin, frequency), pin)
+
+    def play_waveform(self, coils, chain, state, transitions, clock):
+        state = self.backend.play_waveform(coils, chain, state, transitions, clock)
+        for bit, pin in enumerate(coils):
+            self.levels[pin] = state >> bit & 1
+        return state
+
+    def cleanup(self):
+        self.levels.clear()
+        self.duties.clear()
+        self.backend.cleanup()
+
+
+def _sleep_until(deadline):
+    # Sleeps most of the way and spins the rest so simulated edges land on time.
+    remaining = deadline - time.perf_counter_ns()
+    if remaining > 1000000:
+        time.sleep((remaining - 1000000) / 1e9)
+    while time.perf_counter_ns() < deadline:
+        pass
+
+
+def set_backend(backend, shadow=True):
+    """ Installs the backend used by every PiMotor object created afterwards.
+
+    Arguments:
+    backend = Backend instance.
+    shadow = boolean, wraps the backend in a ShadowRegister so redundant writes are skipped.
+
+    Returns the installed backend, i.e. the ShadowRegister when shadow is True.  Attributes of the
+    wrapped backend, such as SimulatedBackend.writes, remain reachable through it.
+    """
+    global _backend
+    if shadow and not isinstance(backend, ShadowRegister):
+        backend = ShadowRegister(backend)
+    _backend = backend
+    return backend
+
+
+def get_backend():
+    """ Returns the installed backend, creating the default one on first use. """
+    global _backend
+    if _backend is None:
+        if os.environ.get("PIMOTOR_BACKEND", "rpi") == "sim":
+            set_backend(SimulatedBackend())
+        else:
+            set_backend(RPiGPIOBackend())
+    return _backend
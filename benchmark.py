@@ -0,0 +1,229 @@
+#!/usr/bin/python
+"""
+Benchmarks of the stepping, motor command and sensing hot paths.
+
+Everything runs against the SimulatedBackend, so the numbers measure the library's own
+overhead on any Linux machine and can be compared between versions:
+
+    step_rate_<mode>  -- sustained steps per second of Stepper.forward with no delay, per mode,
+                         micro being 1/8 microstepping.
+    motor_forward     -- cost of one Motor.forward call, changing speed every call.
+    motor_repeat      -- cost of re-issuing the same Motor.forward (redundant writes skipped).
+    linked_forward    -- cost of one LinkedMotors.forward call over MOTOR1-4.
+    easy_profile      -- EasyStepper profile compile cost per step and cached lookup cost.
+    sensor_ping       -- latency of one ultrasonic ping of an obstacle 1 cm away.
+    sensor_ranging    -- latency of Sensor.trigger while background ranging is running.
+    sensor_ir         -- latency of Sensor.trigger on an IR sensor.
+
+Each benchmark is repeated and reports the best and median run.  Results are printed as JSON,
+or written to a file with --output; --compare prints the change against an earlier result file.
+
+example:
+    python benchmark.py --output v1.json
+    python benchmark.py --compare v1.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from time import perf_counter_ns
+
+import backend
+import PiMotor
+
+benchmarks = {}
+
+
+def benchmark(func):
+    benchmarks[func.__name__] = func
+    return func
+
+
+def fresh():
+    """ Installs a new non-recording SimulatedBackend and returns it. """
+    return backend.set_backend(backend.SimulatedBackend(record=False))
+
+
+def timeCalls(call, number, repeat):
+    """ Runs call() number times per run and returns the best and median microseconds per call. """
+    runs = []
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        for _ in range(number):
+            call()
+        runs.append((perf_counter_ns() - start) / number / 1000.0)
+    return {"best_us": min(runs), "median_us": statistics.median(runs), "calls": number}
+
+
+def stepRate(mode, steps, repeat):
+    fresh()
+    stepper = PiMotor.Stepper("STEPPER1")
+    stepper.setMode(mode)
+    rates = []
+    for _ in range(repeat):
+        start = perf_counter_ns()
+        stepper.forward(0, steps)
+        rates.append(steps * 1e9 / (perf_counter_ns() - start))
+    stepper.stop()
+    return {"best_steps_per_s": max(rates), "median_steps_per_s": statistics.median(rates),
+            "steps": steps}
+
+
+@benchmark
+def step_rate_single(scale, repeat):
+    return stepRate("single", 20000 * scale, repeat)
+
+
+@benchmark
+def step_rate_double(scale, repeat):
+    return stepRate("double", 20000 * scale, repeat)
+
+
+@benchmark
+def step_rate_half(scale, repeat):
+    return stepRate("half", 20000 * scale, repeat)
+
+
+@benchmark
+def step_rate_micro(scale, repeat):
+    return stepRate("micro", 20000 * scale, repeat)
+
+
+@benchmark
+def motor_forward(scale, repeat):
+    fresh()
+    motor = PiMotor.Motor("MOTOR1", 1)
+    state = [40]
+
+    def call():
+        state[0] = 100 - state[0]
+        motor.forward(state[0])
+    result = timeCalls(call, 5000 * scale, repeat)
+    motor.stop()
+    return result
+
+
+@benchmark
+def motor_repeat(scale, repeat):
+    fresh()
+    motor = PiMotor.Motor("MOTOR1", 1)
+    result = timeCalls(lambda: motor.forward(50), 5000 * scale, repeat)
+    motor.stop()
+    return result
+
+
+@benchmark
+def linked_forward(scale, repeat):
+    fresh()
+    group = PiMotor.LinkedMotors(*[PiMotor.Motor("MOTOR%d" % n, 1) for n in range(1, 5)])
+    state = [40]
+
+    def call():
+        state[0] = 100 - state[0]
+        group.forward(state[0])
+    result = timeCalls(call, 2000 * scale, repeat)
+    result["max_skew_us"] = group.maxSkew * 1e6
+    group.stop()
+    return result
+
+
+@benchmark
+def easy_profile(scale, repeat):
+    try:
+        import easy
+    except ImportError as error:
+        return {"skipped": str(error)}
+    steps = 2000
+    cold = timeCalls(lambda: easy.ProfileCache.compile("quad", 0.01, 0.001, steps), scale, repeat)
+    cache = easy.ProfileCache()
+    cache.get("quad", 0.01, 0.001, steps)
+    cached = timeCalls(lambda: cache.get("quad", 0.01, 0.001, steps), 10000 * scale, repeat)
+    return {"compile_per_step_us": cold["best_us"] / steps, "cached_get_us": cached["best_us"],
+            "steps": steps}
+
+
+@benchmark
+def sensor_ping(scale, repeat):
+    sim = fresh()
+    sensor = PiMotor.Sensor("ULTRASONIC", 20)
+    sim.attach_echo(sensor.config["trigger"], sensor.config["echo"], 1.0)
+    # The 10 us trigger pulse, the 0.5 ms echo latency and the 58 us echo of 1 cm are part of
+    # every real ping too, the rest is overhead.
+    return timeCalls(sensor.ping, 200 * scale, repeat)
+
+
+@benchmark
+def sensor_ranging(scale, repeat):
+    sim = fresh()
+    sensor = PiMotor.Sensor("ULTRASONIC", 20)
+    sim.attach_echo(sensor.config["trigger"], sensor.config["echo"], 30.0)
+    sensor.startRanging(rate=50)
+    try:
+        return timeCalls(sensor.trigger, 20000 * scale, repeat)
+    finally:
+        sensor.stopRanging()
+
+
+@benchmark
+def sensor_ir(scale, repeat):
+    fresh()
+    sensor = PiMotor.Sensor("IR1", 0)
+    return timeCalls(sensor.trigger, 20000 * scale, repeat)
+
+
+def run(names, scale=1, repeat=5):
+    """ Runs the named benchmarks and returns the result document. """
+    results = {}
+    for name in names:
+        results[name] = benchmarks[name](scale, repeat)
+    return {"meta": {"python": platform.python_version(),
+                     "implementation": platform.python_implementation(),
+                     "machine": platform.machine(),
+                     "platform": platform.platform(),
+                     "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "scale": scale, "repeat": repeat},
+            "results": results}
+
+
+def compare(current, baseline):
+    """ Prints the change of every metric against a baseline result document. """
+    for name, metrics in current["results"].items():
+        previous = baseline.get("results", {}).get(name, {})
+        for key, value in metrics.items():
+            old = previous.get(key)
+            if not isinstance(value, float) or not old:
+                continue
+            change = (value - old) / old * 100.0
+            # Rates are better when higher, times when lower.
+            better = change > 0 if key.endswith("per_s") else change < 0
+            print("%-16s %-22s %12.3f %12.3f %+7.1f%% %s" % (
+                name, key, old, value, change, "better" if better else "worse"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PiMotor benchmarks on the simulated backend")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, default all: %s" % ", ".join(benchmarks))
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="print the change against an earlier JSON result file")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=1, help="multiplies the iteration counts")
+    options = parser.parse_args()
+    unknown = [name for name in options.names if name not in benchmarks]
+    if unknown:
+        parser.error("unknown benchmark: %s" % ", ".join(unknown))
+    document = run(options.names or list(benchmarks), options.scale, options.repeat)
+    text = json.dumps(document, indent=2)
+    if options.output:
+        with open(options.output, "w") as target:
+            target.write(text + "\n")
+    if options.compare:
+        with open(options.compare) as source:
+            compare(document, json.load(source))
+    elif not options.output:
+        print(text)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
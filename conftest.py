@@ -0,0 +1,3 @@
+"""
+Lets pytest import the library's top level modules from the tests directory.
+"""
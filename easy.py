@@ -1,4 +1,142 @@
 from easing_functions import *
+import json
+import threading
+from array import array
+from collections import OrderedDict
+
+"""
+Easing curves available to EasyStepper, keyed by the name used in the profile cache.
+"""
+curves = {"linear": LinearInOut,
+          "quad": QuadEaseInOut,
+          "circular": CircularEaseInOut,
+          "expo": ExponentialEaseInOut,
+          "elastic": ElasticEaseInOut,
+          "back": BackEaseInOut,
+          "bounce": BounceEaseInOut}
+
+class DelayProfile:
+    """
+    Immutable table of per step delays.
+    Called like the lambdas Stepper.forward accepts, profile(index, steps) returns the delay for
+    that step, but Stepper also reads the delays tuple directly so a step costs one index lookup.
+    Steps past the end of the table keep the last delay, so a move may be longer than its profile.
+    params:
+        delays -- iterable of float delays, one per step index.  Tuples and arrays are used as given.
+    """
+    __slots__ = ("delays",)
+
+    def __init__(self, delays):
+        self.delays = delays if isinstance(delays, (tuple, array)) else tuple(delays)
+
+    def __call__(self, index, _=None):
+        delays = self.delays
+        return delays[index] if index < len(delays) else delays[-1]
+
+    def __len__(self):
+        return len(self.delays)
+
+class ProfileCache:
+    """
+    Bounded LRU cache of compiled DelayProfiles keyed by (curve, start, end, steps).
+    params:
+        maxsize: int -- number of profiles kept before the least recently used is dropped.
+        path: str -- optional JSON file the cache is loaded from on creation and written to by save().
+    example:
+        cache = ProfileCache(maxsize=256, path="/var/tmp/profiles.json")
+        motor.forward(cache.get("quad", 0.05, 0.01, 400), 400)
+        print(cache.stats())
+        cache.save()
+    """
+    def __init__(self, maxsize=128, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.profiles = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            self.load(path)
+
+    def get(self, curve, start, end, steps):
+        """
+        Returns the profile for the curve, compiling and caching it on a miss.
+        params:
+            curve -- str, one of the names in easy.curves.
+            start -- float, initial delay.
+            end -- float, final delay.
+            steps -- int, number of steps the profile covers.
+        """
+        key = (curve, start, end, steps)
+        with self.lock:
+            profile = self.profiles.get(key)
+            if profile is not None:
+                self.profiles.move_to_end(key)
+                self.hits += 1
+                return profile
+            self.misses += 1
+        profile = self.compile(curve, start, end, steps)
+        with self.lock:
+            self.store(key, profile)
+        return profile
+
+    @staticmethod
+    def compile(curve, start, end, steps):
+        """
+        Evaluates the easing curve once for every step index from 0 to steps.
+        """
+        ez = curves[curve](start=start, end=end, duration=steps)
+        return DelayProfile(ez.ease(index) for index in range(steps + 1))
+
+    def store(self, key, profile):
+        self.profiles[key] = profile
+        self.profiles.move_to_end(key)
+        while len(self.profiles) > self.maxsize:
+            self.profiles.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Returns a dict with the hit, miss and eviction counters and the current size.
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "size": len(self.profiles), "maxsize": self.maxsize}
+
+    def clear(self):
+        with self.lock:
+            self.profiles.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def save(self, path=None):
+        """
+        Writes the cached profiles, least recently used first, to a JSON file.
+        """
+        path = path or self.path
+        with self.lock:
+            entries = [[list(key), list(profile.delays)] for key, profile in self.profiles.items()]
+        with open(path, "w") as fh:
+            json.dump(entries, fh)
+
+    def load(self, path=None):
+        """
+        Adds the profiles stored by save() to the cache.  A missing file is ignored.
+        """
+        path = path or self.path
+        try:
+            with open(path) as fh:
+                entries = json.load(fh)
+        except (IOError, OSError, ValueError):
+            return
+        with self.lock:
+            for key, delays in entries:
+                self.store(tuple(key), DelayProfile(delays))
+
+"""
+Profile cache shared by every EasyStepper.
+"""
+profiles = ProfileCache()
 
 class EasyStepper:
     """
@@ -11,45 +149,44 @@ class EasyStepper:
         motor = Stepper("STEPPER1")
         motor.forward(ez.quad(200), 200) # Powers up to full speed using a quadratic function.
         motor.forward(ez.reverse().quad(200), 200) # Continues its forward direction but powers back down to its original speed before holding its final position
+    Each curve method returns a DelayProfile from the shared profile cache, so repeating the same
+    (curve, start, end, steps) move reuses the delays computed the first time.
     """
-    def __init__(self, start=0.05, end=0.1):
+    def __init__(self, start=0.05, end=0.1, cache=None):
         self.start = start
         self.end = end
+        self.cache = cache or profiles
 
     def linear(self, steps):
-        ez = LinearInOut(start=self.start, end=self.end, duration=steps)
-        return lambda index, _: ez.ease(index)
+        return self.cache.get("linear", self.start, self.end, steps)
 
     def quad(self, steps):
-        ez = QuadEaseInOut(start=self.start, end=self.end, duration=steps)
-        return lambda index, _: ez.ease(index)
+        return self.cache.get("quad", self.start, self.end, steps)
 
     def circular(self, steps):
-        ez = CircularEaseInOut(start=self.start, end=self.end, duration=steps)
-        return lambda index, _: ez.ease(index)
+        return self.cache.get("circular", self.start, self.end, steps)
 
     def expo(self, steps):
-        ez = ExponentialEaseInOut(start=self.start, end=self.end, duration=steps)
-        return lambda index, _: ez.ease(index)
+        return self.cache.get("expo", self.start, self.end, steps)
 
     def elastic(self, steps):
-        ez = ElasticEaseInOut(start=self.start, end=self.end, duration=steps)
-        return lambda index, _: ez.ease(index)
+        return self.cache.get("elastic", self.start, self.end, steps)
 
     def back(self, steps):
-        ez = BackEaseInOut(start=self.start, end=self.end, duration=steps)
-        return lambda index, _: ez.ease(index)
+        return self.cache.get("back", self.start, self.end, steps)
 
     def bounce(self, steps):
-        ez = BounceEaseInOut(start=self.start, end=self.end, duration=steps)
-        return lambda index, _: ez.ease(index)
+        return self.cache.get("bounce", self.start, self.end, steps)
 
     def reverse(self):
-        return EasyStepper(start=self.end, end=self.start)
+        return EasyStepper(start=self.end, end=self.start, cache=self.cache)
 
 class EasyStepperSequence:
     """
     Utility for executing complex acceleration and deceleration sequences.
+    The segments are compiled into one continuous stream of delays covering exactly the requested
+    number of steps, and executed with a single call so the motor's phase and timing never restart
+    at a segment boundary.
     params:
         start -- float, initial delay that the sequence will begin with.
         steps -- int, total number of steps that will be taken during the sequence.
@@ -63,7 +200,8 @@ class EasyStepperSequence:
         self.steps = steps
         self.start = start
         self.chain = []
-    
+        self.profile = None
+
     def append(self, func, speed, weight):
         """
         Add another link in the chain.
@@ -72,10 +210,81 @@ class EasyStepperSequence:
             speed -- desired delay achieved at the end of the execution of this sequence.
             weight -- used to calculate how many steps this segment of the sequence will get to execute.
         """
-        y = int(self.steps * weight)
-        x = func(start=self.start, end=speed, duration=y)
-        self.start = x.ease(y)
-        self.chain.append((lambda idx, _: x.ease(idx), y))
+        self.chain.append((func, self.start, speed, weight))
+        self.start = speed
+        self.profile = None
+
+    def allocate(self):
+        """
+        Splits the total step count between the segments in proportion to their weights.
+        Uses the largest remainder method so the counts always add up to exactly self.steps.
+        """
+        total = sum(weight for _, _, _, weight in self.chain)
+        if not total:
+            return [0] * len(self.chain)
+        shares = [self.steps * weight / total for _, _, _, weight in self.chain]
+        counts = [int(share) for share in shares]
+        order = sorted(range(len(shares)), key=lambda i: counts[i] - shares[i])
+        for i in order[:self.steps - sum(counts)]:
+            counts[i] += 1
+        return counts
+
+    def delays(self):
+        """
+        Lazily yields the delay for every step index of the whole sequence.
+        The first step of each segment waits the delay the previous segment finished on.
+        """
+        for (func, start, speed, _), count in zip(self.chain, self.allocate()):
+            if count:
+                ez = func(start=start, end=speed, duration=count)
+                for index in range(count):
+                    yield ez.ease(index)
+
+    def compile(self):
+        """
+        Returns the whole sequence as a DelayProfile backed by a preallocated array, built once
+        and reused until another segment is appended.  The profile is empty when no steps are
+        allocated, i.e. no segments or only zero weights.
+        """
+        if self.profile is None:
+            table = array("d", bytes(8 * sum(self.allocate())))
+            for index, delay in enumerate(self.delays()):
+                table[index] = delay
+            self.profile = DelayProfile(table)
+        return self.profile
+
+    def stream(self, stepper, direction="forward"):
+        """
+        Yields the (phase, delay) pairs of the sequence for PiMotor.Stepper.play, starting from the
+        phase after the one the stepper was left in.  Use play() to also keep the stepper's position.
+        params:
+            stepper -- PiMotor.Stepper the sequence is played on.  A compiled phase array is accepted
+                       too and is used as given.
+            direction -- str, "forward" or "backward".
+        """
+        phases = stepper
+        if hasattr(stepper, "phaseOrder"):
+            phases, _ = stepper.phaseOrder(stepper.backwardPhases if direction == "backward" else stepper.forwardPhases)
+        count = len(phases)
+        for index, delay in enumerate(self.delays()):
+            yield phases[index % count], delay
+
+    def play(self, stepper, direction="forward", move=None):
+        """
+        Plays the sequence through PiMotor.Stepper.play and adds the steps taken to the stepper's position.
+        params:
+            stepper -- PiMotor.Stepper.
+            direction -- str, "forward" or "backward".
+            move -- optional executor.MoveHandle, see Stepper.run.
+        Returns the number of steps taken.
+        """
+        phases, step = stepper.phaseOrder(stepper.backwardPhases if direction == "backward" else stepper.forwardPhases)
+        taken = 0
+        try:
+            taken = stepper.play(self.stream(phases), move)
+            return taken
+        finally:
+            stepper.track(phases, step, taken)
 
     def execute(self, func):
         """
@@ -85,7 +294,9 @@ class EasyStepperSequence:
             sequence.execute(motor.forward)
         params:
             func -- motor's forward or backward function.
+        Does nothing and returns None when no steps are allocated, see compile.
         """
-        for pair in self.chain:
-            func(*pair)
-
+        profile = self.compile()
+        if not len(profile):
+            return None
+        return func(profile, len(profile))
@@ -0,0 +1,197 @@
+"""
+Background execution of Stepper moves.
+
+Stepper.forward/backward and EasyStepperSequence.execute block the calling thread for the
+whole move.  StepperExecutor queues moves instead and runs them on one worker thread per
+stepper port, so STEPPER1 and STEPPER2 can turn while the calling thread keeps polling
+sensors or driving the DC motors.  Every queued move returns a MoveHandle that can be
+waited on, polled for progress or cancelled.  Pin writes from the worker threads are
+serialized with the rest of the library through the backend lock.
+
+example:
+    executor = StepperExecutor()
+    move = executor.forward(motor, 0.002, 400)
+    while not move.done():
+        sensor.trigger()
+        if sensor.Triggered:
+            move.cancel()
+    executor.shutdown()
+"""
+import queue
+import threading
+from concurrent.futures import CancelledError, Future
+
+
+class MoveCancelled(Exception):
+    """ Raised by MoveHandle.result() when the move was cancelled. """
+
+
+class MoveHandle:
+    """ Future-like handle for a queued stepper move.
+
+    Attributes:
+    steps = int, total number of steps in the move.
+    completed = int, steps taken so far.
+    future = concurrent.futures.Future resolved with the number of steps taken.
+    stats = timing.StepStats of the move once it is over, when the stepper collects timing.
+    """
+    def __init__(self, steps):
+        self.steps = steps
+        self.completed = 0
+        self.stats = None
+        self.cancelRequested = False
+        self.future = Future()
+
+    @property
+    def progress(self):
+        """ Fraction of the move completed, from 0.0 to 1.0. """
+        if not self.steps:
+            return 1.0 if self.done() else 0.0
+        return self.completed / self.steps
+
+    def done(self):
+        """ True once the move has finished or was cancelled. """
+        return self.future.done()
+
+    def cancelled(self):
+        """ True once the move was cancelled, before it started or part way through. """
+        future = self.future
+        if future.cancelled():
+            return True
+        return future.done() and isinstance(future.exception(), MoveCancelled)
+
+    def cancel(self):
+        """ Stops the move.  A queued move never starts, a running one stops before its next step. """
+        self.cancelRequested = True
+        return True
+
+    def wait(self, timeout=None):
+        """ Blocks until the move is done.  Returns False if the timeout expired first. """
+        try:
+            self.future.exception(timeout)
+        except Exception:
+            pass
+        return self.future.done()
+
+    def result(self, timeout=None):
+        """ Returns the number of steps taken, raising MoveCancelled if the move was cancelled. """
+        try:
+            return self.future.result(timeout)
+        except CancelledError:
+            raise MoveCancelled("move cancelled after %d steps" % self.completed)
+
+    def start(self):
+        """ Marks the move as running.  Returns False if it was cancelled while queued. """
+        if self.cancelRequested:
+            self.future.cancel()
+        return self.future.set_running_or_notify_cancel()
+
+    def finish(self, taken):
+        # Once running the future can no longer be cancelled, a move stopped part way
+        # is resolved with MoveCancelled instead.
+        if self.future.done():
+            return
+        if self.cancelRequested:
+            self.future.set_exception(MoveCancelled("move cancelled after %d steps" % taken))
+        else:
+            self.future.set_result(taken)
+
+
+class StepperExecutor:
+    """ Runs queued Stepper moves on a dedicated thread per stepper port.
+
+    Moves submitted for the same stepper run one after another in submission order, moves
+    for different steppers run concurrently.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.workers = {}
+        self.closed = False
+
+    def forward(self, stepper, delay, steps):
+        """ Queues stepper.forward(delay, steps) and returns its MoveHandle. """
+        return self.submit(stepper, lambda move: stepper.run(stepper.forwardPhases, delay, steps, move), steps)
+
+    def backward(self, stepper, delay, steps):
+        """ Queues stepper.backward(delay, steps) and returns its MoveHandle. """
+        return self.submit(stepper, lambda move: stepper.run(stepper.backwardPhases, delay, steps, move), steps)
+
+    def sequence(self, stepper, sequence, direction="forward"):
+        """ Queues an easy.EasyStepperSequence and returns its MoveHandle.
+
+        Arguments:
+        direction = "forward" or "backward".
+        """
+        phases = stepper.backwardPhases if direction == "backward" else stepper.forwardPhases
+        profile = sequence.compile()
+        steps = len(profile)
+        return self.submit(stepper, lambda move: stepper.run(phases, profile, steps, move), steps)
+
+    def submit(self, stepper, action, steps):
+        """ Queues action(move) for the stepper.  action must return the number of steps taken. """
+        move = MoveHandle(steps)
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("executor has been shut down")
+            # Keyed by the coil pins so every Stepper object on the same port shares one queue.
+            worker = self.workers.get(stepper.coils)
+            if worker is None:
+                worker = self.workers[stepper.coils] = StepperWorker()
+        worker.queue.put((move, action))
+        return move
+
+    def cancelAll(self):
+        """ Cancels every queued and running move. """
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            worker.cancelAll()
+
+    def shutdown(self, wait=True):
+        """ Stops the worker threads once their queued moves are done. """
+        with self.lock:
+            self.closed = True
+            workers = list(self.workers.values())
+        for worker in workers:
+            worker.queue.put(None)
+        if wait:
+            for worker in workers:
+                worker.thread.join()
+
+
+class StepperWorker:
+    """ Worker thread owning the move queue of one stepper. """
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.current = None
+        self.thread = threading.Thread(target=self.loop, name="StepperWorker")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            move, action = item
+            if not move.start():
+                continue
+            self.current = move
+            try:
+                taken = action(move)
+            except BaseException as error:
+                if not move.future.done():
+                    move.future.set_exception(error)
+            else:
+                move.finish(taken)
+            finally:
+                self.current = None
+
+    def cancelAll(self):
+        with self.queue.mutex:
+            pending = [item for item in self.queue.queue if item is not None]
+        for move, _ in pending:
+            move.cancel()
+        current = self.current
+        if current is not None:
+            current.cancel()
@@ -0,0 +1,114 @@
+"""
+Filtering of sensor readings.
+
+FilterPipeline turns the raw readings stored in a Sensor's history ring buffer into a
+stable value for obstacle decisions.  Each new sample runs through three stages over the
+most recent window of readings:
+
+    outlier rejection -- readings further than `outlier` scaled median absolute deviations
+                         from the window median are dropped (ghost echoes, missed edges).
+    median            -- median of the remaining readings.
+    EMA               -- exponential moving average of the medians, weight `alpha`.
+
+When NumPy is installed the window is read through a zero-copy view of the ring buffer's
+array and filtered vectorized; without it the same pipeline runs in plain Python.
+
+example:
+    sensor = PiMotor.Sensor("ULTRASONIC", 20)
+    sensor.setFilter(FilterPipeline(window=7, alpha=0.4))
+    sensor.startRanging(rate=30)
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Scales the median absolute deviation to the standard deviation of normally distributed noise.
+MAD_SCALE = 1.4826
+
+
+class FilterPipeline:
+    """ Incremental outlier rejection, median and EMA filter.
+
+    Arguments:
+    window = int, number of most recent readings considered for each output.
+    alpha = float from 0 to 1, EMA weight of the newest median.  1 disables smoothing.
+    outlier = float, rejection threshold in scaled MADs.  None disables outlier rejection.
+
+    Attributes:
+    value = float, latest filtered value, None until the first sample.
+    rejected = int, number of new readings that were rejected as outliers.
+    """
+    def __init__(self, window=5, alpha=0.5, outlier=3.0):
+        self.window = window
+        self.alpha = alpha
+        self.outlier = outlier
+        self.value = None
+        self.rejected = 0
+        self.view = None
+        self.source = None
+        self.offsets = numpy.arange(-window, 0) if numpy is not None else None
+
+    def reset(self):
+        self.value = None
+        self.rejected = 0
+
+    def update(self, history):
+        """ Filters the newest sample of a sensing.RingBuffer and returns the filtered value. """
+        count = min(self.window, len(history))
+        if not count:
+            return self.value
+        if numpy is not None:
+            median = self.vectorMedian(history, count)
+        else:
+            median = self.listMedian(history, count)
+        if self.value is None:
+            self.value = median
+        else:
+            self.value += self.alpha * (median - self.value)
+        return self.value
+
+    def vectorMedian(self, history, count):
+        view = self.view
+        if self.source is not history.values:
+            # numpy.frombuffer shares memory with the array('d'), nothing is copied per sample.
+            view = self.view = numpy.frombuffer(history.values, dtype=numpy.float64)
+            self.source = history.values
+        samples = view.take(self.offsets[-count:] + history.index, mode="wrap")
+        median = numpy.median(samples)
+        if self.outlier is not None and count > 2:
+            deviation = numpy.abs(samples - median)
+            spread = numpy.median(deviation) * MAD_SCALE
+            if spread > 0:
+                keep = deviation <= self.outlier * spread
+                if not keep[-1]:
+                    self.rejected += 1
+                if not keep.all():
+                    median = numpy.median(samples[keep])
+        return float(median)
+
+    def listMedian(self, history, count):
+        values = history.values
+        index = history.index
+        size = history.size
+        samples = [values[(index - n) % size] for n in range(count, 0, -1)]
+        median = _median(samples)
+        if self.outlier is not None and count > 2:
+            deviation = [abs(sample - median) for sample in samples]
+            spread = _median(deviation) * MAD_SCALE
+            if spread > 0:
+                limit = self.outlier * spread
+                kept = [sample for sample, d in zip(samples, deviation) if d <= limit]
+                if deviation[-1] > limit:
+                    self.rejected += 1
+                if len(kept) < count:
+                    median = _median(kept)
+        return median
+
+
+def _median(samples):
+    ordered = sorted(samples)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
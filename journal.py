@@ -0,0 +1,502 @@
+"""
+Timestamped command journal with deterministic record and replay.
+
+A Journal records, into a compact append-only binary file:
+
+    - every pin transition, PWM frequency and duty cycle change, pin setup and waveform that
+      reaches the backend, captured by JournalBackend;
+    - the library calls reported through telemetry (motor.forward, stepper.forward,
+      arrow.on, ...), with the Journal added as a telemetry sink at DEBUG level so every call
+      is recorded whatever level the other sinks run at.
+
+The calling thread only appends the packed record to an in-memory buffer.  A background thread
+writes the buffer to the file, so recording costs no I/O on the hot path.
+
+Every record is stamped with perf_counter_ns relative to the start of the journal.  Every
+`interval` seconds a checkpoint holding the complete pin state is written, and when the
+journal is closed the offsets of the checkpoints are appended as an index.  Replay uses the
+index to seek to any time offset of a multi-hour log without reading what comes before.
+Journals that were never closed, e.g. after a crash, are indexed by scanning the record
+headers instead.
+
+File layout, little endian:
+
+    header = b"PMJ1", start perf_counter_ns int64, start wall clock time float64
+    record = kind uint8, stamp int64 (ns since start), length uint32 + payload
+    footer = index offset uint64, b"PMJI"
+
+example:
+    log = journal.install("run.pmj")          # before creating any PiMotor objects
+    ...
+    log.close()
+
+    replay = journal.Replay("run.pmj")
+    replay.play(backend.SimulatedBackend(), speed=10.0, start=3600.0)
+"""
+import json
+import struct
+import threading
+import time
+from time import perf_counter_ns
+
+import backend as backends
+from backend import Backend, ShadowRegister
+from telemetry import DEBUG
+from timing import StepClock
+
+MAGIC = b"PMJ1"
+INDEX_MAGIC = b"PMJI"
+
+HEADER = struct.Struct("<4sqd")
+RECORD = struct.Struct("<BqI")
+FOOTER = struct.Struct("<Q4s")
+PIN = struct.Struct("<BB")
+DUTY = struct.Struct("<Bf")
+COUNTS = struct.Struct("<HHHH")
+ENTRY = struct.Struct("<qQ")
+COILS = struct.Struct("<BBBBB")
+
+SETUP = 1
+OUTPUT = 2
+PWM = 3
+WAVEFORM = 4
+CALL = 5
+CHECKPOINT = 6
+INDEX = 7
+FREQUENCY = 8
+
+
+class Journal:
+    """ Append-only binary journal.
+
+    Arguments:
+    path = str, file to record to.  An existing file is replaced.
+    interval = float seconds between checkpoints.
+    flushSize = int, buffered bytes that wake the writer thread early.
+    flushInterval = float, longest time in seconds a record waits in the buffer.
+
+    Attributes:
+    records = int, number of records written.
+    """
+    def __init__(self, path, interval=10.0, flushSize=65536, flushInterval=0.5):
+        self.path = path
+        self.interval = int(interval * 1e9)
+        self.flushSize = flushSize
+        self.flushInterval = flushInterval
+        self.lock = threading.Lock()
+        self.writing = threading.Lock()
+        self.buffer = bytearray()
+        self.modes = {}
+        self.levels = {}
+        self.duties = {}
+        self.frequencies = {}
+        self.index = []
+        self.records = 0
+        self.closed = False
+        self.start = perf_counter_ns()
+        self.lastCheckpoint = -self.interval
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, self.start, time.time()))
+        self.offset = HEADER.size
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.loop, name="Journal")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def append(self, kind, payload, stamp=None, state=None, items=()):
+        """ Adds a record.  stamp is a perf_counter_ns time, defaulting to now.
+        The (pin, value) items are stored into the state dict (modes, levels or duties) under
+        the same lock, so a checkpoint never iterates a dict another thread is changing.
+        """
+        with self.lock:
+            # Stamped under the lock so records from different threads stay in time order.
+            stamp = (perf_counter_ns() if stamp is None else stamp) - self.start
+            if self.closed:
+                return
+            if state is not None:
+                state.update(items)
+            if stamp - self.lastCheckpoint >= self.interval:
+                self.checkpoint(stamp)
+            self.write(kind, stamp, payload)
+
+    def write(self, kind, stamp, payload):
+        # Called with the lock held.
+        self.buffer += RECORD.pack(kind, stamp, len(payload))
+        self.buffer += payload
+        self.offset += RECORD.size + len(payload)
+        self.records += 1
+        if len(self.buffer) >= self.flushSize:
+            self.ready.set()
+
+    def checkpoint(self, stamp):
+        # Called with the lock held.
+        self.lastCheckpoint = stamp
+        self.index.append((stamp, self.offset))
+        payload = bytearray(COUNTS.pack(len(self.modes), len(self.levels), len(self.frequencies),
+                                        len(self.duties)))
+        for item in self.modes.items():
+            payload += PIN.pack(*item)
+        for item in self.levels.items():
+            payload += PIN.pack(*item)
+        for item in self.frequencies.items():
+            payload += DUTY.pack(*item)
+        for item in self.duties.items():
+            payload += DUTY.pack(*item)
+        self.write(CHECKPOINT, stamp, payload)
+
+    def setup(self, pin, direction):
+        self.append(SETUP, PIN.pack(pin, direction), None, self.modes, ((pin, direction),))
+
+    def outputs(self, pins, values):
+        items = [(pin, 1 if value else 0) for pin, value in zip(pins, values)]
+        payload = bytearray()
+        for item in items:
+            payload += PIN.pack(*item)
+        self.append(OUTPUT, payload, None, self.levels, items)
+
+    def duty(self, pin, duty):
+        self.append(PWM, DUTY.pack(pin, duty), None, self.duties, ((pin, duty),))
+
+    def frequency(self, pin, frequency):
+        self.append(FREQUENCY, DUTY.pack(pin, frequency), None, self.frequencies, ((pin, frequency),))
+
+    def waveform(self, coils, chain, state, stamp):
+        payload = bytearray(COILS.pack(*(tuple(coils) + (state,))))
+        mask = state
+        for buffer in chain:
+            payload += buffer.tobytes()
+            if len(buffer):
+                mask = buffer.words[-1] & 0xF
+        items = [(pin, mask >> bit & 1) for bit, pin in enumerate(coils)]
+        self.append(WAVEFORM, payload, stamp, self.levels, items)
+
+    def __call__(self, stamp, level, name, fields):
+        """ Telemetry sink recording library calls. """
+        self.append(CALL, json.dumps([name, fields], default=repr).encode(), stamp)
+
+    def loop(self):
+        while True:
+            self.ready.wait(self.flushInterval)
+            self.ready.clear()
+            if self.drain():
+                return
+
+    def drain(self):
+        # The writing lock keeps buffers in order on disk without holding up append().
+        with self.writing:
+            with self.lock:
+                data = self.buffer
+                self.buffer = bytearray()
+                closed = self.closed
+            if data:
+                self.file.write(data)
+        return closed
+
+    def flush(self):
+        """ Writes everything recorded so far to the file. """
+        self.drain()
+        with self.writing:
+            self.file.flush()
+
+    def close(self):
+        """ Stops recording, writes the index and closes the file. """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.ready.set()
+        self.thread.join()
+        payload = b"".join(ENTRY.pack(*entry) for entry in self.index)
+        offset = self.offset
+        self.file.write(RECORD.pack(INDEX, perf_counter_ns() - self.start, len(payload)) + payload)
+        self.file.write(FOOTER.pack(offset, INDEX_MAGIC))
+        self.file.close()
+
+
+class JournalPWM:
+    """ PWM wrapper handed out by JournalBackend, records every duty cycle change. """
+    def __init__(self, journal, pwm, pin):
+        self.journal = journal
+        self.pwm = pwm
+        self.pin = pin
+
+    def start(self, duty):
+        self.journal.duty(self.pin, duty)
+        self.pwm.start(duty)
+
+    def ChangeDutyCycle(self, duty):
+        self.journal.duty(self.pin, duty)
+        self.pwm.ChangeDutyCycle(duty)
+
+    def ChangeFrequency(self, frequency):
+        self.journal.frequency(self.pin, frequency)
+        self.pwm.ChangeFrequency(frequency)
+
+    def stop(self):
+        self.journal.duty(self.pin, 0)
+        self.pwm.stop()
+
+    def __getattr__(self, name):
+        return getattr(self.pwm, name)
+
+
+class JournalBackend(Backend):
+    """ Backend wrapper recording every setup, output, duty cycle and waveform into a Journal.
+
+    Arguments:
+    backend = the Backend doing the actual writes.
+    journal = Journal.
+    """
+    name = "journal"
+
+    def __init__(self, backend, journal):
+        self.backend = backend
+        self.journal = journal
+        self.lock = backend.lock
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def setup(self, pin, direction):
+        self.journal.setup(pin, direction)
+        self.backend.setup(pin, direction)
+
+    def output(self, pin, value):
+        self.journal.outputs((pin,), (value,))
+        self.backend.output(pin, value)
+
+    def outputs(self, pins, values):
+        self.journal.outputs(pins, values)
+        self.backend.outputs(pins, values)
+
+    def input(self, pin):
+        return self.backend.input(pin)
+
+    def add_event_detect(self, pin, edge, callback, bouncetime=0):
+        self.backend.add_event_detect(pin, edge, callback, bouncetime)
+
+    def remove_event_detect(self, pin):
+        self.backend.remove_event_detect(pin)
+
+    def edge_time(self, pin):
+        return self.backend.edge_time(pin)
+
+    def PWM(self, pin, frequency):
+        self.journal.frequency(pin, frequency)
+        return JournalPWM(self.journal, self.backend.PWM(pin, frequency), pin)
+
+    def play_waveform(self, coils, chain, state, transitions, clock):
+        self.journal.waveform(coils, chain, state, perf_counter_ns())
+        return self.backend.play_waveform(coils, chain, state, transitions, clock)
+
+    def cleanup(self):
+        self.backend.cleanup()
+
+
+def install(path, events=None, **options):
+    """ Starts journaling the installed backend and the telemetry events into path.
+    Objects created afterwards are recorded; PWMs created before keep writing unrecorded.
+
+    Arguments:
+    path = str journal file.
+    events = optional telemetry.Telemetry to record library calls from, by default the shared hub.
+             The journal is added as a DEBUG sink, so every call is recorded without changing
+             what the hub's other sinks receive.
+    options = passed to Journal.
+
+    Returns the Journal, close() it to finish the file.
+    """
+    journal = Journal(path, **options)
+    current = backends.get_backend()
+    if isinstance(current, ShadowRegister):
+        current.backend = JournalBackend(current.backend, journal)
+    else:
+        backends.set_backend(JournalBackend(current, journal), shadow=False)
+    if events is None:
+        from telemetry import events
+    events.addSink(journal, DEBUG)
+    return journal
+
+
+class Replay:
+    """ Reads a journal and re-drives a backend from it.
+
+    Arguments:
+    path = str journal file.
+
+    Attributes:
+    start = int perf_counter_ns time the journal was started at.
+    wallclock = float time.time() the journal was started at.
+    index = list of (stamp_ns, offset) checkpoint entries.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as source:
+            data = source.read(HEADER.size)
+            magic, self.start, self.wallclock = HEADER.unpack(data)
+            if magic != MAGIC:
+                raise ValueError("%s is not a PiMotor journal" % path)
+            self.index = self.readIndex(source)
+
+    def readIndex(self, source):
+        source.seek(0, 2)
+        size = source.tell()
+        if size >= HEADER.size + RECORD.size + FOOTER.size:
+            source.seek(size - FOOTER.size)
+            offset, magic = FOOTER.unpack(source.read(FOOTER.size))
+            if magic == INDEX_MAGIC:
+                source.seek(offset)
+                kind, stamp, length = RECORD.unpack(source.read(RECORD.size))
+                return [entry for entry in ENTRY.iter_unpack(source.read(length))]
+        # Never closed: rebuild the index from the record headers.
+        index = []
+        offset = HEADER.size
+        source.seek(offset)
+        while True:
+            header = source.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return index
+            kind, stamp, length = RECORD.unpack(header)
+            if kind == CHECKPOINT:
+                index.append((stamp, offset))
+            offset += RECORD.size + length
+            source.seek(offset)
+
+    def records(self, start=0.0):
+        """ Yields (stamp_ns, kind, payload) from the last checkpoint at or before start seconds. """
+        begin = int(start * 1e9)
+        offset = HEADER.size
+        for stamp, position in self.index:
+            if stamp > begin:
+                break
+            offset = position
+        with open(self.path, "rb") as source:
+            source.seek(offset)
+            while True:
+                header = source.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return
+                kind, stamp, length = RECORD.unpack(header)
+                if kind == INDEX:
+                    return
+                payload = source.read(length)
+                if len(payload) < length:
+                    return
+                yield stamp, kind, payload
+
+    def calls(self, start=0.0):
+        """ Yields the recorded library calls as (seconds, name, fields). """
+        begin = int(start * 1e9)
+        for stamp, kind, payload in self.records(start):
+            if kind == CALL and stamp >= begin:
+                name, fields = json.loads(payload.decode())
+                yield stamp / 1e9, name, fields
+
+    def play(self, backend, speed=1.0, start=0.0, end=None, calls=None):
+        """ Re-drives a backend from the journal.
+
+        Arguments:
+        backend = Backend to drive, e.g. a SimulatedBackend or the real hardware.
+        speed = float, 1 replays in real time, 10 ten times faster, None as fast as possible.
+        start = float seconds into the journal to start from.  The pin state at that point is
+                restored from the nearest checkpoint and the records up to start are applied
+                without waiting.
+        end = optional float seconds into the journal to stop at.
+        calls = optional callable(seconds, name, fields) receiving the recorded library calls.
+
+        Returns the number of records replayed.
+        """
+        begin = int(start * 1e9)
+        finish = None if end is None else int(end * 1e9)
+        clock = StepClock()
+        pwms = {}
+        frequencies = {}
+        played = 0
+        last = begin
+        clock.start()
+        for stamp, kind, payload in self.records(start):
+            if finish is not None and stamp > finish:
+                break
+            if stamp >= begin and speed:
+                clock.wait((stamp - last) / 1e9 / speed)
+                last = stamp
+            if kind == OUTPUT:
+                pins = payload[0::2]
+                values = payload[1::2]
+                backend.outputs(list(pins), list(values))
+            elif kind == PWM:
+                pin, duty = DUTY.unpack(payload)
+                self.pwm(backend, pwms, frequencies, pin).ChangeDutyCycle(duty)
+            elif kind == FREQUENCY:
+                self.frequency(pwms, frequencies, *DUTY.unpack(payload))
+            elif kind == SETUP:
+                backend.setup(*PIN.unpack(payload))
+            elif kind == CHECKPOINT:
+                self.restore(backend, pwms, frequencies, payload)
+            elif kind == WAVEFORM:
+                last = self.waveform(backend, payload, stamp, begin, finish, speed, clock, last)
+            elif kind == CALL:
+                if calls is not None and stamp >= begin:
+                    name, fields = json.loads(payload.decode())
+                    calls(stamp / 1e9, name, fields)
+            played += 1
+        return played
+
+    def pwm(self, backend, pwms, frequencies, pin):
+        # PWMs are created on their first duty cycle, at the frequency recorded for the pin.
+        # PWMs created before the journal was installed have none, they get the library's 50 Hz.
+        pwm = pwms.get(pin)
+        if pwm is None:
+            pwm = pwms[pin] = backend.PWM(pin, frequencies.get(pin, 50))
+            pwm.start(0)
+        return pwm
+
+    def frequency(self, pwms, frequencies, pin, frequency):
+        if frequencies.get(pin) == frequency:
+            return
+        frequencies[pin] = frequency
+        if pin in pwms:
+            pwms[pin].ChangeFrequency(frequency)
+
+    def restore(self, backend, pwms, frequencies, payload):
+        modes, levels, rates, duties = COUNTS.unpack_from(payload)
+        offset = COUNTS.size
+        for n in range(modes):
+            backend.setup(*PIN.unpack_from(payload, offset))
+            offset += PIN.size
+        pins = []
+        values = []
+        for n in range(levels):
+            pin, value = PIN.unpack_from(payload, offset)
+            pins.append(pin)
+            values.append(value)
+            offset += PIN.size
+        if pins:
+            backend.outputs(pins, values)
+        for n in range(rates):
+            self.frequency(pwms, frequencies, *DUTY.unpack_from(payload, offset))
+            offset += DUTY.size
+        for n in range(duties):
+            pin, duty = DUTY.unpack_from(payload, offset)
+            self.pwm(backend, pwms, frequencies, pin).ChangeDutyCycle(duty)
+            offset += DUTY.size
+
+    def waveform(self, backend, payload, stamp, begin, finish, speed, clock, last):
+        import PiMotor
+        values = COILS.unpack_from(payload)
+        coils, state = values[:4], values[4]
+        transitions = PiMotor.Stepper.compileTransitions(coils)
+        words = memoryview(payload)[COILS.size:].cast("I")
+        for word in words:
+            stamp += (word >> 4) * 1000
+            if finish is not None and stamp > finish:
+                break
+            if stamp >= begin and speed:
+                clock.wait((stamp - last) / 1e9 / speed)
+                last = stamp
+            mask = word & 0xF
+            change = transitions[state << 4 | mask]
+            if change:
+                backend.outputs(*change)
+            state = mask
+        return last
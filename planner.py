@@ -0,0 +1,186 @@
+"""
+Look-ahead motion planning for the Stepper class.
+
+Calling Stepper.forward once per move makes every move start and end at a standstill.
+MotionPlanner buffers a queue of segments instead and plans the speed at every junction
+across the whole queue: consecutive moves in the same direction keep their speed through
+the boundary, and the motor only slows down where the next segment is slower, reverses,
+or the queue ends.  The queue is then played as one continuous step stream, so the coil
+phase also carries on from one segment into the next.
+
+Speeds are in steps per second and accelerations in steps per second squared.
+
+example:
+    planner = MotionPlanner(motor, accel=4000, startSpeed=100)
+    planner.append("forward", 400, 800)
+    planner.append("forward", 200, 400)
+    planner.append("backward", 600, 1000)
+    planner.execute()
+"""
+import math
+
+
+class Segment:
+    """ One buffered move.
+
+    Arguments:
+    direction = "forward" or "backward".
+    steps = int number of steps.
+    speed = float cruise speed in steps/s.
+    accel = float acceleration limit in steps/s^2.
+
+    Attributes filled in by MotionPlanner.plan:
+    entry = float speed at the start of the segment.
+    exit = float speed at the end of the segment.
+    """
+    def __init__(self, direction, steps, speed, accel):
+        if direction not in ("forward", "backward"):
+            raise ValueError("direction must be 'forward' or 'backward'")
+        self.direction = direction
+        self.steps = int(steps)
+        self.speed = float(speed)
+        self.accel = float(accel)
+        self.entry = 0.0
+        self.exit = 0.0
+
+    def __repr__(self):
+        return "Segment(%s, %d steps, %.1f -> %.1f -> %.1f steps/s)" % (
+            self.direction, self.steps, self.entry, self.speed, self.exit)
+
+
+class MotionPlanner:
+    """ Plans and executes a queue of stepper segments without stopping between them.
+
+    Arguments:
+    stepper = PiMotor.Stepper instance.
+    accel = float default acceleration limit in steps/s^2.
+    startSpeed = float speed the motor can start, stop and reverse at without losing steps.
+    profile = "trapezoid" for constant acceleration ramps or "scurve" for jerk limited ramps
+              that ease in and out of the acceleration.
+    """
+    profiles = ("trapezoid", "scurve")
+
+    def __init__(self, stepper, accel=2000.0, startSpeed=50.0, profile="trapezoid"):
+        if profile not in self.profiles:
+            raise ValueError("profile must be one of %s" % (self.profiles,))
+        self.stepper = stepper
+        self.accel = accel
+        self.startSpeed = startSpeed
+        self.profile = profile
+        self.queue = []
+
+    def append(self, direction, steps, speed, accel=None):
+        """ Adds a segment to the end of the queue and returns it. """
+        segment = Segment(direction, steps, max(speed, self.startSpeed), accel or self.accel)
+        if segment.steps > 0:
+            self.queue.append(segment)
+        return segment
+
+    def clear(self):
+        self.queue = []
+
+    def effectiveAccel(self, segment):
+        # The S-curve ramp peaks at 1.5x its average acceleration, so it is planned with
+        # a proportionally lower average to keep the peak within the segment's limit.
+        if self.profile == "scurve":
+            return segment.accel / 1.5
+        return segment.accel
+
+    def plan(self):
+        """ Computes the entry and exit speed of every queued segment.
+
+        A backward pass limits each junction to the speed from which the rest of the queue
+        can still decelerate in time, a forward pass then limits it to the speed reachable
+        from the start.  Returns the queue.
+        """
+        queue = self.queue
+        start = self.startSpeed
+        # Highest speed allowed at each junction before considering acceleration.
+        for index, segment in enumerate(queue):
+            previous = queue[index - 1] if index else None
+            if previous is None or previous.direction != segment.direction:
+                segment.entry = start
+            else:
+                segment.entry = min(previous.speed, segment.speed)
+        following = start
+        for segment in reversed(queue):
+            segment.exit = following
+            reachable = math.sqrt(segment.exit ** 2 + 2 * self.effectiveAccel(segment) * segment.steps)
+            segment.entry = min(segment.entry, reachable)
+            following = segment.entry
+        previous = start
+        for segment in queue:
+            segment.entry = min(segment.entry, previous)
+            reachable = math.sqrt(segment.entry ** 2 + 2 * self.effectiveAccel(segment) * segment.steps)
+            segment.exit = min(segment.exit, reachable)
+            previous = segment.exit
+        return queue
+
+    def delays(self, segment):
+        """ Yields the delay before each step of a planned segment. """
+        accel = self.effectiveAccel(segment)
+        entry2 = segment.entry ** 2
+        exit2 = segment.exit ** 2
+        steps = segment.steps
+        # Peak speed is the cruise speed, or lower when the ramps meet in the middle.
+        peak2 = min(segment.speed ** 2, (2 * accel * steps + entry2 + exit2) / 2)
+        peak2 = max(peak2, entry2, exit2)
+        up = (peak2 - entry2) / (2 * accel)
+        down = (peak2 - exit2) / (2 * accel)
+        scurve = self.profile == "scurve"
+        for index in range(steps):
+            x = index + 0.5
+            if x < up:
+                ratio = x / up
+                if scurve:
+                    ratio = ratio * ratio * (3 - 2 * ratio)
+                speed2 = entry2 + (peak2 - entry2) * ratio
+            elif x > steps - down:
+                ratio = (steps - x) / down
+                if scurve:
+                    ratio = ratio * ratio * (3 - 2 * ratio)
+                speed2 = exit2 + (peak2 - exit2) * ratio
+            else:
+                speed2 = peak2
+            yield 1.0 / math.sqrt(speed2)
+
+    def stream(self):
+        """ Yields the (mask, delay) pairs for the whole planned queue, see Stepper.play.
+        Backward segments step through the same phase ring in the opposite direction so the
+        coil sequence stays continuous across reversals.
+        """
+        phases = self.stepper.forwardPhases
+        count = len(phases)
+        # Carry on from the phase the stepper was left in.
+        phase = -1 if self.stepper.phase is None else self.stepper.phase
+        for segment in self.queue:
+            step = 1 if segment.direction == "forward" else -1
+            for delay in self.delays(segment):
+                phase = (phase + step) % count
+                yield phases[phase], delay
+
+    def execute(self, move=None):
+        """ Plans the queued segments, plays them on the stepper and empties the queue.
+
+        Arguments:
+        move = optional executor.MoveHandle for progress and cancellation.
+
+        Returns the number of steps taken.
+        """
+        self.plan()
+        taken = 0
+        try:
+            taken = self.stepper.play(self.stream(), move)
+            return taken
+        finally:
+            self.track(taken)
+            self.clear()
+
+    def track(self, taken):
+        """ Adds the net travel of the first taken steps of the queue to the stepper's position. """
+        travel = 0
+        for segment in self.queue:
+            steps = min(taken, segment.steps)
+            travel += steps if segment.direction == "forward" else -steps
+            taken -= steps
+        self.stepper.halfSteps += travel * self.stepper.unit
@@ -0,0 +1,121 @@
+"""
+Acceleration limited duty cycle ramps for the DC Motor class.
+
+A single RampEngine thread services every motor with a ramp in progress at a fixed tick,
+moving each duty cycle towards its target by at most `rate` percent per second.  Starting
+a ramp only records the target and returns immediately, so any number of motors can soft
+start or change speed without a sleep loop, or a thread, per motor.  A ramp that changes
+direction passes through zero before speeding up the other way.
+
+Speeds are signed duty cycle percentages, negative values run the motor in reverse.
+
+example:
+    m1.speed(80, rate=100)     # returns at once, reaches 80% after 0.8 s
+    m2.speed(-50, rate=200)
+"""
+import threading
+import time
+
+_engine = None
+_lock = threading.Lock()
+
+
+def get_engine():
+    """ Returns the RampEngine shared by every Motor. """
+    global _engine
+    with _lock:
+        if _engine is None:
+            _engine = RampEngine()
+        return _engine
+
+
+class RampEngine:
+    """ Timer thread applying duty cycle ramps.
+
+    Arguments:
+    tick = float seconds between duty cycle updates.
+    """
+    def __init__(self, tick=0.02):
+        self.tick = tick
+        self.ramps = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    def start(self, motor, target, rate, done=None):
+        """ Ramps motor towards target.  Replaces any ramp already running on the motor.
+
+        Arguments:
+        motor = PiMotor.Motor.
+        target = float signed duty cycle from -100 to 100.
+        rate = float maximum change in duty cycle percentage per second.
+        done = optional callable(motor, reached), called once the ramp is over.  reached is True
+               when the target was reached, from the engine thread, and False when the ramp was
+               cancelled or replaced first, from the thread that did so.
+        """
+        target = max(-100.0, min(100.0, float(target)))
+        with self.lock:
+            previous = self.ramps.get(motor)
+            self.ramps[motor] = (target, rate, done)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.loop, name="RampEngine")
+                self.thread.daemon = True
+                self.thread.start()
+        self.wake.set()
+        if previous is not None and previous[2] is not None:
+            previous[2](motor, False)
+
+    def cancel(self, motor):
+        """ Stops ramping the motor, leaving it at its current duty cycle. """
+        with self.lock:
+            previous = self.ramps.pop(motor, None)
+        if previous is not None and previous[2] is not None:
+            previous[2](motor, False)
+
+    def active(self, motor):
+        return motor in self.ramps
+
+    def loop(self):
+        deadline = time.monotonic()
+        while True:
+            with self.lock:
+                idle = not self.ramps
+                if idle:
+                    self.wake.clear()
+            if idle:
+                self.wake.wait()
+                deadline = time.monotonic()
+            finished = self.update()
+            for motor, done in finished:
+                if done is not None:
+                    done(motor, True)
+            deadline += self.tick
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.monotonic()
+
+    def update(self):
+        """ Advances every ramp by one tick.  Returns the (motor, done) pairs that finished. """
+        finished = []
+        with self.lock:
+            ramps = list(self.ramps.items())
+        for motor, entry in ramps:
+            target, rate, done = entry
+            current = motor.current
+            limit = rate * self.tick
+            step = target if current * target >= 0 else 0.0
+            if abs(step - current) <= limit:
+                value = step
+            else:
+                value = current + (limit if step > current else -limit)
+            with self.lock:
+                # The ramp may have been replaced or cancelled while this tick was computed.
+                if self.ramps.get(motor) is not entry:
+                    continue
+                motor.drive(value)
+                if value == target:
+                    del self.ramps[motor]
+                    finished.append((motor, done))
+        return finished
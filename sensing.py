@@ -0,0 +1,108 @@
+"""
+Sample storage and background ranging for the Sensor class.
+
+RingBuffer keeps the most recent readings of a sensor in fixed size arrays, so recording a
+sample never allocates.  Ranger pings an ultrasonic Sensor from a background thread at a
+fixed rate and publishes every reading into the sensor's history, letting Sensor.trigger()
+and Sensor.lastRead return a fresh value without waiting for an echo.
+
+example:
+    sensor = PiMotor.Sensor("ULTRASONIC", 20)
+    sensor.startRanging(rate=15)
+    while True:
+        if sensor.trigger():
+            motors.stop()
+"""
+import threading
+import time
+from array import array
+
+
+class RingBuffer:
+    """ Fixed size history of float samples with their perf_counter_ns timestamps.
+
+    Arguments:
+    size = int, number of samples kept.  Older samples are overwritten.
+    """
+    def __init__(self, size=64):
+        self.size = size
+        self.values = array("d", bytes(8 * size))
+        self.stamps = array("q", bytes(8 * size))
+        self.index = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, value, stamp=None):
+        """ Stores a sample, stamp defaults to now. """
+        index = self.index
+        self.values[index] = value
+        self.stamps[index] = time.perf_counter_ns() if stamp is None else stamp
+        index += 1
+        self.index = 0 if index == self.size else index
+        if self.count < self.size:
+            self.count += 1
+
+    def latest(self):
+        """ Returns the newest (value, stamp) pair, or None when empty. """
+        if not self.count:
+            return None
+        index = self.index - 1
+        return self.values[index], self.stamps[index]
+
+    def age(self):
+        """ Seconds since the newest sample was stored, or None when empty. """
+        if not self.count:
+            return None
+        return (time.perf_counter_ns() - self.stamps[self.index - 1]) / 1e9
+
+    def ordered(self):
+        """ Returns the stored values oldest first. """
+        if self.count < self.size:
+            return self.values[:self.count]
+        return self.values[self.index:] + self.values[:self.index]
+
+    def clear(self):
+        self.index = 0
+        self.count = 0
+
+
+class Ranger:
+    """ Background thread pinging an ultrasonic Sensor at a fixed rate.
+
+    Arguments:
+    sensor = PiMotor.Sensor configured as "ULTRASONIC".
+    rate = float pings per second.  HC-SR04 style sensors need about 60 ms between pings.
+    """
+    def __init__(self, sensor, rate=15.0):
+        self.sensor = sensor
+        self.period = 1.0 / rate
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.loop, name="Ranger")
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self, wait=True):
+        self.stopped.set()
+        if wait and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    @property
+    def running(self):
+        return self.thread.is_alive() and not self.stopped.is_set()
+
+    def loop(self):
+        sensor = self.sensor
+        deadline = time.monotonic()
+        while not self.stopped.is_set():
+            sensor.record(sensor.ping())
+            deadline += self.period
+            now = time.monotonic()
+            if deadline < now:
+                # Fell behind, e.g. after a missed echo: restart the schedule instead of bursting.
+                deadline = now
+            self.stopped.wait(deadline - now)
@@ -0,0 +1,378 @@
+"""
+Network control server for the Motor Shield.
+
+ControlServer exposes the Motor, LinkedMotors, Stepper, Arrow and Sensor operations of a
+shield.Shield over TCP or a Unix socket, so any number of local clients can drive the shield
+with one round trip per batch of commands.
+
+Wire format, all little endian:
+
+    request  = header (sequence uint16, count uint16) + count * command
+    command  = opcode uint8, channel uint8, value float32, arg int32          (10 bytes)
+    reply    = kind uint8 (REPLY), sequence uint16, count uint16 + count * result
+    result   = status uint8 (OK or ERROR), value float32                      (5 bytes)
+    reading  = kind uint8 (READING), channel uint8, value float32, stamp int64 (perf_counter_ns)
+
+Each request is answered by one reply with the same sequence number and one result per
+command, in order.  Requests may be pipelined: a client can send further requests before the
+replies arrive.  Stepper moves are queued on the stepper's executor worker and acknowledged
+straight away; STEPPER_WAIT answers once the queued moves are done.  SENSOR_STREAM pushes
+reading frames at the requested rate until it is sent again with a rate of 0.
+
+Channels: motors 1-4, LINKED_* take a bitmask of motors (bit 0 = MOTOR1), steppers 1-2,
+arrows 1-4 and sensors 1 (IR1), 2 (IR2) and 3 (ULTRASONIC).
+
+example:
+    python server.py --sim --port 8750
+
+    client = await ControlClient.connect("127.0.0.1", 8750)
+    await client.batch([(MOTOR_FORWARD, 1, 60.0, 0), (STEPPER_FORWARD, 1, 0.002, 400)])
+"""
+import argparse
+import asyncio
+import struct
+import time
+
+import PiMotor
+import aio
+import shield
+from executor import MoveCancelled
+from telemetry import events, WARNING
+
+REQUEST_HEADER = struct.Struct("<HH")
+COMMAND = struct.Struct("<BBfi")
+REPLY_HEADER = struct.Struct("<BHH")
+RESULT = struct.Struct("<Bf")
+READING = struct.Struct("<BBfq")
+
+REPLY = 0
+READING_FRAME = 1
+
+OK = 0
+ERROR = 1
+
+MOTOR_FORWARD = 1      # value = duty cycle
+MOTOR_REVERSE = 2      # value = duty cycle
+MOTOR_STOP = 3
+MOTOR_SPEED = 4        # value = signed duty cycle, arg = ramp rate in percent per second
+LINKED_DRIVE = 5       # channel = motor bitmask, value = signed duty cycle; result = skew in s
+LINKED_STOP = 6        # channel = motor bitmask
+STEPPER_FORWARD = 7    # value = delay in s, arg = steps
+STEPPER_BACKWARD = 8   # value = delay in s, arg = steps
+STEPPER_STOP = 9       # cancels queued moves and de-energizes the coils
+STEPPER_WAIT = 10      # result = steps taken by the last queued move
+STEPPER_MODE = 11      # arg = 0 single, 1 double, 2 half, 4, 8 or 16 microsteps per step
+ARROW_ON = 12
+ARROW_OFF = 13
+SENSOR_READ = 14       # result = distance in cm (ULTRASONIC) or 1.0/0.0 (IR)
+SENSOR_STREAM = 15     # value = readings per second, 0 stops the stream
+
+sensorNames = {1: "IR1", 2: "IR2", 3: "ULTRASONIC"}
+stepperModes = {0: "single", 1: "double", 2: "half"}
+microResolutions = (4, 8, 16)
+
+
+class ControlServer:
+    """ asyncio server executing batched shield commands.
+
+    Arguments:
+    board = optional shield.Shield, defaults to shield.get_shield().
+    executor = optional executor.StepperExecutor, defaults to the one shared with aio.
+    boundary = int, boundary given to sensors created by the server.
+    """
+    def __init__(self, board=None, executor=None, boundary=20):
+        self.board = board or shield.get_shield()
+        self.executor = executor or aio.get_executor()
+        self.boundary = boundary
+        self.linked = {}
+        self.moves = {}
+        self.sensors = {}
+        self.servers = []
+        self.connections = set()
+        self.handlers = {
+            MOTOR_FORWARD: self.motorForward, MOTOR_REVERSE: self.motorReverse,
+            MOTOR_STOP: self.motorStop, MOTOR_SPEED: self.motorSpeed,
+            LINKED_DRIVE: self.linkedDrive, LINKED_STOP: self.linkedStop,
+            STEPPER_FORWARD: self.stepperForward, STEPPER_BACKWARD: self.stepperBackward,
+            STEPPER_STOP: self.stepperStop, STEPPER_WAIT: self.stepperWait,
+            STEPPER_MODE: self.stepperMode, ARROW_ON: self.arrowOn, ARROW_OFF: self.arrowOff,
+            SENSOR_READ: self.sensorRead, SENSOR_STREAM: self.sensorStream,
+        }
+
+    async def start(self, host="127.0.0.1", port=8750):
+        """ Listens on a TCP port.  Returns the asyncio server. """
+        server = await asyncio.start_server(self.serve, host, port)
+        self.servers.append(server)
+        return server
+
+    async def startUnix(self, path):
+        """ Listens on a Unix socket.  Returns the asyncio server. """
+        server = await asyncio.start_unix_server(self.serve, path)
+        self.servers.append(server)
+        return server
+
+    async def close(self):
+        """ Stops listening and drops every connected client. """
+        for server in self.servers:
+            server.close()
+        for connection in list(self.connections):
+            connection.close()
+        for server in self.servers:
+            await server.wait_closed()
+        del self.servers[:]
+
+    async def serve(self, reader, writer):
+        connection = Connection(writer)
+        self.connections.add(connection)
+        handlers = self.handlers
+        try:
+            while True:
+                sequence, count = REQUEST_HEADER.unpack(await reader.readexactly(REQUEST_HEADER.size))
+                body = await reader.readexactly(count * COMMAND.size)
+                reply = bytearray(REPLY_HEADER.pack(REPLY, sequence, count))
+                for opcode, channel, value, arg in COMMAND.iter_unpack(body):
+                    try:
+                        result = handlers[opcode](connection, channel, value, arg)
+                        if asyncio.iscoroutine(result):
+                            result = await result
+                        reply += RESULT.pack(OK, result or 0.0)
+                    except Exception as error:
+                        if events.warning:
+                            events.emit(WARNING, "server.command_failed", opcode=opcode,
+                                        channel=channel, error=repr(error))
+                        reply += RESULT.pack(ERROR, 0.0)
+                writer.write(reply)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections.discard(connection)
+            connection.close()
+
+    def motor(self, channel):
+        return self.board.motor("MOTOR%d" % channel)
+
+    def group(self, mask):
+        group = self.linked.get(mask)
+        if group is None:
+            motors = [self.motor(n + 1) for n in range(4) if mask >> n & 1]
+            if not motors:
+                raise ValueError("empty motor mask")
+            group = self.linked[mask] = PiMotor.LinkedMotors(*motors)
+        return group
+
+    def stepper(self, channel):
+        return self.board.stepper("STEPPER%d" % channel)
+
+    def sensor(self, channel):
+        sensor = self.sensors.get(channel)
+        if sensor is None:
+            sensor = self.sensors[channel] = aio.AsyncSensor(
+                self.board.sensor(sensorNames[channel], self.boundary))
+        return sensor
+
+    def motorForward(self, connection, channel, value, arg):
+        self.motor(channel).forward(value)
+
+    def motorReverse(self, connection, channel, value, arg):
+        self.motor(channel).reverse(value)
+
+    def motorStop(self, connection, channel, value, arg):
+        self.motor(channel).stop()
+
+    def motorSpeed(self, connection, channel, value, arg):
+        self.motor(channel).speed(value, arg or 200.0)
+
+    def linkedDrive(self, connection, channel, value, arg):
+        group = self.group(channel)
+        group.drive(value)
+        return group.skew
+
+    def linkedStop(self, connection, channel, value, arg):
+        group = self.group(channel)
+        group.stop()
+        return group.skew
+
+    def queue(self, channel, move):
+        moves = [pending for pending in self.moves.get(channel, ()) if not pending.done()]
+        moves.append(move)
+        self.moves[channel] = moves
+
+    def stepperForward(self, connection, channel, value, arg):
+        self.queue(channel, self.executor.forward(self.stepper(channel), value, arg))
+
+    def stepperBackward(self, connection, channel, value, arg):
+        self.queue(channel, self.executor.backward(self.stepper(channel), value, arg))
+
+    def stepperStop(self, connection, channel, value, arg):
+        for move in self.moves.pop(channel, ()):
+            move.cancel()
+        stepper = self.stepper(channel)
+        # Runs on the stepper's worker so it lands after the cancelled move has let go of the coils.
+        self.queue(channel, self.executor.submit(stepper, lambda move: stepper.stop() or 0, 0))
+
+    async def stepperWait(self, connection, channel, value, arg):
+        moves = self.moves.get(channel)
+        if not moves:
+            return 0
+        move = moves[-1]
+        try:
+            return await aio.wait_move(move)
+        except MoveCancelled:
+            # Stopped by a STEPPER_STOP, answered with the steps taken.  Anything else the
+            # move raised is answered with ERROR.
+            return move.completed
+
+    def stepperMode(self, connection, channel, value, arg):
+        if arg not in stepperModes and arg not in microResolutions:
+            raise ValueError("unknown stepper mode %d" % arg)
+        stepper = self.stepper(channel)
+        mode = stepperModes.get(arg, "micro")
+        self.queue(channel, self.executor.submit(stepper, lambda move: stepper.setMode(mode, arg) or 0, 0))
+
+    def arrowOn(self, connection, channel, value, arg):
+        self.board.arrow(channel).on()
+
+    def arrowOff(self, connection, channel, value, arg):
+        self.board.arrow(channel).off()
+
+    async def sensorRead(self, connection, channel, value, arg):
+        sensor = self.sensor(channel)
+        triggered = await sensor.trigger()
+        if channel == 3:
+            return sensor.sensor.filtered
+        return 1.0 if triggered else 0.0
+
+    def sensorStream(self, connection, channel, value, arg):
+        connection.stopStream(channel)
+        if value > 0:
+            connection.streams[channel] = asyncio.ensure_future(
+                self.stream(connection, channel, 1.0 / value))
+
+    async def stream(self, connection, channel, period):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            reading = await self.sensorRead(connection, channel, 0.0, 0)
+            connection.writer.write(READING.pack(READING_FRAME, channel, reading, time.perf_counter_ns()))
+            deadline += period
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+
+class Connection:
+    """ Per client state of a ControlServer. """
+    def __init__(self, writer):
+        self.writer = writer
+        self.streams = {}
+
+    def stopStream(self, channel):
+        task = self.streams.pop(channel, None)
+        if task is not None:
+            task.cancel()
+
+    def close(self):
+        for channel in list(self.streams):
+            self.stopStream(channel)
+        self.writer.close()
+
+
+class ControlClient:
+    """ asyncio client for ControlServer.
+
+    Commands are (opcode, channel, value, arg) tuples.  send() writes a batch and returns a
+    future of its results without waiting, so several batches can be in flight at once.
+
+    Attributes:
+    readings = asyncio.Queue of (channel, value, stamp) tuples pushed by SENSOR_STREAM.
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.sequence = 0
+        self.pending = {}
+        self.readings = asyncio.Queue()
+        self.task = asyncio.ensure_future(self.receive())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8750):
+        return cls(*await asyncio.open_connection(host, port))
+
+    @classmethod
+    async def connectUnix(cls, path):
+        return cls(*await asyncio.open_unix_connection(path))
+
+    def send(self, commands):
+        """ Sends a batch of commands.  Returns a future resolving to a list of
+        (status, value) tuples, one per command.
+        """
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        frame = bytearray(REQUEST_HEADER.pack(self.sequence, len(commands)))
+        for command in commands:
+            frame += COMMAND.pack(*command)
+        future = self.pending[self.sequence] = asyncio.get_running_loop().create_future()
+        self.writer.write(frame)
+        return future
+
+    async def batch(self, commands):
+        """ Sends a batch of commands and waits for its results. """
+        future = self.send(commands)
+        await self.writer.drain()
+        return await future
+
+    async def call(self, opcode, channel=0, value=0.0, arg=0):
+        """ Sends a single command and returns its value, raising RuntimeError if it failed. """
+        status, result = (await self.batch([(opcode, channel, value, arg)]))[0]
+        if status != OK:
+            raise RuntimeError("command %d on channel %d failed" % (opcode, channel))
+        return result
+
+    async def receive(self):
+        reader = self.reader
+        try:
+            while True:
+                kind = (await reader.readexactly(1))[0]
+                if kind == READING_FRAME:
+                    frame = await reader.readexactly(READING.size - 1)
+                    self.readings.put_nowait(READING.unpack(bytes((kind,)) + frame)[1:])
+                    continue
+                sequence, count = REQUEST_HEADER.unpack(await reader.readexactly(REQUEST_HEADER.size))
+                body = await reader.readexactly(count * RESULT.size)
+                future = self.pending.pop(sequence, None)
+                if future is not None and not future.done():
+                    future.set_result(list(RESULT.iter_unpack(body)))
+        except (asyncio.IncompleteReadError, ConnectionError) as error:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection closed: %r" % error))
+            self.pending.clear()
+
+    async def close(self):
+        self.writer.close()
+        self.task.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Motor Shield control server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8750)
+    parser.add_argument("--unix", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--sim", action="store_true", help="use the simulated backend")
+    options = parser.parse_args()
+    if options.sim:
+        import backend
+        backend.set_backend(backend.SimulatedBackend(record=False))
+
+    async def run():
+        server = ControlServer()
+        if options.unix:
+            listener = await server.startUnix(options.unix)
+        else:
+            listener = await server.start(options.host, options.port)
+        async with listener:
+            await listener.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Shared, lazily initialized access to the channels of the Motor Shield.
+
+Creating PiMotor objects directly configures their pins straight away, every Motor builds its
+own Arrow, and nothing stops a Stepper from reconfiguring pins a Motor is already driving
+(STEPPER1 shares pins 11, 13 and 15 with MOTOR1).  A Shield hands out one object per channel
+instead:
+
+    - The pins of each channel are claimed when it is first requested, and a channel whose pins
+      are already claimed by another one raises PinConflict before any hardware is touched.
+      claim() checks a whole layout up front.
+    - Objects are created on first use.  Until an attribute of the returned channel is used,
+      neither the backend nor any pin is touched, so building a Shield and importing the
+      library are instant and work off-Pi.  Once initialized the channel is the plain PiMotor
+      object, so there is no wrapper cost on later calls.
+    - Motors share the shield's Arrow objects instead of creating their own.
+
+example:
+    board = shield.get_shield()
+    board.claim("MOTOR3", "MOTOR4", "STEPPER1")
+    left = board.motor("MOTOR3")
+    right = board.motor("MOTOR4")
+    lift = board.stepper("STEPPER1")
+"""
+import threading
+
+import PiMotor
+
+_shield = None
+_lock = threading.Lock()
+
+
+def get_shield():
+    """ Returns the Shield shared by the whole process. """
+    global _shield
+    with _lock:
+        if _shield is None:
+            _shield = Shield()
+        return _shield
+
+
+class PinConflict(ValueError):
+    """ Raised when two channels of a Shield need the same pin. """
+
+
+def channelPins(name):
+    """ Returns the set of pins a channel drives or reads.
+
+    Arguments:
+    name = str channel label, i.e. "MOTOR1", "STEPPER2", "ARROW3", "IR1" or "ULTRASONIC".
+    """
+    if name in PiMotor.Motor.motorpins:
+        return set(PiMotor.Motor.motorpins[name]["config"][1].values())
+    if name in PiMotor.Stepper.stepperpins:
+        return set(PiMotor.Stepper.stepperpins[name].values())
+    if name in PiMotor.Sensor.sensorpins:
+        config = PiMotor.Sensor.sensorpins[name]
+        return set(config[key] for key in ("trigger", "echo") if key in config)
+    if name.startswith("ARROW") and int(name[5:]) in PiMotor.Arrow.arrowpins:
+        return {PiMotor.Arrow.arrowpins[int(name[5:])]}
+    raise KeyError("unknown channel %r" % name)
+
+
+class Pending:
+    """ Placeholder for a channel that has not been initialized yet.
+
+    The first attribute lookup turns the placeholder into the real object in place: the object
+    is constructed separately, then its attributes are moved over and the class is swapped, so
+    references handed out earlier keep working and later lookups go straight to the object.
+    Until the constructor has returned the placeholder stays a Pending, so no other thread
+    can see a half initialized object.
+    """
+    def __init__(self, cls, args, kwargs):
+        self.__dict__["_pending"] = (cls, args, kwargs, threading.Lock())
+
+    def __getattr__(self, name):
+        pending = self.__dict__.get("_pending")
+        if pending is None:
+            raise AttributeError(name)
+        with pending[3]:
+            if type(self) is Pending:
+                cls, args, kwargs, lock = pending
+                built = cls.__new__(cls)
+                cls.__init__(built, *args, **kwargs)
+                self.__dict__.update(built.__dict__)
+                self.__class__ = cls
+                del self.__dict__["_pending"]
+        return getattr(self, name)
+
+
+class Shield:
+    """ Registry of the channels of one Motor Shield.
+
+    Arguments:
+    backend = optional GPIO backend, defaults to backend.get_backend() when the first channel
+              is initialized.
+
+    Attributes:
+    claims = dict mapping pin number to the label of the channel using it.
+    channels = dict mapping channel label to its object.
+    """
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.claims = {}
+        self.channels = {}
+        self.configs = {}
+        self.lock = threading.RLock()
+
+    def claim(self, *names):
+        """ Reserves the pins of several channels at once, checking the whole layout before
+        reserving anything.  Raises PinConflict naming the channels that overlap.
+        """
+        with self.lock:
+            wanted = {}
+            for name in names:
+                for pin in channelPins(name):
+                    owner = self.claims.get(pin, wanted.get(pin))
+                    if owner is not None and owner != name:
+                        raise PinConflict("%s and %s both use pin %d" % (owner, name, pin))
+                    wanted[pin] = name
+            self.claims.update(wanted)
+
+    def release(self, name):
+        """ Forgets a channel and frees its pins, e.g. to switch MOTOR1 and MOTOR2 over to STEPPER1. """
+        with self.lock:
+            self.channels.pop(name, None)
+            self.configs.pop(name, None)
+            for pin in [pin for pin, owner in self.claims.items() if owner == name]:
+                del self.claims[pin]
+
+    def channel(self, name, cls, *args, **kwargs):
+        with self.lock:
+            found = self.channels.get(name)
+            if found is None:
+                self.claim(name)
+                found = self.channels[name] = Pending(cls, args, kwargs)
+            return found
+
+    def motor(self, name, config=1):
+        """ Returns the Motor on a channel, see PiMotor.Motor for the arguments. """
+        with self.lock:
+            if self.configs.get(name, config) != config:
+                raise ValueError("%s is already in use with config %d" % (name, self.configs[name]))
+            arrow = self.arrow(PiMotor.Motor.motorpins[name]["arrow"])
+            found = self.channel(name, PiMotor.Motor, name, config, self.backend, arrow)
+            self.configs[name] = config
+            return found
+
+    def stepper(self, name):
+        """ Returns the Stepper on STEPPER1 or STEPPER2. """
+        return self.channel(name, PiMotor.Stepper, name, self.backend)
+
+    def arrow(self, which):
+        """ Returns an Arrow, which being 1 to 4. """
+        return self.channel("ARROW%d" % which, PiMotor.Arrow, which, self.backend)
+
+    def sensor(self, name, boundary):
+        """ Returns the Sensor on IR1, IR2 or ULTRASONIC, see PiMotor.Sensor.
+        boundary only applies when the channel is first requested, set Sensor.boundary to change it.
+        """
+        return self.channel(name, PiMotor.Sensor, name, boundary, self.backend)
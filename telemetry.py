@@ -0,0 +1,197 @@
+"""
+Structured telemetry for the PiMotor library.
+
+The library reports what it does as events (a name plus keyword fields) instead of printing.
+Every call site is guarded by a per-level boolean on the shared `events` hub:
+
+    if events.info:
+        events.emit(INFO, "motor.forward", pins=self.pins, speed=speed)
+
+so a disabled level costs one attribute check and no formatting or I/O.  Enabled events are
+handed to sinks; BufferedSink moves the actual output onto a background thread so the
+calling thread only appends to a queue.
+
+By default only WARNING events are enabled and go to the logging module.
+
+example:
+    from telemetry import events, INFO, PrintSink, BufferedSink
+    events.addSink(BufferedSink(PrintSink()))
+    events.setLevel(INFO)
+"""
+import collections
+import logging
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+OFF = 100
+
+levelNames = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING"}
+
+
+class Telemetry:
+    """ Event hub with level gating.
+
+    Attributes:
+    debug, info, warning = booleans, True when events of that level are delivered to any sink.
+        Check them before building an event so disabled levels cost nothing.
+    sinks = list of the sinks.
+    """
+    def __init__(self, level=WARNING, sinks=()):
+        self.sinks = list(sinks)
+        # (sink, level) pairs, None following the hub's level.
+        self.routes = [(sink, None) for sink in self.sinks]
+        self.lock = threading.Lock()
+        self.setLevel(level)
+
+    def setLevel(self, level):
+        """ Delivers events at level and above to the sinks that have no level of their own,
+        OFF disables them.
+        """
+        self.level = level
+        self.refresh()
+
+    def addSink(self, sink, level=None):
+        """ Adds a sink, any callable taking (stamp, level, name, fields).
+
+        Arguments:
+        level = optional level of this sink alone, e.g. DEBUG for a sink that has to see every
+                event whatever the hub's level.  By default the sink follows setLevel.
+        """
+        with self.lock:
+            self.routes = self.routes + [(sink, level)]
+            self.sinks = [route[0] for route in self.routes]
+        self.refresh()
+        return sink
+
+    def removeSink(self, sink):
+        with self.lock:
+            self.routes = [route for route in self.routes if route[0] is not sink]
+            self.sinks = [route[0] for route in self.routes]
+        self.refresh()
+
+    def refresh(self):
+        active = bool(self.routes)
+        self.floor = min([self.level] + [level for sink, level in self.routes if level is not None])
+        self.debug = active and self.floor <= DEBUG
+        self.info = active and self.floor <= INFO
+        self.warning = active and self.floor <= WARNING
+
+    def emit(self, level, name, **fields):
+        """ Delivers an event to every sink.
+
+        Arguments:
+        level = DEBUG, INFO or WARNING.
+        name = str, dotted event name such as "stepper.move".
+        fields = event data.
+        """
+        if level < self.floor:
+            return
+        stamp = time.perf_counter_ns()
+        for sink, floor in self.routes:
+            if level >= (self.level if floor is None else floor):
+                sink(stamp, level, name, fields)
+
+
+def render(stamp, level, name, fields):
+    """ Renders an event as a single line of text. """
+    detail = " ".join("%s=%s" % item for item in fields.items())
+    return "%s %s %s" % (levelNames.get(level, level), name, detail) if detail else \
+        "%s %s" % (levelNames.get(level, level), name)
+
+
+class PrintSink:
+    """ Prints every event to stdout. """
+    def __call__(self, stamp, level, name, fields):
+        print(render(stamp, level, name, fields))
+
+
+class LoggingSink:
+    """ Forwards events to a logging.Logger, by default the root logger. """
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger()
+
+    def __call__(self, stamp, level, name, fields):
+        self.logger.log(level, render(stamp, level, name, fields))
+
+
+class MemorySink:
+    """ Keeps the most recent events in memory, handy for inspection and tests.
+
+    Arguments:
+    size = int, number of events kept.
+    """
+    def __init__(self, size=1024):
+        self.records = collections.deque(maxlen=size)
+
+    def __call__(self, stamp, level, name, fields):
+        self.records.append((stamp, level, name, fields))
+
+    def names(self):
+        return [record[2] for record in self.records]
+
+
+class BufferedSink:
+    """ Hands events to another sink from a background thread.
+
+    The emitting thread only appends to a bounded queue; when the queue is full the oldest
+    events are dropped and counted rather than blocking the hot path.
+
+    Arguments:
+    sink = the sink doing the actual output.
+    size = int, maximum number of queued events.
+    """
+    def __init__(self, sink, size=4096):
+        self.sink = sink
+        self.queue = collections.deque(maxlen=size)
+        self.dropped = 0
+        self.ready = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.closed = False
+        self.thread = threading.Thread(target=self.loop, name="BufferedSink")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __call__(self, stamp, level, name, fields):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.idle.clear()
+        self.queue.append((stamp, level, name, fields))
+        self.ready.set()
+
+    def loop(self):
+        while True:
+            self.ready.wait()
+            self.ready.clear()
+            while self.queue:
+                try:
+                    record = self.queue.popleft()
+                except IndexError:
+                    break
+                try:
+                    self.sink(*record)
+                except Exception:
+                    logging.getLogger(__name__).exception("telemetry sink failed")
+            self.idle.set()
+            if self.closed:
+                return
+
+    def flush(self, timeout=None):
+        """ Blocks until every queued event has been handed to the sink. """
+        while self.queue or not self.idle.is_set():
+            self.idle.clear()
+            self.ready.set()
+            if not self.idle.wait(timeout):
+                return False
+        return True
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+        self.thread.join()
+
+
+events = Telemetry(WARNING, [LoggingSink()])
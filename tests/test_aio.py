@@ -0,0 +1,84 @@
+"""
+asyncio wrappers of aio on the simulated backend.
+"""
+import asyncio
+import time
+import unittest
+
+import aio
+import backend
+import PiMotor
+from executor import MoveCancelled, StepperExecutor
+
+
+class WaitMoveTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        backend.set_backend(backend.SimulatedBackend(record=False))
+        self.executor = StepperExecutor()
+        self.stepper = PiMotor.Stepper("STEPPER1")
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    async def test_returns_steps_taken(self):
+        self.assertEqual(await aio.wait_move(self.executor.forward(self.stepper, 0, 12)), 12)
+
+    async def test_move_cancelled_while_queued(self):
+        running = self.executor.forward(self.stepper, 0.01, 100)
+        queued = self.executor.forward(self.stepper, 0, 10)
+        queued.cancel()
+        running.cancel()
+        with self.assertRaises(MoveCancelled):
+            await aio.wait_move(queued)
+        self.assertEqual(queued.completed, 0)
+
+    async def test_move_cancelled_part_way(self):
+        move = self.executor.forward(self.stepper, 0.005, 1000)
+        asyncio.get_running_loop().call_later(0.05, move.cancel)
+        with self.assertRaises(MoveCancelled):
+            await aio.wait_move(move)
+        self.assertGreater(move.completed, 0)
+        self.assertLess(move.completed, 1000)
+
+    async def test_cancelled_task_cancels_the_move(self):
+        move = self.executor.forward(self.stepper, 0.005, 1000)
+        task = asyncio.ensure_future(aio.wait_move(move))
+        await asyncio.sleep(0.03)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertTrue(move.wait(1.0))
+        self.assertTrue(move.cancelled())
+
+
+class AsyncSensorTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        sim = backend.set_backend(backend.SimulatedBackend(record=False))
+        self.sensor = PiMotor.Sensor("ULTRASONIC", 20)
+        sim.attach_echo(self.sensor.config["trigger"], self.sensor.config["echo"], 10.0)
+
+    async def test_waits_out_the_sensors_own_pings(self):
+        sensor = aio.AsyncSensor(self.sensor, interval=0.05)
+        self.assertEqual(self.sensor.interval, 0.05)
+        self.sensor.ping()
+        start = time.monotonic()
+        self.assertTrue(await sensor.trigger())
+        self.assertGreater(time.monotonic() - start, 0.04)
+        self.assertAlmostEqual(sensor.lastRead, 10.0, delta=0.5)
+
+    async def test_ranging_sensor_is_not_pinged(self):
+        self.sensor.startRanging(1.0)
+        try:
+            while not self.sensor.lastRead:
+                await asyncio.sleep(0.005)
+            pinged = self.sensor.lastPing
+            sensor = aio.AsyncSensor(self.sensor)
+            self.assertTrue(await sensor.trigger())
+            self.assertTrue(await sensor.trigger())
+            self.assertEqual(self.sensor.lastPing, pinged)
+        finally:
+            self.sensor.stopRanging()
+
+
+if __name__ == "__main__":
+    unittest.main()
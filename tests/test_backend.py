@@ -0,0 +1,62 @@
+"""
+ShadowRegister write elision on the simulated backend.
+"""
+import unittest
+
+import backend
+import PiMotor
+
+
+class ShadowRegisterTest(unittest.TestCase):
+    def setUp(self):
+        self.sim = backend.set_backend(backend.SimulatedBackend())
+
+    def test_repeated_output_is_elided(self):
+        self.sim.setup(40, self.sim.OUT)
+        self.sim.output(40, 1)
+        self.sim.output(40, 1)
+        self.sim.output(40, True)
+        self.sim.output(40, 0)
+        self.assertEqual(self.sim.stats()["written"], 2)
+        self.assertEqual(self.sim.stats()["elided"], 2)
+        self.assertEqual([value for _, pin, value in self.sim.writes if pin == 40], [1, 0])
+        self.assertEqual(self.sim.state(40), 0)
+
+    def test_outputs_pass_only_changed_pins(self):
+        self.sim.outputs([1, 2, 3], [1, 1, 0])
+        self.sim.reset()
+        del self.sim.writes[:]
+        self.sim.outputs([1, 2, 3], [1, 0, 0])
+        self.assertEqual([(pin, value) for _, pin, value in self.sim.writes], [(2, 0)])
+        self.assertEqual(self.sim.stats()["written"], 1)
+        self.assertEqual(self.sim.stats()["elided"], 2)
+
+    def test_repeated_duty_cycle_is_elided(self):
+        pwm = self.sim.PWM(11, 1000)
+        pwm.start(0)
+        pwm.ChangeDutyCycle(50)
+        pwm.ChangeDutyCycle(50)
+        self.assertEqual(self.sim.duty(11), 50)
+        self.assertEqual(self.sim.stats()["pwmWritten"], 2)
+        self.assertEqual(self.sim.stats()["pwmElided"], 1)
+
+    def test_motor_stop_on_stopped_motor_writes_nothing(self):
+        motor = PiMotor.Motor("MOTOR1", 1)
+        motor.forward(60)
+        motor.stop()
+        self.sim.reset()
+        motor.stop()
+        motor.stop()
+        stats = self.sim.stats()
+        self.assertEqual(stats["written"] + stats["pwmWritten"], 0)
+        self.assertGreater(stats["elided"], 0)
+
+    def test_unshadowed_backend_writes_through(self):
+        sim = backend.set_backend(backend.SimulatedBackend(), shadow=False)
+        sim.output(40, 1)
+        sim.output(40, 1)
+        self.assertEqual(len(sim.writes), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
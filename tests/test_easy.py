@@ -0,0 +1,114 @@
+"""
+Delay profile caching and EasyStepperSequence step allocation on the simulated backend.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import backend
+import PiMotor
+
+try:
+    import easy
+    from easing_functions import QuadEaseIn, QuadEaseOut, LinearInOut
+except ImportError:
+    easy = None
+
+
+@unittest.skipIf(easy is None, "easing_functions is not installed")
+class ProfileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = easy.ProfileCache(maxsize=2)
+
+    def test_repeated_profiles_are_shared(self):
+        profile = self.cache.get("quad", 0.05, 0.01, 100)
+        self.assertIs(self.cache.get("quad", 0.05, 0.01, 100), profile)
+        self.assertEqual(len(profile), 101)
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        first = self.cache.get("linear", 0.05, 0.01, 10)
+        self.cache.get("quad", 0.05, 0.01, 10)
+        self.cache.get("linear", 0.05, 0.01, 10)
+        self.cache.get("expo", 0.05, 0.01, 10)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertIs(self.cache.get("linear", 0.05, 0.01, 10), first)
+        self.assertEqual(self.cache.stats()["misses"], 3)
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "profiles.json")
+            profile = self.cache.get("circular", 0.02, 0.005, 50)
+            self.cache.save(path)
+            loaded = easy.ProfileCache(path=path)
+            self.assertEqual(list(loaded.get("circular", 0.02, 0.005, 50).delays), list(profile.delays))
+            self.assertEqual(loaded.stats()["misses"], 0)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_profile_shorter_than_move_holds_last_delay(self):
+        backend.set_backend(backend.SimulatedBackend(record=False))
+        stepper = PiMotor.Stepper("STEPPER1")
+        profile = easy.EasyStepper(0.0002, 0.0001, self.cache).quad(20)
+        self.assertEqual(profile(500), profile.delays[-1])
+        stepper.forward(profile, 40)
+        self.assertEqual(stepper.position, 40)
+
+
+@unittest.skipIf(easy is None, "easing_functions is not installed")
+class SequenceTest(unittest.TestCase):
+    def setUp(self):
+        backend.set_backend(backend.SimulatedBackend(record=False))
+        self.stepper = PiMotor.Stepper("STEPPER1")
+
+    def sequence(self, steps, *weights):
+        sequence = easy.EasyStepperSequence(0.0002, steps)
+        for index, weight in enumerate(weights):
+            sequence.append((QuadEaseIn, LinearInOut, QuadEaseOut)[index % 3], 0.0001, weight)
+        return sequence
+
+    def test_allocate_is_exact(self):
+        for steps in (0, 1, 7, 10, 99, 1000, 1001):
+            for weights in ((1,), (1, 1, 1), (0.3, 0.3, 0.4), (0.1, 0.7, 0.25, 1e-6), (5, 0, 2)):
+                counts = self.sequence(steps, *weights).allocate()
+                self.assertEqual(sum(counts), steps, (steps, weights))
+                self.assertTrue(all(count >= 0 for count in counts))
+
+    def test_allocate_follows_weights(self):
+        self.assertEqual(self.sequence(10, 1, 1).allocate(), [5, 5])
+        self.assertEqual(self.sequence(9, 1, 2).allocate(), [3, 6])
+        self.assertEqual(self.sequence(10, 0, 0).allocate(), [0, 0])
+
+    def test_compiled_profile_covers_the_sequence(self):
+        sequence = self.sequence(50, 1, 2)
+        profile = sequence.compile()
+        self.assertEqual(len(profile), 50)
+        self.assertIs(sequence.compile(), profile)
+
+    def test_empty_sequence_does_nothing(self):
+        for sequence in (self.sequence(50), self.sequence(50, 0, 0)):
+            self.assertIsNone(sequence.execute(self.stepper.forward))
+            self.assertEqual(self.stepper.position, 0)
+            self.assertEqual(self.stepper.coilState, 0)
+
+    def test_execute_takes_every_step(self):
+        self.sequence(40, 1, 3).execute(self.stepper.forward)
+        self.assertEqual(self.stepper.position, 40)
+
+    def test_play_keeps_phase_and_position(self):
+        stepper = self.stepper
+        stepper.setMode("half")
+        stepper.forward(0, 3)
+        expected = stepper.forwardPhases[(stepper.phase + 10) % 8]
+        self.assertEqual(self.sequence(10, 1).play(stepper), 10)
+        self.assertEqual(stepper.coilState, expected)
+        self.assertEqual(stepper.position, 13)
+        self.sequence(6, 1).play(stepper, "backward")
+        self.assertEqual(stepper.position, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
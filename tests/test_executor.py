@@ -0,0 +1,82 @@
+"""
+Background stepper moves of executor.StepperExecutor on the simulated backend.
+"""
+import time
+import unittest
+
+import backend
+import PiMotor
+from executor import MoveCancelled, StepperExecutor
+
+
+class StepperExecutorTest(unittest.TestCase):
+    def setUp(self):
+        backend.set_backend(backend.SimulatedBackend(record=False))
+        self.executor = StepperExecutor()
+        self.stepper = PiMotor.Stepper("STEPPER1")
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_move_runs_in_the_background(self):
+        start = time.monotonic()
+        move = self.executor.forward(self.stepper, 0.002, 50)
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertEqual(move.result(1.0), 50)
+        self.assertEqual(move.progress, 1.0)
+        self.assertEqual(self.stepper.position, 50)
+
+    def test_moves_on_one_stepper_run_in_order(self):
+        moves = [self.executor.forward(self.stepper, 0, 10), self.executor.backward(self.stepper, 0, 4)]
+        self.assertEqual([move.result(1.0) for move in moves], [10, 4])
+        self.assertEqual(self.stepper.position, 6)
+
+    def test_cancel_while_queued(self):
+        running = self.executor.forward(self.stepper, 0.005, 40)
+        queued = self.executor.forward(self.stepper, 0, 10)
+        self.assertTrue(queued.cancel())
+        running.result(1.0)
+        self.assertTrue(queued.wait(1.0))
+        self.assertTrue(queued.cancelled())
+        self.assertEqual(queued.completed, 0)
+        with self.assertRaises(MoveCancelled):
+            queued.result()
+        self.assertEqual(self.stepper.position, 40)
+
+    def test_cancel_part_way(self):
+        move = self.executor.forward(self.stepper, 0.005, 1000)
+        time.sleep(0.05)
+        move.cancel()
+        self.assertTrue(move.wait(1.0))
+        self.assertTrue(move.cancelled())
+        with self.assertRaises(MoveCancelled):
+            move.result()
+        self.assertEqual(self.stepper.position, move.completed)
+        self.assertLess(move.completed, 1000)
+
+    def test_cancel_all(self):
+        moves = [self.executor.forward(self.stepper, 0.005, 1000), self.executor.forward(self.stepper, 0, 10)]
+        time.sleep(0.02)
+        self.executor.cancelAll()
+        for move in moves:
+            self.assertTrue(move.wait(1.0))
+            self.assertTrue(move.cancelled())
+
+    def test_failed_move_raises_from_result(self):
+        def fail(move):
+            raise RuntimeError("coil driver fault")
+        move = self.executor.submit(self.stepper, fail, 10)
+        with self.assertRaises(RuntimeError):
+            move.result(1.0)
+        self.assertFalse(move.cancelled())
+        # The worker carries on with the next move.
+        self.assertEqual(self.executor.forward(self.stepper, 0, 3).result(1.0), 3)
+
+    def test_shutdown_refuses_new_moves(self):
+        self.executor.shutdown()
+        with self.assertRaises(RuntimeError):
+            self.executor.forward(self.stepper, 0, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
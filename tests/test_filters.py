@@ -0,0 +1,80 @@
+"""
+Sensor history ring buffer and filters.FilterPipeline.
+"""
+import random
+import unittest
+
+import backend
+import filters
+import PiMotor
+from filters import FilterPipeline
+from sensing import RingBuffer
+
+
+def filled(samples, size=8):
+    history = RingBuffer(size)
+    for sample in samples:
+        history.push(sample)
+    return history
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_keeps_the_newest_samples_in_order(self):
+        history = filled(range(11), size=4)
+        self.assertEqual(len(history), 4)
+        self.assertEqual(list(history.ordered()), [7.0, 8.0, 9.0, 10.0])
+        self.assertEqual(history.latest()[0], 10.0)
+        history.clear()
+        self.assertIsNone(history.latest())
+
+
+class FilterPipelineTest(unittest.TestCase):
+    def run_pipeline(self, pipeline, samples):
+        history = RingBuffer(8)
+        for sample in samples:
+            history.push(sample)
+            pipeline.update(history)
+        return pipeline.value
+
+    def test_ghost_echo_is_rejected(self):
+        pipeline = FilterPipeline(window=5, alpha=1.0)
+        self.assertAlmostEqual(self.run_pipeline(pipeline, [50, 50, 51, 49, 300]), 50.0)
+        self.assertEqual(pipeline.rejected, 1)
+
+    def test_ema_smooths_a_step(self):
+        pipeline = FilterPipeline(window=1, alpha=0.5, outlier=None)
+        self.assertEqual(self.run_pipeline(pipeline, [100, 0]), 50.0)
+        self.assertEqual(self.run_pipeline(pipeline, [0]), 25.0)
+
+    def test_window_shorter_than_history_so_far(self):
+        pipeline = FilterPipeline(window=5, alpha=1.0)
+        self.assertEqual(self.run_pipeline(pipeline, [10, 30]), 20.0)
+
+    @unittest.skipIf(filters.numpy is None, "numpy is not installed")
+    def test_vectorized_and_plain_paths_agree(self):
+        generator = random.Random(12)
+        history = RingBuffer(16)
+        vector = FilterPipeline(window=7)
+        plain = FilterPipeline(window=7)
+        for n in range(200):
+            history.push(generator.choice([generator.gauss(80, 2), generator.uniform(0, 400)]))
+            count = min(7, len(history))
+            self.assertAlmostEqual(vector.vectorMedian(history, count), plain.listMedian(history, count))
+        self.assertEqual(vector.rejected, plain.rejected)
+
+
+class SensorFilterTest(unittest.TestCase):
+    def test_boundary_uses_the_filtered_value(self):
+        backend.set_backend(backend.SimulatedBackend(record=False))
+        sensor = PiMotor.Sensor("ULTRASONIC", 20)
+        sensor.setFilter(FilterPipeline(window=5, alpha=1.0))
+        for measure in (50, 50, 50, 50):
+            sensor.record(measure)
+        sensor.record(5)
+        self.assertEqual(sensor.lastRead, 5)
+        self.assertEqual(sensor.filtered, 50)
+        self.assertFalse(sensor.Triggered)
+
+
+if __name__ == "__main__":
+    unittest.main()
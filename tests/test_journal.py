@@ -0,0 +1,114 @@
+"""
+Journal recording and Replay round trips on the simulated backend.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import backend
+import journal
+import PiMotor
+import telemetry
+from telemetry import events
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "shield.journal")
+        self.sim = backend.set_backend(backend.SimulatedBackend())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, body, **options):
+        recorder = journal.install(self.path, **options)
+        try:
+            body()
+        finally:
+            recorder.close()
+            events.removeSink(recorder)
+        return recorder
+
+    def replayed(self, **options):
+        target = backend.SimulatedBackend()
+        journal.Replay(self.path).play(target, speed=None, **options)
+        return target
+
+    def drive(self):
+        stepper = PiMotor.Stepper("STEPPER1")
+        stepper.forward(0, 7)
+        stepper.playWaveform(stepper.compileWaveform(0, 5))
+        motor = PiMotor.Motor("MOTOR3", 1)
+        motor.forward(40)
+        motor.reverse(70)
+        PiMotor.Arrow(2).on()
+        stepper.setMode("micro", 4)
+        stepper.backward(0, 3)
+
+    def assertSameState(self, target):
+        for pin, level in self.sim.pins.items():
+            if self.sim.modes.get(pin) == self.sim.OUT:
+                self.assertEqual(target.pins.get(pin), level, "pin %d" % pin)
+        for pin, pwm in self.sim.pwms.items():
+            # Duty cycles are stored as float32.
+            self.assertAlmostEqual(target.pwms[pin].dutyCycle, pwm.dutyCycle, 4, "pwm %d" % pin)
+            self.assertEqual(target.pwms[pin].frequency, pwm.frequency, "pwm %d" % pin)
+
+    def test_replay_reproduces_pin_state(self):
+        recorder = self.record(self.drive)
+        self.assertGreater(recorder.records, 0)
+        self.assertSameState(self.replayed())
+
+    def test_replay_from_checkpoint(self):
+        def body():
+            self.drive()
+            time.sleep(0.02)
+            PiMotor.Motor("MOTOR4", 1).forward(25)
+        self.record(body, interval=0.01)
+        replay = journal.Replay(self.path)
+        self.assertGreater(len(replay.index), 1)
+        self.assertSameState(self.replayed(start=0.015))
+
+    def test_calls_are_recorded_whatever_the_level(self):
+        self.assertEqual(events.level, telemetry.WARNING)
+        # The hub's own sinks keep receiving warnings only.
+        memory = events.addSink(telemetry.MemorySink())
+        try:
+            self.record(self.drive)
+        finally:
+            events.removeSink(memory)
+        self.assertEqual(memory.names(), [])
+        self.assertFalse(events.info)
+        calls = [(name, fields) for seconds, name, fields in journal.Replay(self.path).calls()]
+        names = [name for name, fields in calls]
+        for name in ("stepper.forward", "stepper.mode", "stepper.backward", "motor.forward", "arrow.on"):
+            self.assertIn(name, names)
+        forward = calls[names.index("stepper.forward")][1]
+        self.assertEqual((forward["delay"], forward["steps"]), (0, 7))
+        moves = [fields for name, fields in calls if name == "stepper.move"]
+        self.assertEqual([(move["direction"], move["delay"], move["steps"]) for move in moves],
+                         [(1, 0, 7), (-1, 0, 3)])
+
+    def test_frequency_changes_are_replayed(self):
+        motors = []
+
+        def body():
+            motors.append(PiMotor.Motor("MOTOR1", 1))
+            motors[0].forward(30)
+            motors[0].PWM.ChangeFrequency(200)
+        self.record(body)
+        target = self.replayed()
+        self.assertSameState(target)
+        self.assertEqual(target.pwms[motors[0].pins["e"]].frequency, 200)
+
+    def test_records_are_in_time_order(self):
+        self.record(self.drive)
+        stamps = [stamp for stamp, kind, payload in journal.Replay(self.path).records()]
+        self.assertEqual(stamps, sorted(stamps))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+DC Motor and LinkedMotors writes on the simulated backend.
+"""
+import unittest
+
+import backend
+import PiMotor
+
+
+class LinkedMotorsTest(unittest.TestCase):
+    def setUp(self):
+        # Unshadowed, so every write of the group is seen.
+        self.sim = backend.set_backend(backend.SimulatedBackend(), shadow=False)
+        self.left = PiMotor.Motor("MOTOR3", 1)
+        self.right = PiMotor.Motor("MOTOR4", 1)
+        self.group = PiMotor.LinkedMotors(self.left, self.right)
+        self.sim.clear()
+
+    def pinWrites(self):
+        return [(stamp, pin, value) for stamp, pin, value in self.sim.writes if not isinstance(value, tuple)]
+
+    def test_direction_pins_switch_in_one_write(self):
+        self.group.forward(60)
+        writes = self.pinWrites()
+        self.assertEqual(len({stamp for stamp, _, _ in writes}), 1)
+        for motor in (self.left, self.right):
+            self.assertEqual(self.sim.pins[motor.pins["f"]], 1)
+            self.assertEqual(self.sim.pins[motor.pins["r"]], 0)
+            self.assertEqual(self.sim.pwms[motor.pins["e"]].dutyCycle, 60)
+
+    def test_duty_cycles_are_set_before_the_pins(self):
+        self.group.reverse(30)
+        kinds = [isinstance(value, tuple) for _, _, value in self.sim.writes]
+        self.assertEqual(kinds, sorted(kinds, reverse=True))
+
+    def test_speed_per_motor(self):
+        self.group.drive(40, -70)
+        self.assertEqual((self.left.current, self.right.current), (40, -70))
+        self.assertEqual(self.sim.pins[self.right.pins["r"]], 1)
+        self.assertEqual(self.sim.pwms[self.right.pins["e"]].dutyCycle, 70)
+        with self.assertRaises(ValueError):
+            self.group.drive(1, 2, 3)
+
+    def test_skew_is_measured(self):
+        self.group.forward(50)
+        self.group.stop()
+        self.assertGreaterEqual(self.group.skew, 0.0)
+        self.assertGreaterEqual(self.group.maxSkew, self.group.skew)
+        self.assertEqual((self.left.current, self.right.current), (0, 0))
+
+    def test_drive_cancels_ramps(self):
+        self.left.speed(100, 1.0)
+        self.group.stop()
+        self.assertFalse(PiMotor.ramp.get_engine().active(self.left))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Junction speeds and execution of planner.MotionPlanner on the simulated backend.
+"""
+import unittest
+
+import backend
+import PiMotor
+from planner import MotionPlanner
+
+
+class MotionPlannerTest(unittest.TestCase):
+    def setUp(self):
+        backend.set_backend(backend.SimulatedBackend(record=False))
+        self.stepper = PiMotor.Stepper("STEPPER1")
+        self.planner = MotionPlanner(self.stepper, accel=4000, startSpeed=100)
+
+    def assertReachable(self, planner):
+        for segment in planner.queue:
+            change = abs(segment.exit ** 2 - segment.entry ** 2)
+            self.assertLessEqual(change, 2 * planner.effectiveAccel(segment) * segment.steps + 1e-6)
+
+    def test_same_direction_keeps_speed_through_junction(self):
+        first = self.planner.append("forward", 400, 800)
+        second = self.planner.append("forward", 400, 800)
+        self.planner.plan()
+        self.assertEqual(first.exit, 800)
+        self.assertEqual(second.entry, 800)
+        self.assertEqual(second.exit, 100)
+        self.assertReachable(self.planner)
+
+    def test_slower_segment_limits_the_junction(self):
+        first = self.planner.append("forward", 400, 800)
+        self.planner.append("forward", 400, 300)
+        self.planner.plan()
+        self.assertEqual(first.exit, 300)
+
+    def test_reversal_stops_at_start_speed(self):
+        first = self.planner.append("forward", 400, 800)
+        second = self.planner.append("backward", 400, 800)
+        self.planner.plan()
+        self.assertEqual(first.exit, 100)
+        self.assertEqual(second.entry, 100)
+
+    def test_short_segments_are_limited_by_acceleration(self):
+        for steps in (3, 5, 2, 40, 1):
+            self.planner.append("forward", steps, 2000)
+        self.planner.plan()
+        self.assertReachable(self.planner)
+        self.assertLess(max(segment.exit for segment in self.planner.queue), 2000)
+
+    def test_delays_cover_the_segment_within_its_speeds(self):
+        for profile in MotionPlanner.profiles:
+            planner = MotionPlanner(self.stepper, accel=4000, startSpeed=100, profile=profile)
+            segment = planner.append("forward", 300, 800)
+            planner.plan()
+            delays = list(planner.delays(segment))
+            self.assertEqual(len(delays), 300)
+            self.assertGreaterEqual(min(delays), 1 / 800 - 1e-9)
+            self.assertLessEqual(max(delays), 1 / 100 + 1e-9)
+
+    def test_execute_tracks_position_and_phase(self):
+        planner = MotionPlanner(self.stepper, accel=1e6, startSpeed=10000)
+        self.stepper.forward(0, 1)
+        start = self.stepper.phase
+        planner.append("forward", 100, 20000)
+        planner.append("backward", 30, 20000)
+        self.assertEqual(planner.execute(), 130)
+        self.assertEqual(self.stepper.position, 71)
+        self.assertEqual(self.stepper.coilState, self.stepper.forwardPhases[(start + 70) % 4])
+        self.assertEqual(planner.queue, [])
+
+    def test_arguments_are_checked(self):
+        with self.assertRaises(ValueError):
+            MotionPlanner(self.stepper, profile="linear")
+        with self.assertRaises(ValueError):
+            self.planner.append("sideways", 10, 100)
+        self.planner.append("forward", 0, 100)
+        self.assertEqual(self.planner.queue, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
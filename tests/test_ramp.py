@@ -0,0 +1,73 @@
+"""
+Duty cycle ramps of the shared ramp.RampEngine on the simulated backend.
+"""
+import threading
+import unittest
+
+import backend
+import PiMotor
+import ramp
+
+
+class RampTest(unittest.TestCase):
+    def setUp(self):
+        self.sim = backend.set_backend(backend.SimulatedBackend()).backend
+        self.motor = PiMotor.Motor("MOTOR3", 1)
+        self.engine = ramp.get_engine()
+        self.results = []
+        self.finished = threading.Event()
+
+    def tearDown(self):
+        self.engine.cancel(self.motor)
+
+    def done(self, motor, reached):
+        self.results.append(reached)
+        self.finished.set()
+
+    def duties(self):
+        pin = self.motor.pins["e"]
+        return [value[1] for _, written, value in self.sim.writes if written == pin]
+
+    def test_speed_is_limited_by_the_rate(self):
+        self.sim.clear()
+        rate = 1000.0
+        self.motor.speed(80, rate, self.done)
+        self.assertTrue(self.finished.wait(1.0))
+        self.assertEqual(self.results, [True])
+        self.assertEqual(self.motor.current, 80)
+        duties = [0.0] + self.duties()
+        self.assertEqual(duties[-1], 80)
+        steps = [b - a for a, b in zip(duties, duties[1:])]
+        self.assertTrue(all(0 <= step <= rate * self.engine.tick + 1e-9 for step in steps), steps)
+        self.assertFalse(self.engine.active(self.motor))
+
+    def test_reversing_passes_through_zero(self):
+        self.motor.forward(40)
+        self.sim.clear()
+        self.motor.speed(-40, 2000.0, self.done)
+        self.assertTrue(self.finished.wait(1.0))
+        self.assertEqual(self.motor.current, -40)
+        duties = self.duties()
+        self.assertIn(0, duties)
+        self.assertEqual(self.sim.pins[self.motor.pins["r"]], 1)
+        self.assertEqual(self.sim.pins[self.motor.pins["f"]], 0)
+
+    def test_forward_cancels_the_ramp(self):
+        self.motor.speed(100, 1.0, self.done)
+        self.motor.forward(30)
+        self.assertEqual(self.results, [False])
+        self.assertFalse(self.engine.active(self.motor))
+        self.assertEqual(self.motor.current, 30)
+
+    def test_new_ramp_replaces_the_old_one(self):
+        first = []
+        self.motor.speed(100, 1.0, lambda motor, reached: first.append(reached))
+        self.motor.speed(20, 2000.0, self.done)
+        self.assertEqual(first, [False])
+        self.assertTrue(self.finished.wait(1.0))
+        self.assertEqual(self.results, [True])
+        self.assertEqual(self.motor.current, 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Ultrasonic ping timing and miss handling, and IR edge reporting, on the simulated backend.
+"""
+import time
+import unittest
+
+import backend
+import filters
+import PiMotor
+
+
+class UltrasonicTest(unittest.TestCase):
+    def setUp(self):
+        self.sim = backend.set_backend(backend.SimulatedBackend(record=False))
+        self.sensor = PiMotor.Sensor("ULTRASONIC", 20)
+        self.distance = [5.0]
+        self.sim.attach_echo(self.sensor.config["trigger"], self.sensor.config["echo"],
+                             lambda: self.distance[0])
+
+    def test_ping_measures_distance(self):
+        # Down to the 58 us echo of 1 cm, the kind of short pulse that must not be missed.
+        for distance in (1.0, 5.0, 42.0, 150.0):
+            self.distance[0] = distance
+            self.assertAlmostEqual(self.sensor.ping(), distance, delta=0.5)
+
+    def test_missed_echo_times_out(self):
+        self.distance[0] = None
+        start = time.monotonic()
+        self.assertIsNone(self.sensor.ping(0.005))
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_abandoned_echo_is_not_paired_with_the_next(self):
+        # The 23 ms echo of 400 cm outlives a 5 ms timeout; its falling edge must not end the
+        # next ping's echo.
+        self.distance[0] = 400.0
+        self.assertIsNone(self.sensor.ping(0.005))
+        self.distance[0] = 5.0
+        reading = self.sensor.ping()
+        if reading is not None:
+            self.assertAlmostEqual(reading, 5.0, delta=0.5)
+        time.sleep(0.03)
+        self.assertAlmostEqual(self.sensor.ping(), 5.0, delta=0.5)
+
+    def test_edges_come_from_the_interrupt_callback(self):
+        self.sensor.ping()
+        sim = self.sim.backend
+        self.assertIn(self.sensor.config["echo"], sim.events)
+        self.assertEqual(sim.events[self.sensor.config["echo"]][0], sim.BOTH)
+
+    def test_trigger_sets_triggered_inside_boundary(self):
+        self.sensor.interval = 0
+        self.assertTrue(self.sensor.trigger())
+        self.distance[0] = 50.0
+        self.assertFalse(self.sensor.trigger())
+        self.assertAlmostEqual(self.sensor.lastRead, 50.0, delta=0.5)
+
+    def test_miss_clears_unfiltered_reading(self):
+        self.sensor.record(5.0)
+        self.assertTrue(self.sensor.Triggered)
+        self.sensor.record(None)
+        self.assertFalse(self.sensor.Triggered)
+        self.assertEqual(self.sensor.missed, 1)
+        self.assertEqual(self.sensor.lastRead, 5.0)
+
+    def test_miss_keeps_confirmed_obstacle(self):
+        self.sensor.setFilter(filters.FilterPipeline(window=3))
+        for _ in range(3):
+            self.sensor.record(5.0)
+        self.assertTrue(self.sensor.Triggered)
+        self.sensor.record(None)
+        self.sensor.record(None)
+        self.assertTrue(self.sensor.Triggered)
+        self.sensor.record(None)
+        self.assertFalse(self.sensor.Triggered)
+
+
+
+class IRTest(unittest.TestCase):
+    def setUp(self):
+        self.sim = backend.set_backend(backend.SimulatedBackend(record=False)).backend
+        self.sensor = PiMotor.Sensor("IR1", 0)
+        self.pin = self.sensor.config["echo"]
+
+    def test_trigger_follows_input(self):
+        self.assertFalse(self.sensor.trigger())
+        self.sim.set_input(self.pin, 1)
+        self.assertTrue(self.sensor.trigger())
+
+    def test_watch_reports_edges(self):
+        events = self.sensor.watch(debounce=0)
+        self.sim.set_input(self.pin, 1)
+        self.assertTrue(self.sensor.Triggered)
+        self.sim.set_input(self.pin, 0)
+        self.assertFalse(self.sensor.Triggered)
+        reported = [events.get_nowait(), events.get_nowait()]
+        self.assertEqual([detected for detected, stamp in reported], [True, False])
+        self.assertLessEqual(reported[0][1], reported[1][1])
+
+    def test_watch_rising_edges_with_a_callback(self):
+        seen = []
+        self.assertIsNone(self.sensor.watch("rising", lambda sensor, detected, stamp: seen.append(detected),
+                                            debounce=0))
+        for level in (1, 0, 1):
+            self.sim.set_input(self.pin, level)
+        self.assertEqual(seen, [True, True])
+
+    def test_debounce_drops_chatter(self):
+        events = self.sensor.watch(debounce=0.05)
+        for level in (1, 0, 1, 0):
+            self.sim.set_input(self.pin, level)
+        self.assertEqual(events.qsize(), 1)
+        time.sleep(0.06)
+        self.sim.set_input(self.pin, 1)
+        self.assertEqual(events.qsize(), 2)
+
+    def test_unwatch_stops_reporting(self):
+        events = self.sensor.watch(debounce=0)
+        self.sensor.unwatch()
+        self.sim.set_input(self.pin, 1)
+        self.assertTrue(events.empty())
+        self.assertNotIn(self.pin, self.sim.events)
+
+if __name__ == "__main__":
+    unittest.main()
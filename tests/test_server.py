@@ -0,0 +1,66 @@
+"""
+ControlServer stepper commands over a local socket, on the simulated backend.
+"""
+import asyncio
+import unittest
+
+import backend
+import executor
+import shield
+from server import (ControlClient, ControlServer, ERROR, OK, STEPPER_FORWARD, STEPPER_MODE,
+                    STEPPER_STOP, STEPPER_WAIT)
+
+
+class ServerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        backend.set_backend(backend.SimulatedBackend(record=False))
+        self.board = shield.Shield()
+        self.executor = executor.StepperExecutor()
+        self.server = ControlServer(self.board, self.executor)
+        listener = await self.server.start(port=0)
+        port = listener.sockets[0].getsockname()[1]
+        self.client = await ControlClient.connect("127.0.0.1", port)
+        self.other = await ControlClient.connect("127.0.0.1", port)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.other.close()
+        await self.server.close()
+        self.executor.shutdown()
+
+    async def test_wait_returns_steps_taken(self):
+        await self.client.call(STEPPER_FORWARD, 1, 0.0, 30)
+        self.assertEqual(await self.client.call(STEPPER_WAIT, 1), 30.0)
+        self.assertEqual(self.board.stepper("STEPPER1").position, 30)
+
+    async def test_stop_cancels_every_queued_move(self):
+        await self.client.batch([(STEPPER_FORWARD, 1, 0.001, 200), (STEPPER_FORWARD, 1, 0.001, 200)])
+        await asyncio.sleep(0.02)
+        await self.client.call(STEPPER_STOP, 1)
+        await self.client.call(STEPPER_WAIT, 1)
+        self.assertLess(self.board.stepper("STEPPER1").position, 200)
+
+    async def test_wait_survives_stop_from_another_client(self):
+        await self.client.call(STEPPER_FORWARD, 1, 0.001, 200)
+        waiting = asyncio.ensure_future(self.other.call(STEPPER_WAIT, 1))
+        await asyncio.sleep(0.02)
+        await self.client.call(STEPPER_STOP, 1)
+        self.assertLess(await asyncio.wait_for(waiting, 1), 200)
+        # The waiting client is still connected.
+        self.assertEqual(await self.other.call(STEPPER_WAIT, 1), 0.0)
+
+    async def test_failed_move_is_an_error(self):
+        def fail(move):
+            raise RuntimeError("coil driver fault")
+        self.server.queue(1, self.executor.submit(self.board.stepper("STEPPER1"), fail, 10))
+        results = await self.client.batch([(STEPPER_WAIT, 1, 0.0, 0)])
+        self.assertEqual(results, [(ERROR, 0.0)])
+
+
+    async def test_unknown_mode_is_an_error(self):
+        results = await self.client.batch([(STEPPER_MODE, 1, 0.0, 3), (STEPPER_MODE, 1, 0.0, 8),
+                                           (STEPPER_MODE, 1, 0.0, 2)])
+        self.assertEqual([status for status, value in results], [ERROR, OK, OK])
+
+if __name__ == "__main__":
+    unittest.main()
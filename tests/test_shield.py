@@ -0,0 +1,87 @@
+"""
+Shield pin claims and lazy channel initialization on the simulated backend.
+"""
+import unittest
+
+import backend
+import shield
+from shield import Pending, PinConflict
+
+
+class ShieldTest(unittest.TestCase):
+    def setUp(self):
+        self.sim = backend.set_backend(backend.SimulatedBackend())
+        self.board = shield.Shield()
+
+    def test_conflicting_channel_is_refused(self):
+        self.board.motor("MOTOR1")
+        with self.assertRaises(PinConflict):
+            self.board.stepper("STEPPER1")
+        self.assertNotIn("STEPPER1", self.board.channels)
+
+    def test_claim_checks_the_whole_layout_first(self):
+        with self.assertRaises(PinConflict):
+            self.board.claim("MOTOR3", "MOTOR1", "STEPPER1")
+        self.assertEqual(self.board.claims, {})
+        self.board.claim("MOTOR3", "STEPPER1")
+        self.assertEqual(set(self.board.claims.values()), {"MOTOR3", "STEPPER1"})
+
+    def test_release_frees_the_pins(self):
+        self.board.motor("MOTOR1")
+        self.board.motor("MOTOR2")
+        self.board.release("MOTOR1")
+        self.board.release("MOTOR2")
+        self.board.stepper("STEPPER1")
+
+    def test_motor_config_is_fixed_on_first_use(self):
+        self.board.motor("MOTOR3", 1)
+        with self.assertRaises(ValueError):
+            self.board.motor("MOTOR3", 2)
+
+    def test_channels_are_initialized_on_first_use(self):
+        motor = self.board.motor("MOTOR3")
+        self.assertIs(type(motor), Pending)
+        self.assertEqual(self.sim.writes, [])
+        motor.forward(50)
+        self.assertEqual(type(motor).__name__, "Motor")
+        self.assertIs(self.board.motor("MOTOR3"), motor)
+        self.assertNotEqual(self.sim.writes, [])
+
+    def test_motors_share_the_shields_arrows(self):
+        self.assertIs(self.board.motor("MOTOR3").arrow, self.board.arrow(2))
+
+
+class PendingTest(unittest.TestCase):
+    def test_stays_pending_until_constructed(self):
+        seen = []
+
+        class Probe:
+            def __init__(self, value):
+                seen.append(type(placeholder))
+                self.value = value
+
+        placeholder = Pending(Probe, (7,), {})
+        self.assertEqual(placeholder.value, 7)
+        self.assertEqual(seen, [Pending])
+        self.assertIs(type(placeholder), Probe)
+        self.assertNotIn("_pending", placeholder.__dict__)
+
+    def test_failed_construction_can_be_retried(self):
+        attempts = []
+
+        class Flaky:
+            def __init__(self):
+                attempts.append(1)
+                if len(attempts) == 1:
+                    raise RuntimeError("not ready")
+                self.ready = True
+
+        placeholder = Pending(Flaky, (), {})
+        with self.assertRaises(RuntimeError):
+            placeholder.ready
+        self.assertIs(type(placeholder), Pending)
+        self.assertTrue(placeholder.ready)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+The simulated backend the other tests run against.
+"""
+import unittest
+
+import backend
+import PiMotor
+
+
+class SimulatedBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.sim = backend.SimulatedBackend()
+
+    def test_records_outputs_in_order(self):
+        self.sim.setup(40, self.sim.OUT)
+        self.sim.output(40, True)
+        self.sim.outputs([38, 40], [1, 0])
+        self.assertEqual([(pin, value) for _, pin, value in self.sim.writes], [(40, 1), (38, 1), (40, 0)])
+        stamps = [stamp for stamp, _, _ in self.sim.writes]
+        self.assertEqual(stamps, sorted(stamps))
+        self.assertEqual(self.sim.pins, {40: 0, 38: 1})
+
+    def test_record_off_keeps_levels_only(self):
+        sim = backend.SimulatedBackend(record=False)
+        sim.output(40, 1)
+        self.assertEqual(sim.writes, [])
+        self.assertEqual(sim.pins[40], 1)
+
+    def test_pwm_changes_are_recorded(self):
+        pwm = self.sim.PWM(11, 1000)
+        pwm.start(30)
+        pwm.ChangeDutyCycle(60)
+        pwm.stop()
+        self.assertEqual([value for _, _, value in self.sim.writes], [("pwm", 30), ("pwm", 60), ("pwm", 0)])
+        self.assertIs(self.sim.pwms[11], pwm)
+
+    def test_echo_follows_falling_trigger(self):
+        self.sim.attach_echo(29, 31, 100.0, latency=0)
+        self.assertEqual(self.sim.input(31), self.sim.LOW)
+        self.sim.output(29, 1)
+        self.sim.output(29, 0)
+        self.assertEqual(self.sim.input(31), self.sim.HIGH)
+
+    def test_set_input_runs_edge_callbacks(self):
+        seen = []
+        self.sim.add_event_detect(7, self.sim.RISING, seen.append)
+        self.sim.set_input(7, 1)
+        self.sim.set_input(7, 1)
+        self.sim.set_input(7, 0)
+        self.assertEqual(seen, [7])
+        self.assertEqual(self.sim.input(7), 0)
+
+    def test_installed_backend_drives_the_library(self):
+        self.assertIsInstance(backend.set_backend(self.sim), backend.ShadowRegister)
+        self.assertIs(backend.get_backend().backend, self.sim)
+        arrow = PiMotor.Arrow(1)
+        arrow.on()
+        self.assertIn((arrow.pin, 1), [(pin, value) for _, pin, value in self.sim.writes])
+
+
+if __name__ == "__main__":
+    unittest.main()
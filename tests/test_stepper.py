@@ -0,0 +1,191 @@
+"""
+Phase order and position tracking of PiMotor.Stepper on the simulated backend.
+"""
+import unittest
+
+import backend
+import PiMotor
+from PiMotor import Stepper
+from telemetry import events, MemorySink
+
+
+class StepperTest(unittest.TestCase):
+    def setUp(self):
+        self.sim = backend.set_backend(backend.SimulatedBackend())
+        self.stepper = PiMotor.Stepper("STEPPER1")
+
+    def pins(self):
+        return [self.sim.pins[pin] for pin in self.stepper.coils]
+
+    def test_steps_follow_the_mode_table(self):
+        stepper = self.stepper
+        for mode, table in (("single", Stepper.single_mode), ("double", Stepper.double_mode),
+                            ("half", Stepper.half_mode)):
+            stepper.setMode(mode)
+            stepper.phase = None
+            for index in range(2 * len(table)):
+                stepper.forward(0, 1)
+                self.assertEqual(self.pins(), table[index % len(table)])
+
+    def test_backward_table_reverses_the_wires(self):
+        stepper = self.stepper
+        stepper.setMode("double")
+        self.assertEqual(stepper.forwardPhases, tuple(Stepper.phaseMask(row) for row in Stepper.double_mode))
+        self.assertEqual(stepper.backwardPhases, tuple(Stepper.phaseMask(row[::-1]) for row in Stepper.double_mode))
+        self.assertEqual(sorted(stepper.backwardPhases), sorted(stepper.forwardPhases))
+
+    def test_cross_coil_table_is_reported_once_per_compile(self):
+        sink = events.addSink(MemorySink())
+        try:
+            self.stepper.mode = [[1, 1, 0, 0], [0, 0, 1, 1]]
+            self.stepper.compileMode()
+            self.stepper.forward(0, 10)
+        finally:
+            events.removeSink(sink)
+        self.assertEqual(sink.names(), ["stepper.cross_coil"])
+
+    def test_first_move_starts_at_first_phase(self):
+        self.stepper.forward(0, 1)
+        self.assertEqual(self.stepper.coilState, self.stepper.forwardPhases[0])
+        self.assertEqual(self.stepper.phase, 0)
+
+    def test_moves_carry_on_from_last_phase(self):
+        stepper = self.stepper
+        stepper.forward(0, 1)
+        for mode in ("single", "double", "half"):
+            stepper.setMode(mode)
+            phases = stepper.forwardPhases
+            for steps in (1, 3, 5):
+                expected = phases[(stepper.phase + steps) % len(phases)]
+                stepper.forward(0, steps)
+                self.assertEqual(stepper.coilState, expected)
+                self.assertEqual(Stepper.phaseMask(self.sim.pins[pin] for pin in stepper.coils), expected)
+            expected = phases[(stepper.phase - 2) % len(phases)]
+            stepper.backward(0, 2)
+            self.assertEqual(stepper.coilState, expected)
+
+    def test_position_across_modes(self):
+        stepper = self.stepper
+        stepper.forward(0, 10)
+        self.assertEqual(stepper.position, 10)
+        stepper.setMode("half")
+        self.assertEqual(stepper.position, 20)
+        stepper.backward(0, 5)
+        self.assertEqual(stepper.position, 15)
+        stepper.setMode("micro", 8)
+        self.assertEqual(stepper.position, 60)
+        stepper.forward(0, 4)
+        self.assertEqual(stepper.position, 64)
+        stepper.setMode("double")
+        self.assertEqual(stepper.position, 8)
+        stepper.move_to(-3, 0)
+        self.assertEqual(stepper.position, -3)
+        stepper.position = 0
+        self.assertEqual(stepper.halfSteps, 0)
+
+    def test_move_to_and_reset(self):
+        stepper = self.stepper
+        self.assertIsNone(stepper.move_to(0, 0))
+        stepper.move_to(25, 0)
+        stepper.move_to(-4, 0)
+        self.assertEqual(stepper.position, -4)
+        stepper.position = 100
+        stepper.move_to(98, 0)
+        self.assertEqual(stepper.position, 98)
+
+    def test_mode_change_keeps_electrical_angle(self):
+        stepper = self.stepper
+        stepper.setMode("half")
+        stepper.forward(0, 3)
+        angle = stepper.phaseAngle(stepper.phase)
+        stepper.setMode("micro", 16)
+        self.assertEqual(stepper.phaseAngle(stepper.phase), angle)
+        stepper.setMode("half")
+        self.assertEqual(stepper.phaseAngle(stepper.phase), angle)
+
+    def test_micro_table_is_shared_and_matches_half_mode(self):
+        for resolution in (4, 8, 16):
+            table = Stepper.microTable(resolution)
+            self.assertIs(table, Stepper.microTable(resolution))
+            self.assertEqual(len(table), 4 * resolution)
+            half = [Stepper.phaseMask(row) for row in Stepper.half_mode]
+            for index, mask in enumerate(half):
+                self.assertEqual(table[index * resolution // 2][0], mask)
+            for mask, a, b in table:
+                self.assertAlmostEqual(a * a + b * b, 10000.0, delta=0.1)
+
+    def test_micro_steps_drive_enable_duty_cycles(self):
+        stepper = self.stepper
+        stepper.setMode("micro", 8)
+        stepper.forward(0, 3)
+        mask, a, b = stepper.micro[stepper.phase]
+        self.assertEqual(stepper.coilState, mask)
+        self.assertEqual(self.sim.pwms[stepper.config["en1"]].dutyCycle, a)
+        self.assertEqual(self.sim.pwms[stepper.config["en2"]].dutyCycle, b)
+        stepper.setMode("single")
+        self.assertEqual(self.sim.pwms[stepper.config["en1"]].dutyCycle, 100)
+
+    def test_micro_mode_rejects_mask_streams(self):
+        self.stepper.setMode("micro", 4)
+        with self.assertRaises(ValueError):
+            self.stepper.compileWaveform(0, 10)
+        with self.assertRaises(ValueError):
+            self.stepper.setMode("micro", 5)
+
+
+class CoilWriteTest(unittest.TestCase):
+    def setUp(self):
+        # Unshadowed, so every write the stepper makes is seen.
+        self.sim = backend.set_backend(backend.SimulatedBackend(), shadow=False)
+        self.stepper = PiMotor.Stepper("STEPPER1")
+        del self.sim.writes[:]
+
+    def test_transitions_hold_only_changed_pins(self):
+        coils = (1, 2, 3, 4)
+        transitions = Stepper.compileTransitions(coils)
+        self.assertIsNone(transitions[0b0101 << 4 | 0b0101])
+        self.assertEqual(transitions[0b0001 << 4 | 0b0011], ((2,), (1,)))
+        self.assertEqual(transitions[0b0011 << 4 | 0b0110], ((1, 3), (0, 1)))
+
+    def test_setstep_writes_changed_pins_once(self):
+        stepper = self.stepper
+        stepper.setStep(1, 0, 1, 0)
+        stepper.setStep(1, 0, 1, 0)
+        stepper.setStep(0, 1, 1, 0)
+        c1, c2, c3, c4 = stepper.coils
+        self.assertEqual([(pin, value) for _, pin, value in self.sim.writes], [(c1, 1), (c3, 1), (c1, 0), (c2, 1)])
+        self.assertEqual(len({stamp for stamp, _, _ in self.sim.writes[2:]}), 1)
+
+    def test_double_steps_write_two_pins(self):
+        self.stepper.setMode("double")
+        self.stepper.forward(0, 9)
+        # Two pins for the first phase from all off, then each step swaps the wires of one coil.
+        self.assertEqual(len(self.sim.writes), 2 + 8 * 2)
+
+
+class LinkedSteppersTest(unittest.TestCase):
+    def setUp(self):
+        self.sim = backend.set_backend(backend.SimulatedBackend())
+        self.stepper = PiMotor.Stepper("STEPPER1")
+        self.other = PiMotor.Stepper("STEPPER2")
+        self.linked = PiMotor.LinkedSteppers(self.stepper, self.other)
+
+    def test_linked_steppers_track_both_axes(self):
+        self.linked.move(0, 12, -5)
+        self.assertEqual(self.stepper.position, 12)
+        self.assertEqual(self.other.position, -5)
+
+    def test_per_axis_delay_is_kept_between_closest_steps(self):
+        for delay, steps in (([0.004, 0.001], (3, 4)), ([0.001, 0.004], (8, 3)), ([0.002, 0.003], (5, 0))):
+            del self.sim.backend.writes[:]
+            self.linked.move(delay, *steps)
+            for stepper, minimum, count in zip((self.stepper, self.other), delay, steps):
+                stamps = sorted({stamp for stamp, pin, _ in self.sim.backend.writes if pin in stepper.coils})
+                self.assertEqual(len(stamps), count)
+                gaps = [(b - a) / 1e9 for a, b in zip(stamps, stamps[1:])]
+                # Allow for scheduling: a late step followed by one on time comes in short.
+                self.assertGreater(sum(gaps) / len(gaps) if gaps else minimum, minimum * 0.95)
+
+
+if __name__ == "__main__":
+    unittest.main()
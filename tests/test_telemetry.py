@@ -0,0 +1,81 @@
+"""
+Level gating and sinks of the telemetry hub.
+"""
+import threading
+import unittest
+
+import backend
+import PiMotor
+import telemetry
+from telemetry import BufferedSink, DEBUG, INFO, MemorySink, OFF, Telemetry, WARNING, events
+
+
+class TelemetryTest(unittest.TestCase):
+    def test_levels_are_gated_by_flags(self):
+        hub = Telemetry(WARNING)
+        self.assertFalse(hub.warning)
+        sink = hub.addSink(MemorySink())
+        self.assertEqual((hub.debug, hub.info, hub.warning), (False, False, True))
+        hub.setLevel(INFO)
+        self.assertEqual((hub.debug, hub.info, hub.warning), (False, True, True))
+        hub.emit(DEBUG, "hidden")
+        hub.emit(INFO, "shown", value=1)
+        self.assertEqual(list(sink.records)[0][2:], ("shown", {"value": 1}))
+        self.assertEqual(sink.names(), ["shown"])
+        hub.setLevel(OFF)
+        self.assertFalse(hub.warning)
+        hub.setLevel(INFO)
+        hub.removeSink(sink)
+        self.assertFalse(hub.info)
+
+    def test_sink_with_its_own_level(self):
+        hub = Telemetry(WARNING)
+        default = hub.addSink(MemorySink())
+        everything = hub.addSink(MemorySink(), DEBUG)
+        self.assertTrue(hub.debug)
+        hub.emit(DEBUG, "detail")
+        hub.emit(WARNING, "problem")
+        self.assertEqual(default.names(), ["problem"])
+        self.assertEqual(everything.names(), ["detail", "problem"])
+        hub.removeSink(everything)
+        self.assertFalse(hub.debug)
+
+    def test_library_calls_emit_nothing_by_default(self):
+        backend.set_backend(backend.SimulatedBackend(record=False))
+        sink = events.addSink(MemorySink())
+        try:
+            motor = PiMotor.Motor("MOTOR3", 1)
+            motor.forward(40)
+            self.assertEqual(sink.names(), [])
+            events.setLevel(INFO)
+            motor.forward(60)
+        finally:
+            events.setLevel(WARNING)
+            events.removeSink(sink)
+        self.assertIn(("motor.forward", {"pins": motor.pins, "speed": 60}),
+                      [record[2:] for record in sink.records])
+
+    def test_buffered_sink_delivers_from_its_own_thread(self):
+        threads = []
+        target = MemorySink()
+
+        def sink(*record):
+            threads.append(threading.current_thread())
+            target(*record)
+
+        buffered = BufferedSink(sink)
+        hub = Telemetry(INFO, [buffered])
+        for n in range(10):
+            hub.emit(INFO, "tick", n=n)
+        self.assertTrue(buffered.flush(1.0))
+        buffered.close()
+        self.assertEqual([record[3]["n"] for record in target.records], list(range(10)))
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_render(self):
+        self.assertEqual(telemetry.render(0, INFO, "motor.stop", {"pins": 3}), "INFO motor.stop pins=3")
+        self.assertEqual(telemetry.render(0, WARNING, "server.start", {}), "WARNING server.start")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Deadline scheduling of timing.StepClock and the StepStats of a move.
+"""
+import time
+import unittest
+
+import backend
+import PiMotor
+from timing import StepClock, StepStats
+
+
+class StepClockTest(unittest.TestCase):
+    def test_lateness_within_a_step_is_made_up(self):
+        clock = StepClock()
+        clock.start()
+        for _ in range(5):
+            clock.wait(0.02)
+            time.sleep(0.005)
+        self.assertEqual(clock.resets, 0)
+        self.assertAlmostEqual(clock.planned, 0.1, places=6)
+        self.assertLess(clock.drift, 0.01)
+
+    def test_stall_restarts_schedule_instead_of_bursting(self):
+        clock = StepClock()
+        clock.start()
+        clock.wait(0.002)
+        resets = clock.resets
+        time.sleep(0.02)
+        clock.wait(0.002)
+        self.assertEqual(clock.resets, resets + 1)
+        start = time.perf_counter()
+        clock.wait(0.002)
+        clock.wait(0.002)
+        self.assertGreater(time.perf_counter() - start, 0.0035)
+
+    def test_start_clears_resets(self):
+        clock = StepClock()
+        clock.start()
+        time.sleep(0.005)
+        clock.wait(0.001)
+        self.assertEqual(clock.resets, 1)
+        clock.start()
+        self.assertEqual(clock.resets, 0)
+
+
+
+class StepStatsTest(unittest.TestCase):
+    def test_summary_of_known_lateness(self):
+        lates = [500, 1500, 1500, 8000, 60000000] + [0] * 95
+        stats = StepStats(lates, 0.1, 0.2, resets=1)
+        self.assertEqual(stats.steps, 100)
+        self.assertEqual(stats.rate, 500.0)
+        self.assertAlmostEqual(stats.mean, sum(lates) / 100 / 1e9)
+        self.assertEqual(stats.p99, 60000000 / 1e9)
+        self.assertEqual(stats.max, 0.06)
+        self.assertEqual(stats.drift, 0.0)
+        # Buckets: <1us, 1-2us, 2-5us, 5-10us, ..., above 5000us.
+        self.assertEqual(stats.histogram[:4], [96, 2, 0, 1])
+        self.assertEqual(stats.histogram[-1], 1)
+        self.assertEqual(sum(stats.histogram), 100)
+        self.assertEqual(stats.summary()["resets"], 1)
+
+    def test_empty_move(self):
+        stats = StepStats([], 0.0, 0.0)
+        self.assertEqual((stats.steps, stats.rate, stats.p99), (0, 0.0, 0.0))
+
+    def test_stepper_reports_stats_per_move(self):
+        backend.set_backend(backend.SimulatedBackend(record=False))
+        stepper = PiMotor.Stepper("STEPPER1")
+        self.assertIsNone(stepper.forward(0.0005, 10))
+        stepper.collectTiming(capacity=4)
+        stats = stepper.forward(0.0005, 20)
+        self.assertIs(stepper.stats, stats)
+        # The first step is not waited for, and the array grows to fit the move.
+        self.assertEqual(stats.steps, 19)
+        self.assertEqual(stats.resets, stepper.clock.resets)
+        self.assertGreater(stats.rate, 0)
+        stepper.collectTiming(0)
+        self.assertIsNone(stepper.backward(0.0005, 5))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Waveform compilation and playback on the simulated backend.
+"""
+import time
+import unittest
+
+import backend
+import PiMotor
+from waveform import MAX_DELAY_US, Waveform
+
+
+class WaveformTest(unittest.TestCase):
+    def test_words_pack_mask_and_delay(self):
+        buffer = Waveform(4)
+        buffer.append(0b0101, 0.0015)
+        buffer.append(0b0011, 0)
+        self.assertEqual(list(buffer.steps()), [(0b0101, 1500), (0b0011, 0)])
+        self.assertAlmostEqual(buffer.duration, 0.0015)
+        with self.assertRaises(ValueError):
+            buffer.append(1, (MAX_DELAY_US + 1) / 1e6)
+
+
+class PlayWaveformTest(unittest.TestCase):
+    def setUp(self):
+        self.sim = backend.set_backend(backend.SimulatedBackend())
+        self.stepper = PiMotor.Stepper("STEPPER1")
+
+    def coilWrites(self):
+        return [(pin, value) for _, pin, value in self.sim.writes if pin in self.stepper.coils]
+
+    def test_long_moves_are_chained(self):
+        chain = self.stepper.compileWaveform(0.001, 10, capacity=4)
+        self.assertEqual([len(buffer) for buffer in chain], [4, 4, 2])
+        self.assertEqual(len(chain), 10)
+        self.assertEqual(chain.displacement, 10)
+        self.assertAlmostEqual(chain.duration, 0.009)
+        self.assertEqual(self.stepper.compileWaveform(0, 3, "backward").displacement, -3)
+
+    def test_plays_the_same_writes_as_forward(self):
+        other = PiMotor.Stepper("STEPPER2")
+        self.stepper.forward(0, 1)
+        other.forward(0, 1)
+        self.sim.backend.clear()
+        self.stepper.forward(0, 9)
+        expected = self.coilWrites()
+        self.sim.backend.clear()
+        self.stepper.backward(0, 9)
+        self.sim.backend.clear()
+        self.stepper.playWaveform(self.stepper.compileWaveform(0, 9))
+        self.assertEqual(self.coilWrites(), expected)
+
+    def test_simulator_stamps_writes_on_a_virtual_clock(self):
+        self.sim.backend.clear()
+        self.stepper.playWaveform(self.stepper.compileWaveform(0.002, 5))
+        stamps = sorted({stamp for stamp, pin, _ in self.sim.writes if pin in self.stepper.coils})
+        self.assertEqual([b - a for a, b in zip(stamps, stamps[1:])], [2000000] * 4)
+
+    def test_waveform_keeps_phase_and_position(self):
+        stepper = self.stepper
+        stepper.setMode("half")
+        stepper.forward(0, 3)
+        expected = stepper.forwardPhases[(stepper.phase + 10) % 8]
+        stepper.playWaveform(stepper.compileWaveform(0, 10))
+        self.assertEqual(stepper.coilState, expected)
+        self.assertEqual(stepper.position, 13)
+
+    def test_realtime_playback_takes_the_waveforms_time(self):
+        sim = backend.set_backend(backend.SimulatedBackend(realtime=True))
+        stepper = PiMotor.Stepper("STEPPER2")
+        start = time.perf_counter()
+        stepper.playWaveform(stepper.compileWaveform(0.005, 5))
+        self.assertGreaterEqual(time.perf_counter() - start, 0.019)
+        self.assertEqual(stepper.position, 5)
+        self.assertEqual(sim.backend.waveforms, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+"""
+Step timing for the PiMotor library.
+
+time.sleep(delay) between steps lets sleep overshoot and the time spent writing the coils
+accumulate, so long moves run slower than their delay profile says.  StepClock schedules
+every step against an absolute perf_counter_ns deadline instead: it sleeps for the bulk of
+the wait and busy-waits the final stretch, and a late step is made up by the following ones
+rather than pushing the rest of the move back.  Catching up is limited: a step that fires more
+than its whole delay late (the process was descheduled, or a callback stalled) restarts the
+schedule from now, so the missed steps are not fired back to back.  Such resets are counted.
+
+example:
+    clock = StepClock(spin=0.0002)
+    clock.start()
+    for index in range(200):
+        clock.wait(0.001)
+        ... energize the next phase ...
+    print(clock.drift)
+
+With collect() switched on the clock also stores how late every step fired in a preallocated
+array, costing one array store per step, and stats() summarizes the last move as StepStats.
+"""
+import time
+from array import array
+
+perf_counter_ns = time.perf_counter_ns
+
+
+class StepClock:
+    """ Deadline based step timer.
+
+    Arguments:
+    spin = float seconds before each deadline that are spent busy-waiting instead of sleeping.
+           Larger values trade CPU time for accuracy, 0 disables spinning entirely.
+
+    Attributes (valid after a move):
+    drift = float seconds the last step fired after its planned time.  As deadlines are absolute
+            this is the cumulative drift of the whole move.
+    maxLate = float seconds, worst lateness of any single step.
+    planned = float seconds the move was scheduled to take.
+    elapsed = float seconds the move actually took.
+    lates = array of per step lateness in ns while collecting, else None.
+    count = int, number of waits since start.
+    resets = int, number of times the schedule was restarted because a step fired more than its
+             delay late.  drift, planned and elapsed are measured from the last restart.
+    """
+    def __init__(self, spin=0.0002):
+        self.lates = None
+        self.count = 0
+        self.resets = 0
+        self.spin = spin
+        self.origin = 0
+        self.deadline = 0
+        self.drift = 0.0
+        self.maxLate = 0.0
+        self.planned = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def spin(self):
+        return self.spinNs / 1e9
+
+    @spin.setter
+    def spin(self, seconds):
+        self.spinNs = int(seconds * 1e9)
+
+    def collect(self, capacity=4096):
+        """ Records the lateness of every step from the next move on.
+
+        Arguments:
+        capacity = int, steps the array is preallocated for, 0 stops collecting.  start() grows
+                   it for longer moves when given their step count, otherwise steps beyond the
+                   capacity are counted but not stored.
+        """
+        self.lates = array("q", bytes(8 * capacity)) if capacity else None
+
+    def start(self, steps=0):
+        """ Starts a new schedule, the first deadline is measured from now.
+
+        Arguments:
+        steps = optional int, number of steps about to be taken, used to size the collection array.
+        """
+        if self.lates is not None and steps > len(self.lates):
+            self.lates = array("q", bytes(8 * steps))
+        self.count = 0
+        self.resets = 0
+        self.origin = self.deadline = perf_counter_ns()
+        self.drift = 0.0
+        self.maxLate = 0.0
+        self.planned = 0.0
+        self.elapsed = 0.0
+
+    def wait(self, delay):
+        """ Advances the deadline by delay seconds and blocks until it has been reached.
+
+        Arguments:
+        delay = float seconds since the previous deadline.
+        """
+        step = int(delay * 1e9)
+        deadline = self.deadline = self.deadline + step
+        remaining = deadline - perf_counter_ns()
+        if remaining > self.spinNs:
+            time.sleep((remaining - self.spinNs) / 1e9)
+        now = perf_counter_ns()
+        while now < deadline:
+            now = perf_counter_ns()
+        lates = self.lates
+        if lates is not None:
+            count = self.count
+            if count < len(lates):
+                lates[count] = now - deadline
+            self.count = count + 1
+        late = (now - deadline) / 1e9
+        if late > self.maxLate:
+            self.maxLate = late
+        self.drift = late
+        self.planned = (deadline - self.origin) / 1e9
+        self.elapsed = (now - self.origin) / 1e9
+        if step and now - deadline > step:
+            # Fell behind by more than a step: restart the schedule instead of bursting.
+            self.origin = self.deadline = now
+            self.resets += 1
+
+    def stats(self):
+        """ Returns the StepStats of the move since start(), or None when not collecting. """
+        if self.lates is None:
+            return None
+        return StepStats(self.lates[:min(self.count, len(self.lates))], self.planned, self.elapsed, self.resets)
+
+
+class StepStats:
+    """ Timing summary of one move, see StepClock.collect.
+
+    Attributes:
+    steps = int, number of timed steps (the first step of a move is not waited for).
+    rate = float steps per second actually achieved.
+    planned, elapsed = float seconds the move was scheduled to take and took.
+    drift = float seconds the last step was late, the total drift of the move.
+    mean, p99, max = float seconds of per step lateness (jitter).
+    resets = int, times the schedule was restarted after a step fell more than its delay behind.
+    histogram = list of step counts per bucket, bucket n holding lateness from edges[n - 1]
+                (0 for the first) up to edges[n] microseconds, the last bucket everything above.
+    """
+    edges = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, lates, planned, elapsed, resets=0):
+        ordered = sorted(lates)
+        count = len(ordered)
+        self.steps = count
+        self.planned = planned
+        self.elapsed = elapsed
+        self.resets = resets
+        self.rate = count / elapsed if elapsed > 0 else 0.0
+        self.drift = lates[-1] / 1e9 if count else 0.0
+        self.mean = sum(ordered) / count / 1e9 if count else 0.0
+        self.p99 = ordered[min(count - 1, int(count * 0.99))] / 1e9 if count else 0.0
+        self.max = ordered[-1] / 1e9 if count else 0.0
+        self.histogram = [0] * (len(self.edges) + 1)
+        bucket = 0
+        for late in ordered:
+            while bucket < len(self.edges) and late >= self.edges[bucket] * 1000:
+                bucket += 1
+            self.histogram[bucket] += 1
+
+    def summary(self):
+        """ Returns the statistics as a dict, e.g. for telemetry or JSON. """
+        return {"steps": self.steps, "rate": self.rate, "planned": self.planned,
+                "elapsed": self.elapsed, "drift": self.drift, "mean": self.mean,
+                "p99": self.p99, "max": self.max, "resets": self.resets,
+                "histogram": self.histogram}
+
+    def __repr__(self):
+        return ("StepStats(steps=%d, rate=%.1f/s, mean=%.1fus, p99=%.1fus, max=%.1fus, drift=%.1fus, resets=%d)"
+                % (self.steps, self.rate, self.mean * 1e6, self.p99 * 1e6, self.max * 1e6, self.drift * 1e6,
+                   self.resets))
@@ -1,15 +1,11 @@
-import RPi.GPIO as GPIO
 import time
 
 import PiMotor
+from filters import FilterPipeline
 
-GPIO.setwarnings(False)
-
-TRIG = 29
-ECHO = 31
-
-GPIO.setup(TRIG,GPIO.OUT)
-GPIO.setup(ECHO,GPIO.IN)
+sonic = PiMotor.Sensor("ULTRASONIC", 20)
+sonic.setFilter(FilterPipeline(window=5))
+sonic.startRanging(rate=10)
 
 m1 = PiMotor.Motor("MOTOR1",1)
 m2 = PiMotor.Motor("MOTOR2",1)
@@ -66,30 +62,10 @@ def right():
 stop()
 count=0
 while True:
- i=0
- avgDistance=0
- for i in range(5):
-    GPIO.output(TRIG, False)
-    time.sleep(0.1)
-
-    GPIO.output(TRIG, True)
-    time.sleep(0.00001)
-    GPIO.output(TRIG, False)
-    while GPIO.input(ECHO)==0:
-        pulse_start = time.time()
-
-    while GPIO.input(ECHO)==1:
-        pulse_end = time.time()
-        pulse_duration = pulse_end - pulse_start
-
-        distance = (pulse_duration * 34300)/2
-        distance = round(distance,2)
-        avgDistance=avgDistance+distance
-
-        avgDistance=avgDistance/5
-        print(avgDistance)
+    sonic.trigger()
+    print(sonic.filtered)
 
-    if avgDistance < 20:
+    if sonic.Triggered:
         count=count+1
         stop()
         time.sleep(1)
@@ -100,3 +76,5 @@ while True:
 
         else:
             forward()
+    else:
+        time.sleep(0.1)
@@ -0,0 +1,124 @@
+"""
+Waveform compilation of whole stepper moves.
+
+Even with a tight loop, Stepper.forward schedules every step from Python.  A waveform is a
+whole move compiled up front into compact binary buffers: one 32 bit word per step holding
+the coil bitmask in the low 4 bits and the delay before the step in microseconds in the
+remaining 28 bits.  A backend plays the buffers back in one call, a DMA style engine can
+clock them out without Python in the loop, the simulator replays them instantly against a
+virtual clock, and the base backend falls back to a deadline-timed software loop.
+
+Moves longer than one buffer are split into a WaveformChain of buffers played back to back.
+
+example:
+    chain = motor.compileWaveform(ez.quad(4000), 4000)
+    motor.playWaveform(chain)
+"""
+from array import array
+
+# Largest delay a single word can hold, 2^28 - 1 microseconds (about 268 seconds).
+MAX_DELAY_US = (1 << 28) - 1
+
+
+class Waveform:
+    """ One buffer of packed (mask, delay) words.
+
+    Arguments:
+    capacity = int, maximum number of steps the buffer holds.
+    """
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.words = array("I")
+
+    def __len__(self):
+        return len(self.words)
+
+    def full(self):
+        return len(self.words) >= self.capacity
+
+    def append(self, mask, delay):
+        """ Adds a step.
+
+        Arguments:
+        mask = int coil bitmask, bit 0 being wire c1.
+        delay = float seconds since the previous step.
+        """
+        micros = int(delay * 1e6 + 0.5)
+        if micros > MAX_DELAY_US:
+            raise ValueError("delay of %.3f s does not fit in a waveform word" % delay)
+        self.words.append(micros << 4 | mask)
+
+    def steps(self):
+        """ Yields the (mask, delay_us) pairs of the buffer. """
+        for word in self.words:
+            yield word & 0xF, word >> 4
+
+    @property
+    def duration(self):
+        """ Total of the step delays in seconds. """
+        return sum(word >> 4 for word in self.words) / 1e6
+
+    def tobytes(self):
+        return self.words.tobytes()
+
+
+class WaveformChain:
+    """ Sequence of Waveform buffers making up one move.
+
+    Attributes:
+    buffers = list of Waveform.
+    displacement = int signed number of steps the chain moves the stepper, set by
+                   Stepper.compileWaveform so playWaveform can keep the position up to date.
+    """
+    def __init__(self, buffers=None):
+        self.buffers = list(buffers or [])
+        self.displacement = 0
+
+    def __iter__(self):
+        return iter(self.buffers)
+
+    def __len__(self):
+        return sum(len(buffer) for buffer in self.buffers)
+
+    @property
+    def duration(self):
+        return sum(buffer.duration for buffer in self.buffers)
+
+    def extend(self, chain):
+        """ Appends the buffers of another chain, e.g. the next move. """
+        self.buffers.extend(chain.buffers)
+        self.displacement += chain.displacement
+        return self
+
+
+def compileMove(phases, delay, steps, capacity=4096):
+    """ Compiles a move into a WaveformChain.
+
+    Arguments:
+    phases = compiled phase array of a Stepper, i.e. motor.forwardPhases.
+    delay = float, callable(index, steps) or a profile with a delays table (easy.DelayProfile),
+            exactly as accepted by Stepper.forward.
+    steps = int number of steps.
+    capacity = int steps per buffer.
+    """
+    table = getattr(delay, "delays", None)
+    if table is not None and len(table) < steps:
+        table = None
+    timed = callable(delay)
+    count = len(phases)
+    chain = WaveformChain()
+    buffer = None
+    for index in range(steps):
+        if buffer is None or buffer.full():
+            buffer = Waveform(capacity)
+            chain.buffers.append(buffer)
+        if index == 0:
+            wait = 0.0
+        elif table is not None:
+            wait = table[index]
+        elif timed:
+            wait = delay(index, steps)
+        else:
+            wait = delay
+        buffer.append(phases[index % count], wait)
+    return chain